@@ -0,0 +1,137 @@
+# anomaly_detection.py - Detección de anomalías en la ingesta (estado O(1) por métrica)
+#
+# Por ubicación y contaminante se guarda: número de lecturas, media y
+# varianza EWMA, último valor y largo de las rachas de valores repetidos y
+# de nulos. Con eso cada lectura nueva se evalúa al escribirla:
+#
+# - spike: |x - media| supera ANOMALY_Z_THRESHOLD desviaciones (y al menos
+#   ANOMALY_MIN_DEVIATION unidades) tras ANOMALY_WARMUP lecturas
+# - invalid: valor negativo
+# - flatline: el mismo valor ANOMALY_FLATLINE_RUN lecturas seguidas
+# - null_run: sin valor ANOMALY_NULL_RUN lecturas seguidas
+#
+# flatline y null_run se registran una vez por racha (al alcanzar el largo),
+# no en cada lectura mientras la racha sigue.
+#
+# spike e invalid se ponen en cuarentena (el valor no entra en
+# air_quality_data, queda en reading_anomalies) salvo ANOMALY_ACTION=flag;
+# flatline y null_run solo se registran. El estado se actualiza con el valor
+# recortado a media ± umbral, así un pico no infla la varianza y un cambio
+# de nivel sostenido se absorbe en pocas horas.
+from datetime import datetime, timezone
+import json
+import math
+import os
+
+ANOMALY_METRICS = ('pm2_5', 'pm10', 'o3', 'no2')
+ANOMALY_EWMA_ALPHA = float(os.environ.get('ANOMALY_EWMA_ALPHA', 0.1))
+ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', 6))
+ANOMALY_MIN_DEVIATION = float(os.environ.get('ANOMALY_MIN_DEVIATION', 10))
+ANOMALY_WARMUP = int(os.environ.get('ANOMALY_WARMUP', 24))
+ANOMALY_FLATLINE_RUN = int(os.environ.get('ANOMALY_FLATLINE_RUN', 6))
+ANOMALY_NULL_RUN = int(os.environ.get('ANOMALY_NULL_RUN', 6))
+ANOMALY_ACTION = os.environ.get('ANOMALY_ACTION', 'quarantine')
+
+# Tipos que se ponen en cuarentena (el resto solo se marca)
+QUARANTINE_KINDS = ('spike', 'invalid')
+
+# Posiciones del estado de cada métrica
+COUNT, MEAN, VAR, LAST, FLAT_RUN, NULL_RUN = range(6)
+
+
+def anomaly_detection_enabled():
+    return os.environ.get('ANOMALY_DETECTION', '1') != '0'
+
+
+def _to_epoch(timestamp):
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.timestamp()
+
+
+class LocationDetector:
+    """Estado del detector de una ubicación (serializable a JSON)"""
+
+    def __init__(self, last_epoch=None, metrics=None):
+        self.last_epoch = last_epoch
+        self.metrics = metrics or {m: [0, 0.0, 0.0, None, 0, 0] for m in ANOMALY_METRICS}
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        state = json.loads(text)
+        detector = cls(state['last_epoch'], state['metrics'])
+        for metric in ANOMALY_METRICS:
+            detector.metrics.setdefault(metric, [0, 0.0, 0.0, None, 0, 0])
+        return detector
+
+    def to_json(self):
+        return json.dumps({'last_epoch': self.last_epoch, 'metrics': self.metrics},
+                          separators=(',', ':'))
+
+    def check(self, timestamp, values):
+        """Evaluar una lectura nueva y aprender de ella.
+
+        Devuelve una lista de dicts (metric, kind, value, expected, score,
+        quarantined). Las lecturas más antiguas que la última evaluada no se
+        evalúan ni cambian el estado.
+        """
+        epoch = _to_epoch(timestamp)
+        if self.last_epoch is not None and epoch <= self.last_epoch:
+            return []
+        self.last_epoch = epoch
+
+        anomalies = []
+        for metric in ANOMALY_METRICS:
+            state = self.metrics[metric]
+            value = values.get(metric)
+
+            if value is None:
+                state[NULL_RUN] += 1
+                if state[NULL_RUN] == ANOMALY_NULL_RUN:
+                    anomalies.append(self._anomaly(metric, 'null_run', None, state, float(state[NULL_RUN])))
+                continue
+            state[NULL_RUN] = 0
+            value = float(value)
+
+            if value < 0:
+                anomalies.append(self._anomaly(metric, 'invalid', value, state, None))
+                continue
+
+            state[FLAT_RUN] = state[FLAT_RUN] + 1 if value == state[LAST] else 1
+            state[LAST] = value
+            if state[FLAT_RUN] == ANOMALY_FLATLINE_RUN:
+                anomalies.append(self._anomaly(metric, 'flatline', value, state, float(state[FLAT_RUN])))
+
+            learned = value
+            if state[COUNT] >= ANOMALY_WARMUP:
+                deviation = value - state[MEAN]
+                sd = math.sqrt(state[VAR])
+                bound = max(ANOMALY_Z_THRESHOLD * sd, ANOMALY_MIN_DEVIATION)
+                if abs(deviation) >= bound:
+                    score = deviation / sd if sd > 0 else None
+                    anomalies.append(self._anomaly(metric, 'spike', value, state, score))
+                    learned = state[MEAN] + math.copysign(bound, deviation)
+
+            if state[COUNT] == 0:
+                state[MEAN], state[VAR] = learned, 0.0
+            else:
+                delta = learned - state[MEAN]
+                state[MEAN] += ANOMALY_EWMA_ALPHA * delta
+                state[VAR] = (1 - ANOMALY_EWMA_ALPHA) * (state[VAR] + ANOMALY_EWMA_ALPHA * delta * delta)
+            state[COUNT] += 1
+        return anomalies
+
+    @staticmethod
+    def _anomaly(metric, kind, value, state, score):
+        return {
+            'metric': metric,
+            'kind': kind,
+            'value': value,
+            'expected': round(state[MEAN], 3) if state[COUNT] else None,
+            'score': round(score, 3) if score is not None else None,
+            'quarantined': kind in QUARANTINE_KINDS and ANOMALY_ACTION == 'quarantine',
+        }
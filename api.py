@@ -0,0 +1,1021 @@
+# api.py - API REST (Flask). Solo carga lo que necesita el servidor web:
+# las dependencias de exportación se importan al exportar por primera vez
+import time
+from datetime import date, datetime, timedelta, timezone
+import logging
+import os
+import sys
+from contextlib import ExitStack
+import tempfile
+import zipfile
+
+from logging_setup import configure_logging
+from profiling import profile_block, is_authorized, request_collection_profile, list_profiles
+from data_export import (
+    EXPORT_FORMATS, export_window, export_filename, open_export_batches,
+    iter_csv_export, iter_csv_gzip_export, write_excel_export, write_parquet_export,
+    build_location_export, write_summary_csv
+)
+from export_jobs import export_jobs
+
+configure_logging()
+
+from flask import Flask, jsonify, request, Response, stream_with_context, g, send_file, redirect
+from flask_cors import CORS
+from event_stream import broadcaster, format_sse, stream_subscriber_limit, STREAM_PORT, STREAM_URL
+from downsampling import downsample_rows, downsample_series, DOWNSAMPLE_METRICS
+from singleflight import coalesce, single_flight
+from metrics import observe_request, render_metrics
+from recent_cache import recent_readings
+from exceedances import WHO_24H_LIMITS, EXCEEDANCE_MIN_READINGS
+from heatmap import heatmap_json, heatmap_cache, parse_bbox, HEATMAP_DEFAULT_RESOLUTION, HEATMAP_MAX_AGE_HOURS
+import queue
+from database_setup import get_historical_data, get_monthly_statistics, get_hourly_aggregates, get_latest_readings, get_location_stats, get_export_summary, get_rolling_stats, get_anomaly_counts, get_anomalies, get_exceedance_counts, get_daily_exceedances, ensure_schema, BOGOTA_UTC_OFFSET_HOURS
+import calendar
+
+app = Flask(__name__)
+CORS(app)  # Permitir requests desde el frontend
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def _start_recent_cache():
+    # Precarga en segundo plano; se arranca aquí (y no al importar) para que
+    # cada worker de gunicorn tenga su propio hilo tras el fork
+    recent_readings.ensure_started()
+
+@app.before_request
+def _start_request_profile():
+    """Perfilar esta petición si trae ?_profile=1 y el perfilado está habilitado"""
+    if request.args.get('_profile') != '1':
+        return
+    token = request.headers.get('X-Profile-Token') or request.args.get('_profile_token')
+    if not is_authorized(token):
+        return
+    stack = ExitStack()
+    g.profile_result = stack.enter_context(profile_block(
+        f"{request.method}_{request.path}",
+        memory=request.args.get('_profile_memory') == '1'
+    ))
+    g.profile_stack = stack
+
+@app.teardown_request
+def _finish_request_profile(exc):
+    stack = g.pop('profile_stack', None)
+    if stack is not None:
+        stack.close()
+        result = g.pop('profile_result', {})
+        if result.get('busy'):
+            logging.info("Perfil omitido: ya hay otro perfil en curso")
+        else:
+            logging.info(f"Perfil guardado: {', '.join(result.get('files', []))}")
+
+@app.route('/api/admin/profiles', methods=['GET', 'POST'])
+def admin_profiles():
+    """GET: listar perfiles guardados. POST: perfilar la próxima recolección (?memory=1)"""
+    token = request.headers.get('X-Profile-Token') or request.args.get('_profile_token')
+    if not is_authorized(token):
+        return jsonify({'success': False, 'error': 'Perfilado deshabilitado o token inválido'}), 403
+    
+    if request.method == 'POST':
+        request_collection_profile(memory=request.args.get('memory') == '1')
+        return jsonify({'success': True, 'data': {'collection_profile_requested': True}})
+    
+    return jsonify({'success': True, 'data': list_profiles()})
+
+@app.after_request
+def _record_request_metrics(response):
+    """Latencia, tamaño y código de estado por ruta (plantilla de la ruta, no la URL)"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        size = None if response.is_streamed else response.calculate_content_length()
+        observe_request(route, request.method, response.status_code,
+                        time.perf_counter() - start, size)
+    return response
+
+@app.route('/api/health')
+def get_health():
+    """Chequeo de vida del proceso (no toca la base de datos)"""
+    return jsonify({'status': 'ok', 'pid': os.getpid()})
+
+@app.route('/api/metrics')
+def get_metrics():
+    """Métricas del proceso en formato de texto Prometheus"""
+    extra = []
+    coalescing = single_flight.stats()
+    for name, help_text in (('calls', 'Llamadas a funciones coalescidas'),
+                            ('executions', 'Ejecuciones reales de funciones coalescidas'),
+                            ('coalesced', 'Llamadas que esperaron una ejecución en curso')):
+        metric = f"singleflight_{name}_total"
+        extra.append(f"# HELP {metric} {help_text}")
+        extra.append(f"# TYPE {metric} counter")
+        for function, values in sorted(coalescing['functions'].items()):
+            extra.append(f'{metric}{{function="{function}"}} {values[name]}')
+    extra.append("# HELP stream_subscribers Suscriptores conectados a /api/stream")
+    extra.append("# TYPE stream_subscribers gauge")
+    extra.append(f"stream_subscribers {broadcaster.subscriber_count()}")
+    extra.append("# HELP recent_cache_locations Ubicaciones en la caché de lecturas recientes")
+    extra.append("# TYPE recent_cache_locations gauge")
+    extra.append(f"recent_cache_locations {recent_readings.location_count()}")
+    extra.append("# HELP heatmap_cache_requests_total Rejillas de /api/heatmap servidas desde la caché o calculadas")
+    extra.append("# TYPE heatmap_cache_requests_total counter")
+    extra.append(f'heatmap_cache_requests_total{{result="hit"}} {heatmap_cache.hits}')
+    extra.append(f'heatmap_cache_requests_total{{result="miss"}} {heatmap_cache.misses}')
+    
+    return Response(render_metrics(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/current')
+def get_current_data_all():
+    """Obtener los datos más recientes de todas las ubicaciones (una sola consulta)"""
+    try:
+        data = get_latest_readings()
+        return jsonify({'success': True, 'data': data, 'count': len(data)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/stream')
+def stream_readings():
+    """Stream SSE: un evento 'reading' por ubicación cuando llega una lectura nueva"""
+    heartbeat = int(os.environ.get('STREAM_HEARTBEAT_SECONDS', 25))
+    
+    if STREAM_URL or STREAM_PORT:
+        # stream_server.py atiende el stream sin ocupar un hilo por cliente;
+        # EventSource sigue la redirección
+        if STREAM_URL:
+            return redirect(STREAM_URL, code=307)
+        host = request.host.rsplit(':', 1)[0] if not request.host.endswith(']') else request.host
+        return redirect(f"{request.scheme}://{host}:{STREAM_PORT}/api/stream", code=307)
+    
+    # Cada conexión ocupa un hilo del worker: por encima del límite se
+    # rechaza en vez de dejar sin hilos al resto del API
+    q = broadcaster.subscribe()
+    if q is None:
+        return (jsonify({'success': False, 'error': 'Demasiadas conexiones de stream, reintenta más tarde'}),
+                503, {'Retry-After': '60'})
+    
+    def generate():
+        try:
+            # Indicar al navegador cuánto esperar antes de reconectar
+            yield "retry: 10000\n\n"
+            while True:
+                try:
+                    event = q.get(timeout=heartbeat)
+                    yield format_sse(event)
+                except queue.Empty:
+                    # Comentario SSE para mantener viva la conexión
+                    yield ": ping\n\n"
+        finally:
+            broadcaster.unsubscribe(q)
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+    # Si el cliente se va antes de empezar el stream, el finally no corre
+    response.call_on_close(lambda: broadcaster.unsubscribe(q))
+    return response
+
+@app.route('/api/current/<location_id>')
+def get_current_data(location_id):
+    """Obtener datos más recientes de una ubicación"""
+    try:
+        if recent_readings.ready():
+            latest = recent_readings.latest(location_id)
+            data = [latest] if latest else []
+        else:
+            data = get_historical_data(location_id=location_id, limit=1)
+        if data:
+            return jsonify({'success': True, 'data': data[0]})
+        else:
+            return jsonify({'success': False, 'error': 'No data found'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@coalesce
+def _compute_historical(location_id, days, limit, max_points=None, metrics=None, method='lttb'):
+    """Datos históricos (y reducción opcional); peticiones idénticas concurrentes comparten el cálculo"""
+    # Calcular fecha de inicio
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    
+    # Con max_points se reduce el rango completo: el límite de filas
+    # recortaría la serie a las más recientes antes de reducirla
+    data = get_historical_data(
+        location_id=location_id,
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat(),
+        limit=None if max_points else limit
+    )
+    
+    # Reducción opcional para gráficos (conserva la forma de la serie)
+    if max_points:
+        total = len(data)
+        data = downsample_rows(data, max_points, metrics=metrics, method=method)
+        return {'success': True, 'data': data, 'count': len(data), 'total_count': total}
+    
+    return {'success': True, 'data': data, 'count': len(data)}
+
+@app.route('/api/historical/<location_id>')
+def get_historical(location_id):
+    """Obtener datos históricos de una ubicación"""
+    try:
+        # Parámetros opcionales
+        days = request.args.get('days', 7, type=int)
+        limit = request.args.get('limit', 100, type=int)
+        max_points = request.args.get('max_points', type=int)
+        metrics = tuple(request.args.get('downsample_by', 'pm2_5,pm10').split(','))
+        method = request.args.get('downsample', 'lttb')
+        unknown = [m for m in metrics if m not in DOWNSAMPLE_METRICS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Métrica no soportada en downsample_by: {', '.join(unknown)}. "
+                         f"Opciones: {', '.join(DOWNSAMPLE_METRICS)}"
+            }), 400
+        
+        return jsonify(_compute_historical(location_id, days, limit, max_points, metrics, method))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/monthly-stats/<location_id>/<int:year>/<int:month>')
+def get_monthly_stats(location_id, year, month):
+    """Obtener estadísticas mensuales para boxplots"""
+    try:
+        stats = get_monthly_statistics(location_id, year, month)
+        if stats:
+            return jsonify({'success': True, 'data': stats})
+        else:
+            return jsonify({'success': False, 'error': 'No data for this month'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@coalesce
+def _compute_boxplot_data(location_id, year):
+    """Cuartiles mensuales de PM2.5 y PM10 (compartido entre peticiones concurrentes)"""
+    current_month = datetime.now().month
+    boxplot_data = []
+    
+    for month in range(1, current_month):
+        stats = get_monthly_statistics(location_id, year, month)
+        if stats and stats['count'] >= 10:  # Mínimo 10 datos por mes
+            month_name = calendar.month_name[month]
+            
+            # Calcular percentiles para boxplot (aproximación)
+            from database_setup import get_connection
+            conn = get_connection()
+            cursor = conn.cursor()
+
+            ##conn = sqlite3.connect('data/air_quality.db')
+            ##cursor = conn.cursor()
+            
+            # Obtener todos los valores del mes para calcular percentiles
+            try:
+                cursor.execute('''
+                SELECT pm2_5, pm10 FROM air_quality_data 
+                WHERE location_id = ? 
+                AND strftime('%Y', timestamp) = ? 
+                AND strftime('%m', timestamp) = ?
+                ORDER BY pm2_5
+                ''', (location_id, str(year), f"{month:02d}"))
+                
+                values = cursor.fetchall()
+            finally:
+                conn.close()
+            
+            if values:
+                pm25_values = [v[0] for v in values if v[0] is not None]
+                pm10_values = [v[1] for v in values if v[1] is not None]
+                
+                if pm25_values and pm10_values:
+                    pm25_values.sort()
+                    pm10_values.sort()
+                    
+                    n = len(pm25_values)
+                    pm25_stats = {
+                        'min': round(pm25_values[0], 2),
+                        'q1': round(pm25_values[int(n * 0.25)], 2),
+                        'median': round(pm25_values[int(n * 0.5)], 2),
+                        'q3': round(pm25_values[int(n * 0.75)], 2),
+                        'max': round(pm25_values[-1], 2)
+                    }
+                    
+                    n = len(pm10_values)
+                    pm10_stats = {
+                        'min': round(pm10_values[0], 2),
+                        'q1': round(pm10_values[int(n * 0.25)], 2),
+                        'median': round(pm10_values[int(n * 0.5)], 2),
+                        'q3': round(pm10_values[int(n * 0.75)], 2),
+                        'max': round(pm10_values[-1], 2)
+                    }
+                    
+                    boxplot_data.append({
+                        'month': month_name,
+                        'month_number': month,
+                        'pm25': pm25_stats,
+                        'pm10': pm10_stats,
+                        'data_count': stats['count']
+                    })
+    
+    return boxplot_data
+
+@app.route('/api/boxplot-data/<location_id>/<int:year>')
+def get_boxplot_data(location_id, year):
+    """Obtener datos para boxplots de todo el año"""
+    try:
+        boxplot_data = _compute_boxplot_data(location_id, year)
+        return jsonify({'success': True, 'data': boxplot_data})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/locations')
+def get_locations():
+    """Obtener todas las ubicaciones disponibles"""
+    try:
+        # Contadores mantenidos por la ingesta (tabla location_stats)
+        locations = []
+        for row in get_location_stats():
+            if not row['data_count']:
+                continue
+            locations.append({
+                'id': row['location_id'],
+                'name': row['location_name'],
+                'latitude': row['latitude'],
+                'longitude': row['longitude'],
+                'data_count': row['data_count'],
+                'last_update': row['last_timestamp']
+            })
+        
+        return jsonify({'success': True, 'data': locations})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/status')
+def get_status():
+    """Obtener estado general del sistema"""
+    try:
+        stats = get_location_stats()
+        
+        # Contar total de registros
+        total_records = sum(row['data_count'] or 0 for row in stats)
+        
+        # Última actualización
+        last_updates = [row['last_timestamp'] for row in stats if row['last_timestamp']]
+        last_update = max(last_updates) if last_updates else None
+        
+        # Registros por ubicación
+        location_counts = {row['location_id']: row['data_count'] for row in stats}
+        
+        # Resultado de la última recolección por ubicación
+        last_collection = {
+            row['location_id']: {
+                'at': row['last_collection_at'],
+                'success': bool(row['last_collection_success']) if row['last_collection_success'] is not None else None,
+                'error': row['last_collection_error']
+            }
+            for row in stats if row['last_collection_at']
+        }
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'total_records': total_records,
+                'last_update': last_update,
+                'location_counts': location_counts,
+                'last_collection': last_collection,
+                'request_coalescing': single_flight.stats(),
+                'database_status': 'active'
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+# NUEVO: endpoint para Tendencias y distribución
+@coalesce
+def _compute_trends(location_id, max_points=None, method='lttb'):
+    """Series 24h y distribución AQI 7d (compartido entre peticiones concurrentes)"""
+    if recent_readings.ready():
+        pm25_24h, pm10_24h, dist = recent_readings.trends(location_id)
+    else:
+        pm25_24h, pm10_24h, dist = _query_trends(location_id)
+
+    if max_points:
+        pm25_24h = downsample_series(pm25_24h, max_points, method=method)
+        pm10_24h = downsample_series(pm10_24h, max_points, method=method)
+
+    if len(pm25_24h) < 2 and len(pm10_24h) < 2 and sum(dist.values()) < 1:
+        return {'success': False, 'error': 'not_enough_data'}
+
+    return {
+        'success': True,
+        'pm25_24h': pm25_24h,
+        'pm10_24h': pm10_24h,
+        'aqi_distribution_7d': dist
+    }
+
+def _query_trends(location_id):
+    """Lo mismo que recent_readings.trends, consultando la BD (mientras la caché no está lista)"""
+    from database_setup import get_connection
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    ##conn = sqlite3.connect('data/air_quality.db')
+    ##cursor = conn.cursor()
+
+    try:
+        # Serie 24h
+        cursor.execute(
+            """SELECT timestamp, pm2_5, pm10
+                 FROM air_quality_data
+                 WHERE location_id = ?
+                 AND timestamp >= datetime('now','-1 day')
+                 ORDER BY timestamp ASC""",
+            (location_id,)
+        )
+        rows_24h = cursor.fetchall()
+
+        # Distribución AQI 7 días
+        cursor.execute(
+            """SELECT aqi
+                 FROM air_quality_data
+                 WHERE location_id = ?
+                 AND timestamp >= datetime('now','-7 day')""",
+            (location_id,)
+        )
+        rows_7d = cursor.fetchall()
+    finally:
+        conn.close()
+
+    pm25_24h = [{'t': r[0], 'v': round(r[1],2)} for r in rows_24h if r[1] is not None]
+    pm10_24h = [{'t': r[0], 'v': round(r[2],2)} for r in rows_24h if r[2] is not None]
+
+    dist = {'1':0, '2':0, '3':0, '4':0, '5':0}
+    for (aqi,) in rows_7d:
+        if aqi is None: 
+            continue
+        key = str(int(aqi))
+        if key in dist:
+            dist[key] += 1
+
+    return pm25_24h, pm10_24h, dist
+
+@app.route('/api/trends/<location_id>')
+def get_trends(location_id):
+    """Devuelve:
+    - pm25_24h: serie de las últimas 24 h (timestamp, valor)
+    - pm10_24h: serie de las últimas 24 h (timestamp, valor)
+    - aqi_distribution_7d: conteo por categorías 1..5 en los últimos 7 días
+    """
+    try:
+        max_points = request.args.get('max_points', type=int)
+        method = request.args.get('downsample', 'lttb')
+        return jsonify(_compute_trends(location_id, max_points, method))
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+    
+@app.route('/api/heatmap')
+def get_heatmap():
+    """Superficie interpolada (IDW) de una métrica sobre las últimas lecturas.
+
+    Parámetros:
+    - metric: pm2_5 (por defecto), pm10, o3, no2 o aqi
+    - bbox: min_lon,min_lat,max_lon,max_lat (por defecto, los sitios con margen)
+    - resolution: celdas del lado mayor (por defecto 64)
+    - power: exponente de la distancia (por defecto 2)
+    - max_age_hours: descartar sitios sin lectura en estas horas antes de la más reciente
+
+    values[fila][columna]: la fila 0 es el borde norte y la columna 0 el oeste.
+    La rejilla se reutiliza hasta que llega una lectura nueva.
+    """
+    try:
+        bbox = parse_bbox(request.args['bbox']) if request.args.get('bbox') else None
+        if recent_readings.ready():
+            readings = recent_readings.latest_readings()
+        else:
+            readings = get_latest_readings()
+        body = heatmap_json(
+            readings,
+            metric=request.args.get('metric', 'pm2_5'),
+            bbox=bbox,
+            resolution=request.args.get('resolution', HEATMAP_DEFAULT_RESOLUTION, type=int),
+            power=request.args.get('power', 2.0, type=float),
+            max_age_hours=request.args.get('max_age_hours', HEATMAP_MAX_AGE_HOURS, type=float)
+        )
+        return Response(body, mimetype='application/json')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def _format_rolling_stats(row):
+    return {
+        'location_id': row['location_id'],
+        'window_end': row['window_end'],
+        'pm25': {
+            'mean_24h': row['pm25_mean_24h'],
+            'sum_24h': row['pm25_sum_24h'],
+            'count_24h': row['pm25_count_24h'],
+            'nowcast': row['pm25_nowcast']
+        },
+        'pm10': {
+            'mean_24h': row['pm10_mean_24h'],
+            'sum_24h': row['pm10_sum_24h'],
+            'count_24h': row['pm10_count_24h'],
+            'nowcast': row['pm10_nowcast']
+        },
+        'aqi_distribution_7d': {str(i): row[f'aqi_{i}_7d'] for i in range(1, 6)}
+    }
+
+@app.route('/api/rolling-stats')
+def get_rolling_stats_all():
+    """Promedios 24 h, NowCast y distribución AQI 7 d de todas las ubicaciones.
+
+    Se mantienen en la ingesta (tabla location_rolling_stats): una fila por
+    ubicación, sin recorrer el histórico. Las ventanas terminan en window_end
+    (la hora de la última lectura de cada ubicación).
+    """
+    try:
+        data = [_format_rolling_stats(row) for row in get_rolling_stats()]
+        return jsonify({'success': True, 'data': data, 'count': len(data)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/rolling-stats/<location_id>')
+def get_rolling_stats_location(location_id):
+    """Lo mismo que /api/rolling-stats para una ubicación"""
+    try:
+        rows = get_rolling_stats(location_id)
+        if not rows:
+            return jsonify({'success': False, 'error': 'No data found'})
+        return jsonify({'success': True, 'data': _format_rolling_stats(rows[0])})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/anomalies')
+def get_anomaly_summary():
+    """Conteo de anomalías detectadas en la ingesta por ubicación y tipo (últimos `days` días).
+
+    Tipos: spike e invalid (en cuarentena: el valor no está en los datos),
+    flatline y null_run (solo marcados).
+    """
+    try:
+        days = request.args.get('days', 7, type=int)
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(timespec='seconds')
+        
+        locations = {}
+        totals = {}
+        for row in get_anomaly_counts(since):
+            entry = locations.setdefault(row['location_id'], {
+                'location_id': row['location_id'], 'counts': {}, 'quarantined': 0, 'last_timestamp': None
+            })
+            entry['counts'][row['kind']] = row['count']
+            entry['quarantined'] += row['quarantined']
+            if entry['last_timestamp'] is None or str(row['last_timestamp']) > str(entry['last_timestamp']):
+                entry['last_timestamp'] = row['last_timestamp']
+            totals[row['kind']] = totals.get(row['kind'], 0) + row['count']
+        
+        return jsonify({'success': True, 'since': since, 'totals': totals, 'data': list(locations.values())})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/anomalies/<location_id>')
+def get_location_anomalies(location_id):
+    """Anomalías de una ubicación (más recientes primero)"""
+    try:
+        days = request.args.get('days', 7, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(timespec='seconds')
+        data = get_anomalies(location_id, since=since, limit=limit)
+        return jsonify({'success': True, 'data': data, 'count': len(data)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def _exceedance_range():
+    """(inicio, fin) de ?start=&end= (YYYY-MM-DD, días locales); por defecto, el mes en curso"""
+    today = datetime.now(timezone(timedelta(hours=BOGOTA_UTC_OFFSET_HOURS))).date()
+    start = request.args.get('start')
+    end = request.args.get('end')
+    try:
+        start = date.fromisoformat(start) if start else today.replace(day=1)
+        end = date.fromisoformat(end) if end else today
+    except ValueError:
+        raise ValueError('start y end deben tener formato YYYY-MM-DD')
+    if start > end:
+        raise ValueError('start debe ser anterior o igual a end')
+    return start, end
+
+@app.route('/api/exceedances')
+def get_exceedances():
+    """Días que superan las guías OMS de 24 h por ubicación y contaminante.
+
+    Parámetros: start, end (YYYY-MM-DD, hora Bogotá; por defecto el mes en
+    curso) y location_id opcional. Solo cuentan los días con al menos
+    min_readings lecturas (complete_days). Se responde desde acumulados
+    diarios/mensuales/anuales, sin recorrer las lecturas.
+    """
+    try:
+        start, end = _exceedance_range()
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        counts = get_exceedance_counts(start, end, request.args.get('location_id'))
+        data = [{'location_id': location_id, 'pollutants': pollutants}
+                for location_id, pollutants in sorted(counts.items())]
+        return jsonify({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'limits': WHO_24H_LIMITS,
+            'min_readings': EXCEEDANCE_MIN_READINGS,
+            'data': data
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/exceedances/<location_id>/daily')
+def get_exceedances_daily(location_id):
+    """Promedio 24 h y marca de superación de cada día (máximo 366 días por consulta)"""
+    try:
+        start, end = _exceedance_range()
+        if (end - start).days > 366:
+            raise ValueError('El rango diario no puede superar 366 días')
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        data = get_daily_exceedances(location_id, start.isoformat(), end.isoformat())
+        return jsonify({'success': True, 'limits': WHO_24H_LIMITS, 'data': data, 'count': len(data)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/aggregate/hourly')
+def get_hourly_aggregate():
+    """Promedio horario de TODOS los puntos para la vista de tendencias.
+
+    Devuelve:
+    - labels: 24 horas (Bogotá) empezando a las 05:00
+    - pm25, pm10, o3, no2: promedio entre ubicaciones por hora (None si no hay datos)
+    - aqi_distribution_7d: conteo por categorías 1..5 en los últimos `days` días
+    """
+    try:
+        days = request.args.get('days', 7, type=int)
+
+        # Ventana 05:00 de ayer → 04:59:59 de hoy (hora Bogotá)
+        bogota_tz = timezone(timedelta(hours=BOGOTA_UTC_OFFSET_HOURS))
+        now_local = datetime.now(bogota_tz)
+        end_local = now_local.replace(hour=4, minute=59, second=59, microsecond=0)
+        start_local = end_local - timedelta(days=1) + timedelta(seconds=1)
+
+        # Los timestamps se guardan como ISO UTC ('...+00:00')
+        start_utc = start_local.astimezone(timezone.utc)
+        end_utc = end_local.astimezone(timezone.utc)
+        aqi_start_utc = (datetime.now(timezone.utc) - timedelta(days=days))
+
+        result = get_hourly_aggregates(
+            start_date=start_utc.isoformat(timespec='seconds'),
+            end_date=end_utc.isoformat(timespec='seconds'),
+            aqi_start_date=aqi_start_utc.isoformat(timespec='seconds')
+        )
+
+        labels = []
+        series = {'pm25': [], 'pm10': [], 'o3': [], 'no2': []}
+        for i in range(24):
+            hour = (5 + i) % 24
+            labels.append(f"{hour:02d}:00")
+            bucket = result['hourly'].get(hour, {})
+            for key in series:
+                value = bucket.get(key)
+                series[key].append(round(value, 2) if value is not None else None)
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'labels': labels,
+                'pm25': series['pm25'],
+                'pm10': series['pm10'],
+                'o3': series['o3'],
+                'no2': series['no2'],
+                'aqi_distribution_7d': result['aqi_distribution'],
+                'location_count': result['location_count'],
+                'window_start': start_utc.isoformat(timespec='seconds'),
+                'window_end': end_utc.isoformat(timespec='seconds')
+            }
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+    # pilas que no se
+@app.route('/api/export/all')
+def export_all_data():
+    """Exportar todas las ubicaciones en un solo .zip (un archivo por ubicación)
+    
+    Los archivos se generan en paralelo en el pool de exportación; metadatos y
+    estadísticas salen de una sola consulta agrupada (resumen.csv en el zip).
+    """
+    try:
+        period = request.args.get('period', '24h')
+        export_format = request.args.get('format', 'xlsx')
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Formato no soportado. Opciones: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        
+        start_date, end_date = export_window(period)
+        summary = get_export_summary(start_date.isoformat(), end_date.isoformat())
+        if not summary:
+            return jsonify({'success': False, 'error': 'No hay datos disponibles para exportar'})
+        
+        with tempfile.TemporaryDirectory() as workdir:
+            futures = [
+                export_jobs.submit_task(
+                    build_location_export, location_id, period, export_format,
+                    start_date, end_date, workdir, info
+                )
+                for location_id, info in summary.items()
+            ]
+            
+            # Los formatos ya comprimidos se guardan tal cual en el zip
+            compression = zipfile.ZIP_DEFLATED if export_format == 'csv' else zipfile.ZIP_STORED
+            output = tempfile.TemporaryFile()
+            with zipfile.ZipFile(output, 'w', compression=compression) as archive:
+                archive.writestr(
+                    'resumen.csv',
+                    write_summary_csv(summary, period, start_date, end_date),
+                    compress_type=zipfile.ZIP_DEFLATED
+                )
+                for future in futures:
+                    location_id, path, rows = future.result()
+                    if path is None:
+                        continue
+                    extension = EXPORT_FORMATS[export_format][0]
+                    archive.write(path, export_filename(location_id, period, extension))
+                    os.remove(path)
+        
+        output.seek(0)
+        return send_file(
+            output,
+            mimetype='application/zip',
+            as_attachment=True,
+            download_name=export_filename('todas', period, 'zip')
+        )
+    
+    except Exception as e:
+        logging.error(f"Error al exportar todas las ubicaciones: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/export/<location_id>')
+def export_data(location_id):
+    """Exportar datos según el período solicitado
+    
+    format: xlsx (por defecto, con formato), csv, csv.gz o parquet
+    """
+    try:
+        period = request.args.get('period', '24h')
+        export_format = request.args.get('format', 'xlsx')
+        
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({
+                'success': False,
+                'error': f"Formato no soportado. Opciones: {', '.join(EXPORT_FORMATS)}"
+            }), 400
+        
+        extension, mimetype = EXPORT_FORMATS[export_format]
+        start_date, end_date = export_window(period)
+        
+        batches = open_export_batches(location_id, start_date, end_date)
+        if batches is None:
+            return jsonify({'success': False, 'error': 'No hay datos disponibles para exportar'})
+        
+        filename = export_filename(location_id, period, extension)
+        
+        # CSV: se envía directamente desde el cursor mientras se lee
+        if export_format in ('csv', 'csv.gz'):
+            generator = iter_csv_export(batches) if export_format == 'csv' else iter_csv_gzip_export(batches)
+            return Response(
+                generator,
+                mimetype=mimetype,
+                headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+            )
+        
+        # Excel y Parquet: el archivo se construye en disco (memoria constante)
+        output = tempfile.TemporaryFile()
+        if export_format == 'parquet':
+            write_parquet_export(output, batches)
+        else:
+            write_excel_export(output, location_id, period, start_date, end_date, batches=batches)
+        output.seek(0)
+        
+        return send_file(
+            output,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename
+        )
+        
+    except ImportError as e:
+        return jsonify({'success': False, 'error': f'Dependencia no instalada para este formato: {e}'}), 500
+    except Exception as e:
+        logging.error(f"Error al exportar datos: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _export_job_response(job):
+    """Estado público de un trabajo de exportación"""
+    data = {
+        'job_id': job['id'],
+        'status': job['status'],
+        'location_id': job['location_id'],
+        'period': job['period'],
+        'format': job['format'],
+        'created_at': job.get('created_at'),
+        'finished_at': job.get('finished_at'),
+        'rows': job.get('rows'),
+        'size': job.get('size'),
+        'error': job.get('error'),
+        'status_url': f"/api/export-jobs/{job['id']}"
+    }
+    if job['status'] == 'done':
+        data['download_url'] = f"/api/export-jobs/{job['id']}/download"
+    return data
+
+@app.route('/api/export-jobs', methods=['POST'])
+def create_export_job():
+    """Crear un trabajo de exportación en segundo plano (o reutilizar uno igual)"""
+    try:
+        params = request.get_json(silent=True) or request.values
+        location_id = params.get('location_id')
+        period = params.get('period', '24h')
+        export_format = params.get('format', 'xlsx')
+        
+        if not location_id:
+            return jsonify({'success': False, 'error': 'location_id es requerido'}), 400
+        
+        job = export_jobs.submit(location_id, period, export_format)
+        status_code = 200 if job['status'] == 'done' else 202
+        return jsonify({'success': True, 'data': _export_job_response(job)}), status_code
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error al crear exportación: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/export-jobs/<job_id>')
+def get_export_job(job_id):
+    """Consultar el estado de un trabajo de exportación"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    return jsonify({'success': True, 'data': _export_job_response(job)})
+
+@app.route('/api/export-jobs/<job_id>/download')
+def download_export_job(job_id):
+    """Descargar el archivo de un trabajo terminado"""
+    job = export_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Trabajo no encontrado'}), 404
+    if job['status'] != 'done':
+        return jsonify({'success': False, 'error': f"El trabajo está en estado '{job['status']}'"}), 409
+    
+    path = export_jobs.artifact(job)
+    if path is None:
+        return jsonify({'success': False, 'error': 'El archivo expiró, crea el trabajo de nuevo'}), 410
+    
+    extension, mimetype = EXPORT_FORMATS[job['format']]
+    return send_file(
+        os.path.abspath(path),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=export_filename(job['location_id'], job['period'], extension)
+    )
+
+    # pilas que no se
+
+##def run_api_server():
+    #"""Ejecutar el servidor API"""
+    ##app.run(host='127.0.0.1', port=5000, debug=False)
+
+def run_api_server():
+    """Ejecutar el servidor API"""
+    import os
+    ensure_schema()
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host='0.0.0.0', port=port, debug=False)
+
+
+def get_production_server_config():
+    """Configuración del servidor WSGI de producción (variables de entorno)"""
+    import multiprocessing
+    
+    default_workers = min(multiprocessing.cpu_count() * 2 + 1, 8)
+    threads = int(os.environ.get('API_THREADS', 4))
+    
+    return {
+        'port': int(os.environ.get('PORT', 5000)),
+        'workers': int(os.environ.get('WEB_CONCURRENCY', default_workers)),
+        'threads': threads,
+        'keepalive': int(os.environ.get('API_KEEPALIVE', 5)),
+        'timeout': int(os.environ.get('API_TIMEOUT', 120)),
+        'graceful_timeout': int(os.environ.get('API_GRACEFUL_TIMEOUT', 30)),
+        'max_requests': int(os.environ.get('API_MAX_REQUESTS', 1000)),
+        # Cada hilo del worker puede tener una conexión abierta
+        'db_pool_max': int(os.environ.get('DB_POOL_MAX', threads + 2))
+    }
+
+
+def run_production_server():
+    """Ejecutar el API con un servidor WSGI multi-proceso (gunicorn, o waitress en Windows)
+    
+    - WEB_CONCURRENCY / API_THREADS: procesos worker e hilos por worker
+    - API_KEEPALIVE: segundos que se mantiene abierta una conexión keep-alive
+    - DB_POOL_MAX: tamaño del pool de conexiones de cada worker
+    - STREAM_PORT / STREAM_URL: /api/stream redirige a stream_server.py, que
+      atiende todas las conexiones con asyncio (`scheduler.py stream`)
+    - STREAM_MAX_SUBSCRIBERS: sin STREAM_PORT, conexiones /api/stream por worker
+      (por defecto la mitad de API_THREADS; cada una ocupa un hilo mientras está abierta)
+    - Recarga elegante: `kill -HUP <pid del master>` reinicia los workers sin cortar peticiones
+    """
+    from database_setup import init_connection_pool, close_connection_pool
+    
+    # En el master, antes del fork: los workers ya encuentran el esquema completo
+    ensure_schema()
+    config = get_production_server_config()
+    
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    
+    if BaseApplication is None:
+        # waitress: un solo proceso con varios hilos (funciona en Windows)
+        from waitress import serve
+        
+        threads = config['workers'] * config['threads']
+        broadcaster.max_subscribers = stream_subscriber_limit(threads)
+        if os.getenv('DATABASE_URL'):
+            # DB_POOL_MAX manda; sin él, una conexión por hilo del único proceso
+            pool_max = config['db_pool_max'] if os.environ.get('DB_POOL_MAX') else threads + 2
+            init_connection_pool(1, pool_max)
+        logging.info(f"Servidor waitress en puerto {config['port']} con {threads} hilos")
+        serve(app, host='0.0.0.0', port=config['port'], threads=threads,
+              channel_timeout=config['timeout'])
+        return
+    
+    # Se hereda en cada worker tras el fork
+    broadcaster.max_subscribers = stream_subscriber_limit(config['threads'])
+    
+    def post_fork(server, worker):
+        # El pool se crea después del fork: ningún socket se comparte entre workers
+        if os.getenv('DATABASE_URL'):
+            init_connection_pool(1, config['db_pool_max'])
+    
+    def worker_exit(server, worker):
+        close_connection_pool()
+    
+    class ProductionApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                if key in self.cfg.settings and value is not None:
+                    self.cfg.set(key.lower(), value)
+        
+        def load(self):
+            return self.application
+    
+    options = {
+        'bind': f"0.0.0.0:{config['port']}",
+        'workers': config['workers'],
+        'threads': config['threads'],
+        'worker_class': 'gthread',
+        'keepalive': config['keepalive'],
+        'timeout': config['timeout'],
+        'graceful_timeout': config['graceful_timeout'],
+        'max_requests': config['max_requests'],
+        'max_requests_jitter': max(config['max_requests'] // 10, 1),
+        'accesslog': '-',
+        'post_fork': post_fork,
+        'worker_exit': worker_exit
+    }
+    
+    logging.info(
+        f"Servidor gunicorn en puerto {config['port']} - "
+        f"workers: {config['workers']}, hilos: {config['threads']}, keepalive: {config['keepalive']}s"
+    )
+    ProductionApplication(app, options).run()
+
+
+if __name__ == "__main__":
+    # python api.py [serve]: entrada directa sin pasar por scheduler.py
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        run_production_server()
+    else:
+        run_api_server()
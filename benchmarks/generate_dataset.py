@@ -0,0 +1,366 @@
+# benchmarks/generate_dataset.py - Datos sintéticos de calidad del aire a escala
+#
+# Genera varios años de datos horarios para N ubicaciones con ciclo diario
+# (picos de tráfico, ozono al mediodía), estacionalidad seca/lluviosa,
+# episodios de contaminación, ruido autocorrelacionado y huecos (caídas del
+# recolector de horas o días y horas sueltas faltantes).
+#
+# Uso:
+#   python benchmarks/generate_dataset.py --sqlite data/bench.db --locations 200 --years 3
+#   python benchmarks/generate_dataset.py --postgres postgresql://localhost/bench --locations 50
+#
+# Luego: DATABASE_URL=sqlite:///data/bench.db python benchmarks/load_test.py
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database_setup import BOGOTA_UTC_OFFSET_HOURS
+
+# Centro de las ubicaciones sintéticas (Aguachica, Cesar)
+CENTER_LAT = 8.31
+CENTER_LON = -73.62
+
+INSERT_COLUMNS = (
+    'location_id', 'location_name', 'latitude', 'longitude', 'timestamp',
+    'pm2_5', 'pm10', 'o3', 'no2', 'aqi',
+    'temperature', 'humidity', 'pressure', 'wind_speed', 'created_at'
+)
+
+# Esquema de Postgres (el de SQLite lo crea create_database)
+POSTGRES_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS air_quality_data (
+        id SERIAL PRIMARY KEY,
+        location_id TEXT NOT NULL,
+        location_name TEXT NOT NULL,
+        latitude REAL NOT NULL,
+        longitude REAL NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        pm2_5 REAL,
+        pm10 REAL,
+        o3 REAL,
+        no2 REAL,
+        aqi INTEGER,
+        temperature REAL,
+        humidity REAL,
+        pressure REAL,
+        wind_speed REAL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(location_id, timestamp)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_location_timestamp ON air_quality_data(location_id, timestamp)',
+    'CREATE INDEX IF NOT EXISTS idx_timestamp ON air_quality_data(timestamp)',
+    '''
+    CREATE TABLE IF NOT EXISTS location_stats (
+        location_id TEXT PRIMARY KEY,
+        location_name TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        data_count INTEGER NOT NULL DEFAULT 0,
+        first_timestamp TIMESTAMP,
+        last_timestamp TIMESTAMP,
+        last_collection_at TIMESTAMP,
+        last_collection_success INTEGER,
+        last_collection_error TEXT,
+        revision INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS location_rolling_stats (
+        location_id TEXT PRIMARY KEY,
+        window_end TIMESTAMP,
+        pm25_sum_24h REAL,
+        pm25_count_24h INTEGER,
+        pm25_mean_24h REAL,
+        pm10_sum_24h REAL,
+        pm10_count_24h INTEGER,
+        pm10_mean_24h REAL,
+        pm25_nowcast REAL,
+        pm10_nowcast REAL,
+        aqi_1_7d INTEGER,
+        aqi_2_7d INTEGER,
+        aqi_3_7d INTEGER,
+        aqi_4_7d INTEGER,
+        aqi_5_7d INTEGER,
+        state TEXT,
+        updated_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS anomaly_detector_state (
+        location_id TEXT PRIMARY KEY,
+        state TEXT,
+        updated_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS reading_anomalies (
+        id SERIAL PRIMARY KEY,
+        location_id TEXT NOT NULL,
+        timestamp TIMESTAMP NOT NULL,
+        metric TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        value REAL,
+        expected REAL,
+        score REAL,
+        quarantined INTEGER NOT NULL DEFAULT 0,
+        detected_at TIMESTAMP,
+        UNIQUE(location_id, timestamp, metric, kind)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp ON reading_anomalies(timestamp)',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_exceedances (
+        location_id TEXT NOT NULL,
+        day TEXT NOT NULL,
+        pm2_5_sum REAL NOT NULL DEFAULT 0,
+        pm2_5_count INTEGER NOT NULL DEFAULT 0,
+        pm2_5_exceeds INTEGER NOT NULL DEFAULT 0,
+        pm10_sum REAL NOT NULL DEFAULT 0,
+        pm10_count INTEGER NOT NULL DEFAULT 0,
+        pm10_exceeds INTEGER NOT NULL DEFAULT 0,
+        no2_sum REAL NOT NULL DEFAULT 0,
+        no2_count INTEGER NOT NULL DEFAULT 0,
+        no2_exceeds INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (location_id, day)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS exceedance_rollups (
+        location_id TEXT NOT NULL,
+        pollutant TEXT NOT NULL,
+        period TEXT NOT NULL,
+        period_key TEXT NOT NULL,
+        exceedance_days INTEGER NOT NULL DEFAULT 0,
+        complete_days INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (location_id, pollutant, period, period_key)
+    )
+    ''',
+)
+
+# Recalcular location_stats en una sola sentencia válida en ambos motores
+# ("WHERE true" evita la ambigüedad de INSERT ... SELECT ... ON CONFLICT en SQLite)
+REBUILD_STATS_SQL = '''
+INSERT INTO location_stats
+(location_id, location_name, latitude, longitude, data_count, first_timestamp, last_timestamp)
+SELECT location_id, MAX(location_name), MAX(latitude), MAX(longitude),
+       COUNT(*), MIN(timestamp), MAX(timestamp)
+FROM air_quality_data
+WHERE true
+GROUP BY location_id
+ON CONFLICT(location_id) DO UPDATE SET
+  location_name = excluded.location_name,
+  latitude = excluded.latitude,
+  longitude = excluded.longitude,
+  data_count = excluded.data_count,
+  first_timestamp = excluded.first_timestamp,
+  last_timestamp = excluded.last_timestamp
+'''
+
+
+def synthetic_locations(count, rng):
+    """Ubicaciones repartidas alrededor del centro, con su nivel base de PM2.5"""
+    locations = []
+    for i in range(count):
+        locations.append({
+            'id': f"sintetica_{i + 1:04d}",
+            'name': f"Sitio sintético {i + 1}",
+            'lat': round(CENTER_LAT + rng.normal(0, 0.05), 6),
+            'lon': round(CENTER_LON + rng.normal(0, 0.05), 6),
+            # Sitios con más tráfico o quemas tienen un nivel base mayor
+            'base_pm25': float(rng.lognormal(np.log(18), 0.35)),
+        })
+    return locations
+
+
+def _ar1_noise(rng, n, phi=0.9, sigma=0.25, memory=48):
+    """Ruido AR(1) aproximado con un kernel truncado (vectorizado)"""
+    kernel = phi ** np.arange(memory)
+    white = rng.normal(0, sigma * np.sqrt(1 - phi ** 2), n + memory)
+    return np.convolve(white, kernel, mode='full')[memory:memory + n]
+
+
+def _gap_mask(rng, n, years, outages_per_year, gap_rate):
+    """True donde hay dato: caídas de horas o días y horas sueltas faltantes"""
+    keep = rng.random(n) >= gap_rate
+    for _ in range(rng.poisson(outages_per_year * years)):
+        start = rng.integers(0, n)
+        length = int(min(rng.exponential(12) + 1, 24 * 14))
+        keep[start:start + length] = False
+    return keep
+
+
+def generate_location(location, start, hours, rng, outages_per_year=6, gap_rate=0.01):
+    """Series horarias de una ubicación; devuelve columnas (listas) sin los huecos"""
+    utc = np.datetime64(start.replace(tzinfo=None), 'h') + np.arange(hours)
+    local = utc + np.timedelta64(BOGOTA_UTC_OFFSET_HOURS, 'h')
+    hour = (local.astype(np.int64) % 24).astype(np.float64)
+    month = (local.astype('datetime64[M]').astype(np.int64) % 12) + 1
+    years = hours / (24 * 365)
+
+    # Picos de tráfico (7h y 19h) y mínimo de madrugada
+    traffic = (1
+               + 0.45 * np.exp(-((hour - 7) ** 2) / (2 * 1.5 ** 2))
+               + 0.35 * np.exp(-((hour - 19) ** 2) / (2 * 2.0 ** 2))
+               - 0.15 * np.exp(-((hour - 3) ** 2) / (2 * 2.0 ** 2)))
+    # Temporada seca (dic-mar) más contaminada; lluvias (abr-may, sep-nov) más limpias
+    season = 1 + 0.3 * np.cos(2 * np.pi * (month - 2) / 12)
+    # Episodios (quemas, incendios): multiplican el nivel durante uno o dos días
+    episodes = np.ones(hours)
+    for _ in range(rng.poisson(4 * years)):
+        start_idx = rng.integers(0, hours)
+        length = int(rng.integers(12, 48))
+        episodes[start_idx:start_idx + length] *= rng.uniform(1.8, 3.5)
+
+    pm2_5 = location['base_pm25'] * traffic * season * episodes * np.exp(_ar1_noise(rng, hours))
+    pm10 = pm2_5 * rng.uniform(1.5, 2.2) * np.exp(rng.normal(0, 0.1, hours))
+    sun = np.clip(np.sin(np.pi * (hour - 7) / 12), 0, None)
+    o3 = np.clip(20 + 45 * sun * season + rng.normal(0, 6, hours), 0, None)
+    no2 = np.clip(8 + 22 * (traffic - 0.85) + rng.normal(0, 3, hours), 0, None)
+    # Índice de OpenWeather (1-5) según PM2.5
+    aqi = np.digitize(pm2_5, [10, 25, 50, 75]) + 1
+
+    daily = np.sin(2 * np.pi * (hour - 9) / 24)
+    temperature = 28 + 5 * daily + rng.normal(0, 0.8, hours)
+    humidity = np.clip(72 - 15 * daily + rng.normal(0, 4, hours), 25, 100)
+    pressure = 1010 + 1.5 * np.sin(2 * np.pi * hour / 12) + rng.normal(0, 0.7, hours)
+    wind_speed = np.clip(1.5 + 1.5 * sun + rng.normal(0, 0.6, hours), 0, None)
+
+    keep = _gap_mask(rng, hours, years, outages_per_year, gap_rate)
+    timestamps = utc[keep]
+    return {
+        'timestamp': timestamps,
+        'pm2_5': np.round(pm2_5[keep], 2),
+        'pm10': np.round(pm10[keep], 2),
+        'o3': np.round(o3[keep], 2),
+        'no2': np.round(no2[keep], 2),
+        'aqi': aqi[keep],
+        'temperature': np.round(temperature[keep], 2),
+        'humidity': np.round(humidity[keep], 1),
+        'pressure': np.round(pressure[keep], 1),
+        'wind_speed': np.round(wind_speed[keep], 2),
+    }
+
+
+def location_rows(location, series, postgres):
+    """Filas en el orden de INSERT_COLUMNS (timestamps ISO UTC como los del recolector)"""
+    if postgres:
+        stamps = series['timestamp'].astype('datetime64[s]').tolist()
+        created = stamps
+    else:
+        iso = np.datetime_as_string(series['timestamp'], unit='s')
+        stamps = [f"{value}+00:00" for value in iso]
+        created = [value.replace('T', ' ') for value in iso]
+    values = [series[col].tolist() for col in INSERT_COLUMNS[5:14]]
+    return [
+        (location['id'], location['name'], location['lat'], location['lon'], stamp)
+        + tuple(column[i] for column in values) + (created[i],)
+        for i, stamp in enumerate(stamps)
+    ]
+
+
+def _connect(args):
+    if args.postgres:
+        import psycopg2
+        conn = psycopg2.connect(args.postgres)
+        cursor = conn.cursor()
+        for statement in POSTGRES_SCHEMA:
+            cursor.execute(statement)
+        conn.commit()
+        return conn
+
+    import sqlite3
+    import database_setup
+
+    directory = os.path.dirname(os.path.abspath(args.sqlite))
+    os.makedirs(directory, exist_ok=True)
+    # Mismo esquema e índices que la aplicación
+    os.environ['DATABASE_URL'] = f"sqlite:///{args.sqlite}"
+    database_setup.create_database()
+    conn = sqlite3.connect(args.sqlite)
+    conn.execute('PRAGMA synchronous = OFF')
+    return conn
+
+
+def _insert(conn, rows, postgres):
+    cursor = conn.cursor()
+    if postgres:
+        # COPY es mucho más rápido que INSERT fila por fila
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write('\t'.join(str(value) for value in row) + '\n')
+        buffer.seek(0)
+        cursor.copy_from(buffer, 'air_quality_data', columns=INSERT_COLUMNS)
+    else:
+        placeholders = ', '.join('?' for _ in INSERT_COLUMNS)
+        cursor.executemany(
+            f"INSERT OR IGNORE INTO air_quality_data ({', '.join(INSERT_COLUMNS)}) VALUES ({placeholders})",
+            rows
+        )
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generar datos sintéticos de calidad del aire')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--sqlite', help='Archivo SQLite destino (se crea si no existe)')
+    target.add_argument('--postgres', help='URL de una base Postgres local')
+    parser.add_argument('--locations', type=int, default=50, help='Número de ubicaciones')
+    parser.add_argument('--years', type=float, default=2, help='Años de datos horarios')
+    parser.add_argument('--end', help='Última hora (ISO, UTC); por defecto la hora actual')
+    parser.add_argument('--outages-per-year', type=float, default=6,
+                        help='Caídas del recolector por ubicación y año')
+    parser.add_argument('--gap-rate', type=float, default=0.01, help='Probabilidad de perder una hora suelta')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    end = datetime.fromisoformat(args.end) if args.end else datetime.now(timezone.utc)
+    if end.tzinfo is not None:
+        end = end.astimezone(timezone.utc)
+    end = end.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+    hours = int(args.years * 365 * 24)
+    start = end - timedelta(hours=hours - 1)
+
+    rng = np.random.default_rng(args.seed)
+    locations = synthetic_locations(args.locations, rng)
+    conn = _connect(args)
+
+    total = 0
+    started = time.perf_counter()
+    try:
+        for i, location in enumerate(locations, 1):
+            series = generate_location(location, start, hours, rng,
+                                       args.outages_per_year, args.gap_rate)
+            rows = location_rows(location, series, bool(args.postgres))
+            _insert(conn, rows, bool(args.postgres))
+            total += len(rows)
+            print(f"  [{i}/{len(locations)}] {location['id']}: {len(rows):,} filas", flush=True)
+
+        cursor = conn.cursor()
+        cursor.execute(REBUILD_STATS_SQL)
+        conn.commit()
+    finally:
+        conn.close()
+
+    # Ventanas móviles y superación de guías OMS con el mismo código que la
+    # ingesta (en Postgres, metrics.TimedCursor traduce los marcadores '?')
+    import database_setup
+    os.environ['DATABASE_URL'] = args.postgres or f"sqlite:///{args.sqlite}"
+    database_setup.rebuild_rolling_stats()
+    database_setup.rebuild_exceedances()
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ {total:,} filas en {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} filas/s) "
+          f"- {start.isoformat()} a {end.isoformat()} UTC")
+
+
+if __name__ == '__main__':
+    main()
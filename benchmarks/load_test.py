@@ -0,0 +1,240 @@
+# benchmarks/load_test.py - Prueba de carga del API con latencias por endpoint
+#
+# Uso:
+#   # En proceso (Flask test client) contra una base sintética
+#   DATABASE_URL=sqlite:///data/bench.db python benchmarks/load_test.py --concurrency 16 --duration 30
+#   # Contra un servidor ya levantado (python scheduler.py serve)
+#   python benchmarks/load_test.py --url http://127.0.0.1:5000 --concurrency 32
+#   # Guardar una referencia y fallar si p95 empeora más del 20%
+#   python benchmarks/load_test.py --save base.json
+#   python benchmarks/load_test.py --compare base.json --tolerance 0.2
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# (nombre, plantilla de URL, peso relativo en la mezcla de tráfico)
+SCENARIO = (
+    ('current', '/api/current', 10),
+    ('current_location', '/api/current/{location}', 10),
+    ('locations', '/api/locations', 5),
+    ('status', '/api/status', 2),
+    ('historical_week', '/api/historical/{location}?days=7', 10),
+    ('historical_year', '/api/historical/{location}?days=365&limit=100000&max_points=1000', 4),
+    ('monthly_stats', '/api/monthly-stats/{location}/{year}/{month}', 4),
+    ('boxplot', '/api/boxplot-data/{location}/{year}', 3),
+    ('trends', '/api/trends/{location}', 5),
+    ('hourly_aggregate', '/api/aggregate/hourly', 3),
+    ('heatmap', '/api/heatmap?metric=pm2_5&resolution=128', 3),
+    ('exceedances_year', '/api/exceedances?start={year}-01-01&end={year}-12-31', 2),
+    ('export_csv_week', '/api/export/{location}?format=csv&period=week', 1),
+    ('export_xlsx_month', '/api/export/{location}?format=xlsx&period=month', 1),
+)
+
+
+def percentile(sorted_values, fraction):
+    """Percentil por rango más cercano sobre una lista ya ordenada"""
+    if not sorted_values:
+        return None
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class InProcessClient:
+    """Peticiones al app de Flask sin red (un test client por hilo)"""
+
+    def __init__(self):
+        from api import app
+        self._app = app
+        self._local = threading.local()
+
+    def get(self, path):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        response = client.get(path)
+        body = response.get_data()
+        return response.status_code, body
+
+
+class HttpClient:
+    """Peticiones HTTP a un servidor en marcha (una sesión keep-alive por hilo)"""
+
+    def __init__(self, base_url, timeout):
+        import requests
+        self._requests = requests
+        self._base_url = base_url.rstrip('/')
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def get(self, path):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        response = session.get(self._base_url + path, timeout=self._timeout)
+        return response.status_code, response.content
+
+
+def discover_locations(client):
+    """IDs de ubicación y el año/mes más reciente con datos"""
+    status, body = client.get('/api/locations')
+    if status != 200:
+        raise RuntimeError(f"/api/locations respondió {status}")
+    locations = json.loads(body)['data']
+    if not locations:
+        raise RuntimeError("No hay ubicaciones con datos; genera un dataset con generate_dataset.py")
+    last = max(loc['last_update'] for loc in locations if loc.get('last_update'))
+    last = datetime.fromisoformat(str(last).replace('Z', '+00:00'))
+    return [loc['id'] for loc in locations], last.year, last.month
+
+
+def run_load(client, duration, concurrency, max_requests, endpoints, seed):
+    """Lanza `concurrency` hilos que eligen endpoints según su peso hasta agotar tiempo o peticiones"""
+    locations, year, month = discover_locations(client)
+    names = [name for name, _, _ in endpoints]
+    templates = {name: template for name, template, _ in endpoints}
+    weights = [weight for _, _, weight in endpoints]
+
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    issued = [0]
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id):
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests and issued[0] >= max_requests:
+                    return
+                issued[0] += 1
+            name = rng.choices(names, weights)[0]
+            path = templates[name].format(location=rng.choice(locations), year=year, month=month)
+            start = time.perf_counter()
+            try:
+                status, body = client.get(path)
+                # El API responde los errores con 200 y {"error": ..., "success": false}
+                failed = status >= 500 or body.startswith(b'{"error"')
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[name].append(elapsed)
+                if failed:
+                    errors[name] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    results = {}
+    for name in names:
+        values = sorted(latencies.get(name, []))
+        if not values:
+            continue
+        results[name] = {
+            'requests': len(values),
+            'errors': errors[name],
+            'throughput_rps': len(values) / wall,
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p95_ms': percentile(values, 0.95) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'max_ms': values[-1] * 1000,
+        }
+    all_values = sorted(v for values in latencies.values() for v in values)
+    summary = {
+        'requests': len(all_values),
+        'errors': sum(errors.values()),
+        'throughput_rps': len(all_values) / wall,
+        'p50_ms': (percentile(all_values, 0.50) or 0) * 1000,
+        'p95_ms': (percentile(all_values, 0.95) or 0) * 1000,
+        'p99_ms': (percentile(all_values, 0.99) or 0) * 1000,
+        'wall_seconds': wall,
+        'concurrency': concurrency,
+        'locations': len(locations),
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+    return {'endpoints': results, 'summary': summary}
+
+
+def print_report(report):
+    print(f"{'endpoint':<20} {'req':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, r in report['endpoints'].items():
+        print(f"{name:<20} {r['requests']:>7} {r['errors']:>5} {r['throughput_rps']:>8.1f} "
+              f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}")
+    s = report['summary']
+    print(f"{'TOTAL':<20} {s['requests']:>7} {s['errors']:>5} {s['throughput_rps']:>8.1f} "
+          f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    print(f"\n{s['concurrency']} hilos, {s['wall_seconds']:.1f}s, {s['locations']} ubicaciones")
+
+
+def compare(report, baseline, tolerance, min_ms=5.0):
+    """Endpoints cuyo p95 empeoró más que la tolerancia (se ignoran diferencias < min_ms)"""
+    regressions = []
+    for name, r in report['endpoints'].items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+        if r['p95_ms'] > base['p95_ms'] * (1 + tolerance) and r['p95_ms'] - base['p95_ms'] > min_ms:
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f} -> {r['p95_ms']:.1f} ms")
+        if r['errors'] > base.get('errors', 0):
+            regressions.append(f"{name}: errores {base.get('errors', 0)} -> {r['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de carga del API')
+    parser.add_argument('--url', help='URL base de un servidor en marcha; si se omite, se usa el app en proceso')
+    parser.add_argument('--concurrency', type=int, default=8, help='Hilos concurrentes')
+    parser.add_argument('--duration', type=float, default=20, help='Segundos de carga')
+    parser.add_argument('--requests', type=int, default=0, help='Tope de peticiones (0 = sin tope)')
+    parser.add_argument('--endpoint', action='append', choices=[name for name, _, _ in SCENARIO],
+                        help='Limitar a estos endpoints (se puede repetir)')
+    parser.add_argument('--timeout', type=float, default=60, help='Timeout por petición HTTP')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help='Guardar el reporte en este JSON')
+    parser.add_argument('--compare', help='Reporte de referencia; sale con código 1 si hay regresión')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Empeoramiento de p95 permitido (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    if args.url:
+        client = HttpClient(args.url, args.timeout)
+    else:
+        if not os.getenv('DATABASE_URL'):
+            parser.error('Sin --url hace falta DATABASE_URL (p. ej. sqlite:///data/bench.db)')
+        client = InProcessClient()
+
+    endpoints = [e for e in SCENARIO if not args.endpoint or e[0] in args.endpoint]
+    report = run_load(client, args.duration, args.concurrency, args.requests, endpoints, args.seed)
+    print_report(report)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print('\n❌ Regresiones de rendimiento:')
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print('\n✅ Sin regresiones de rendimiento')
+
+
+if __name__ == '__main__':
+    main()
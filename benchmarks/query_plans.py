@@ -0,0 +1,325 @@
+# benchmarks/query_plans.py - Planes de ejecución y tiempos de las consultas del API
+#
+# Ejecuta las funciones reales (database_setup y api) contra datasets
+# sintéticos de varios tamaños, captura el SQL que emiten, obtiene su plan
+# (EXPLAIN QUERY PLAN en SQLite, EXPLAIN (FORMAT JSON) en Postgres) y mide
+# la latencia. Falla si alguna consulta recorre una tabla completa o si la
+# latencia empeora frente a una referencia guardada.
+#
+# Uso:
+#   python benchmarks/query_plans.py                          # SQLite, escalas small y medium
+#   python benchmarks/query_plans.py --scale large --verbose  # con los planes completos
+#   python benchmarks/query_plans.py --save plans.json
+#   python benchmarks/query_plans.py --compare plans.json --tolerance 0.3
+#   python benchmarks/query_plans.py --postgres postgresql://localhost/bench
+#       (la base debe llenarse antes con generate_dataset.py --postgres; los
+#       marcadores '?' los traduce metrics.TimedCursor, pero las consultas con
+#       funciones propias de SQLite como strftime o datetime('now') fallan en
+#       Postgres y quedan en el reporte con su error)
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+# Escalas: (ubicaciones, años de datos horarios)
+SCALES = {
+    'small': (10, 0.5),
+    'medium': (50, 2),
+    'large': (200, 3),
+}
+
+# Tablas pequeñas (una fila por ubicación) que sí se pueden recorrer completas
+ALLOWED_FULL_SCANS = {'location_stats'}
+
+_TABLE_ALIAS = re.compile(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', re.IGNORECASE)
+_SQL_KEYWORDS = {'where', 'join', 'on', 'group', 'order', 'left', 'inner', 'limit', 'using'}
+
+
+def dataset_path(scale):
+    return os.path.join(REPO_DIR, 'data', f"bench_{scale}.db")
+
+
+def ensure_dataset(scale):
+    """Generar el dataset SQLite de la escala si todavía no existe"""
+    path = dataset_path(scale)
+    if os.path.exists(path):
+        return path
+    locations, years = SCALES[scale]
+    print(f"Generando dataset '{scale}' ({locations} ubicaciones, {years} años)...", flush=True)
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, 'benchmarks', 'generate_dataset.py'),
+         '--sqlite', path, '--locations', str(locations), '--years', str(years)],
+        check=True, stdout=subprocess.DEVNULL
+    )
+    return path
+
+
+def build_cases(ctx):
+    """(nombre, endpoint, función) de cada consulta a medir"""
+    from api import _compute_boxplot_data, _compute_historical, _compute_trends
+    from database_setup import (
+        get_export_summary, get_hourly_aggregates, get_latest_readings,
+        get_location_stats, get_monthly_statistics
+    )
+
+    location, year, month = ctx['location'], ctx['year'], ctx['month']
+    now = datetime.now(timezone.utc)
+
+    def iso(delta):
+        return (now - delta).isoformat(timespec='seconds')
+
+    return [
+        ('historical_week', '/api/historical', lambda: _compute_historical(location, 7, 100)),
+        ('historical_year', '/api/historical', lambda: _compute_historical(location, 365, 100000)),
+        ('monthly_stats', '/api/monthly-stats', lambda: get_monthly_statistics(location, year, month)),
+        ('boxplot', '/api/boxplot-data', lambda: _compute_boxplot_data(location, year)),
+        ('trends', '/api/trends', lambda: _compute_trends(location)),
+        ('locations', '/api/locations', get_location_stats),
+        ('current', '/api/current', get_latest_readings),
+        ('hourly_aggregate', '/api/aggregate/hourly',
+         lambda: get_hourly_aggregates(iso(timedelta(days=1)), iso(timedelta()), iso(timedelta(days=7)))),
+        ('export_summary', '/api/export/all',
+         lambda: get_export_summary(iso(timedelta(days=30)), iso(timedelta()))),
+    ]
+
+
+def dataset_context():
+    """Ubicación con más datos y el mes de su último registro"""
+    from database_setup import get_location_stats
+
+    stats = [row for row in get_location_stats() if row['data_count']]
+    if not stats:
+        raise RuntimeError("El dataset no tiene datos; genera uno con generate_dataset.py")
+    busiest = max(stats, key=lambda row: row['data_count'])
+    last = busiest['last_timestamp']
+    if not isinstance(last, datetime):
+        last = datetime.fromisoformat(str(last))
+    return {
+        'location': busiest['location_id'],
+        'year': last.year,
+        'month': last.month,
+        'rows': sum(row['data_count'] for row in stats),
+        'locations': len(stats),
+    }
+
+
+def capture_queries(fn):
+    """Ejecutar fn y devolver (segundos, [(sql, parámetros), ...]) sin repetir sentencias"""
+    from metrics import add_query_listener, remove_query_listener
+
+    captured = {}
+
+    def listener(sql, params, seconds):
+        key = ' '.join(sql.split())
+        captured.setdefault(key, (sql, params))
+
+    add_query_listener(listener)
+    start = time.perf_counter()
+    try:
+        fn()
+    finally:
+        elapsed = time.perf_counter() - start
+        remove_query_listener(listener)
+    return elapsed, list(captured.values())
+
+
+def _aliases(sql):
+    """Alias -> tabla de las tablas nombradas en FROM/JOIN"""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def explain_sqlite(cursor, sql, params):
+    """Plan de SQLite y tablas recorridas completas"""
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params or ())
+    details = [row[3] for row in cursor.fetchall()]
+    aliases = _aliases(sql)
+    full_scans = []
+    for detail in details:
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        # "SCAN t" o "SCAN t USING [COVERING] INDEX": se lee toda la tabla o todo el índice.
+        # Las subconsultas (p. ej. "SCAN latest") no cuentan: su costo aparece en su propio plan
+        if match and match.group(1) in aliases:
+            full_scans.append(aliases[match.group(1)])
+    return details, full_scans
+
+
+def _walk_postgres_plan(node, details, full_scans):
+    relation = node.get('Relation Name')
+    label = node['Node Type'] + (f" on {relation}" if relation else '')
+    if node.get('Index Name'):
+        label += f" using {node['Index Name']}"
+    if node.get('Index Cond'):
+        label += f" ({node['Index Cond']})"
+    details.append(label)
+    if node['Node Type'] == 'Seq Scan':
+        full_scans.append(relation)
+    elif node['Node Type'] in ('Index Scan', 'Index Only Scan') and not node.get('Index Cond'):
+        # Recorre el índice completo (p. ej. solo para ordenar)
+        full_scans.append(relation)
+    for child in node.get('Plans', []):
+        _walk_postgres_plan(child, details, full_scans)
+
+
+def explain_postgres(cursor, sql, params):
+    """Plan de Postgres (el cursor de get_connection traduce los marcadores '?')"""
+    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params or ())
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    details, full_scans = [], []
+    _walk_postgres_plan(plan[0]['Plan'], details, full_scans)
+    return details, full_scans
+
+
+def run_case(fn, repeat, postgres):
+    """Planes de las consultas de un caso y mediana de su latencia"""
+    from database_setup import get_connection
+
+    first, statements = capture_queries(fn)
+    timings = [first] + [capture_queries(fn)[0] for _ in range(repeat - 1)]
+
+    plans = []
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        for sql, params in statements:
+            try:
+                if postgres:
+                    details, full_scans = explain_postgres(cursor, sql, params)
+                else:
+                    details, full_scans = explain_sqlite(cursor, sql, params)
+                error = None
+            except Exception as e:
+                if postgres:
+                    conn.rollback()
+                details, full_scans, error = [], [], str(e)
+            plans.append({
+                'sql': ' '.join(sql.split()),
+                'plan': details,
+                'full_scans': sorted({t for t in full_scans if t not in ALLOWED_FULL_SCANS}),
+                'error': error,
+            })
+    finally:
+        conn.close()
+
+    return {
+        'median_ms': statistics.median(timings) * 1000,
+        'queries': len(statements),
+        'plans': plans,
+    }
+
+
+def run_scale(database_url, repeat, only):
+    os.environ['DATABASE_URL'] = database_url
+    postgres = not database_url.startswith('sqlite:///')
+    ctx = dataset_context()
+    results = {'dataset': ctx, 'cases': {}}
+    for name, endpoint, fn in build_cases(ctx):
+        if only and name not in only:
+            continue
+        try:
+            case = run_case(fn, repeat, postgres)
+        except Exception as e:
+            case = {'median_ms': None, 'queries': 0, 'plans': [], 'error': str(e)}
+        case['endpoint'] = endpoint
+        results['cases'][name] = case
+    return results
+
+
+def problems(report, baseline=None, tolerance=0.25, min_ms=5.0):
+    """Consultas con recorrido completo, con error o más lentas que la referencia"""
+    found = []
+    for scale, result in report.items():
+        for name, case in result['cases'].items():
+            if case.get('error'):
+                found.append(f"[{scale}] {name}: error al ejecutar ({case['error']})")
+            for plan in case['plans']:
+                if plan['error']:
+                    found.append(f"[{scale}] {name}: EXPLAIN falló ({plan['error']}): {plan['sql'][:100]}")
+                for table in plan['full_scans']:
+                    found.append(f"[{scale}] {name}: recorrido completo de {table}: {plan['sql'][:100]}")
+            base = (baseline or {}).get(scale, {}).get('cases', {}).get(name)
+            if base and base.get('median_ms') and case.get('median_ms'):
+                if (case['median_ms'] > base['median_ms'] * (1 + tolerance)
+                        and case['median_ms'] - base['median_ms'] > min_ms):
+                    found.append(f"[{scale}] {name}: latencia {base['median_ms']:.1f} -> "
+                                 f"{case['median_ms']:.1f} ms")
+    return found
+
+
+def print_report(report, verbose):
+    for scale, result in report.items():
+        ds = result['dataset']
+        print(f"\n== {scale}: {ds['rows']:,} filas, {ds['locations']} ubicaciones (caso: {ds['location']}) ==")
+        print(f"{'caso':<18} {'endpoint':<22} {'mediana ms':>11} {'consultas':>10}  recorridos completos")
+        for name, case in result['cases'].items():
+            scans = sorted({t for plan in case['plans'] for t in plan['full_scans']})
+            median = f"{case['median_ms']:.1f}" if case.get('median_ms') is not None else 'error'
+            print(f"{name:<18} {case['endpoint']:<22} {median:>11} {case['queries']:>10}  "
+                  f"{', '.join(scans) or '-'}")
+            if verbose:
+                for plan in case['plans']:
+                    print(f"    SQL: {plan['sql'][:160]}")
+                    for line in plan['plan']:
+                        print(f"      {line}")
+                    if plan['error']:
+                        print(f"      ERROR: {plan['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Planes de ejecución y latencia de las consultas')
+    parser.add_argument('--scale', choices=sorted(SCALES), action='append',
+                        help='Escala SQLite a medir (se puede repetir; por defecto small y medium)')
+    parser.add_argument('--postgres', help='URL de una base Postgres ya poblada (en lugar de SQLite)')
+    parser.add_argument('--case', action='append', help='Medir solo estos casos')
+    parser.add_argument('--repeat', type=int, default=5, help='Ejecuciones por caso (se usa la mediana)')
+    parser.add_argument('--verbose', action='store_true', help='Mostrar el SQL y el plan de cada consulta')
+    parser.add_argument('--save', help='Guardar el reporte en este JSON')
+    parser.add_argument('--compare', help='Reporte de referencia para detectar regresiones de latencia')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Empeoramiento de latencia permitido (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    report = {}
+    if args.postgres:
+        report['postgres'] = run_scale(args.postgres, args.repeat, args.case)
+    else:
+        for scale in args.scale or ['small', 'medium']:
+            path = ensure_dataset(scale)
+            report[scale] = run_scale(f"sqlite:///{path}", args.repeat, args.case)
+
+    print_report(report, args.verbose)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    found = problems(report, baseline, args.tolerance)
+    if found:
+        print('\n❌ Problemas encontrados:')
+        for line in found:
+            print(f"  {line}")
+        sys.exit(1)
+    print('\n✅ Todas las consultas usan índices y no hay regresiones de latencia')
+
+
+if __name__ == '__main__':
+    main()
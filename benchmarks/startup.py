@@ -0,0 +1,169 @@
+# benchmarks/startup.py - Costo de arranque (tiempo de import y memoria) de cada modo
+#
+# Uso:
+#   python benchmarks/startup.py                      # tabla por modo
+#   python benchmarks/startup.py --save base.json     # guardar resultados
+#   python benchmarks/startup.py --compare base.json  # falla si algún modo empeora
+#
+# Cada medición corre en un proceso nuevo (con -X importtime) para que los
+# módulos ya cargados no escondan el costo real de un arranque en frío.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Lo que importa cada modo al arrancar
+MODES = {
+    'scheduler': 'import scheduler, data_collector',
+    'api': 'import api',
+    'both': 'import scheduler, data_collector, api',
+}
+
+# Dependencias pesadas que no deberían cargarse al arrancar
+HEAVY_MODULES = ('pandas', 'numpy', 'openpyxl', 'pyarrow', 'flask', 'requests')
+
+PROBE = '''
+import sys
+{code}
+try:
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB, macOS bytes
+    rss_kib = rss // 1024 if sys.platform == 'darwin' else rss
+except ImportError:
+    rss_kib = None
+print('RESULT ' + repr({{
+    'rss_kib': rss_kib,
+    'heavy': sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+'''
+
+
+def parse_importtime(stderr):
+    """Salida de -X importtime: (tiempo total en us, [(acumulado_us, módulo), ...])
+
+    El total suma los módulos de primer nivel (su tiempo acumulado ya incluye
+    el de lo que importan). La lista incluye también el segundo nivel, que es
+    donde aparecen las dependencias que arrastra cada módulo del proyecto.
+    """
+    total = 0
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            total += int(cumulative_us)
+        if depth <= 1:
+            modules.append((int(cumulative_us), name.strip()))
+    return total, sorted(modules, reverse=True)
+
+
+def measure(mode, code):
+    """Un arranque en frío del modo: tiempo de pared, tiempo de import, RSS y módulos pesados"""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR, PYTHONDONTWRITEBYTECODE='1')
+    probe = PROBE.format(code=code, heavy=HEAVY_MODULES)
+    # Directorio temporal: los módulos crean data/ y el log relativo al cwd
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', probe],
+            cwd=cwd, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"El modo '{mode}' falló al importar:\n{proc.stderr[-2000:]}")
+
+    result_line = next(line for line in proc.stdout.splitlines() if line.startswith('RESULT '))
+    result = eval(result_line[len('RESULT '):], {})
+    import_us, modules = parse_importtime(proc.stderr)
+    result.update({
+        'wall_ms': wall * 1000,
+        'import_ms': import_us / 1000,
+        'top_modules': [(name, us / 1000) for us, name in modules[:8]],
+    })
+    return result
+
+
+def run(modes, repeat):
+    results = {}
+    for mode in modes:
+        runs = [measure(mode, MODES[mode]) for _ in range(repeat)]
+        rss = [r['rss_kib'] for r in runs if r['rss_kib'] is not None]
+        results[mode] = {
+            'wall_ms': statistics.median(r['wall_ms'] for r in runs),
+            'import_ms': statistics.median(r['import_ms'] for r in runs),
+            'rss_mib': statistics.median(rss) / 1024 if rss else None,
+            'heavy': runs[-1]['heavy'],
+            'top_modules': runs[-1]['top_modules'],
+        }
+    return results
+
+
+def print_report(results):
+    print(f"{'modo':<10} {'pared (ms)':>11} {'import (ms)':>12} {'RSS (MiB)':>10}  pesados cargados")
+    for mode, r in results.items():
+        rss = f"{r['rss_mib']:.1f}" if r['rss_mib'] is not None else 'n/d'
+        heavy = ', '.join(r['heavy']) or '-'
+        print(f"{mode:<10} {r['wall_ms']:>11.1f} {r['import_ms']:>12.1f} {rss:>10}  {heavy}")
+    for mode, r in results.items():
+        print(f"\nMódulos más costosos ({mode}):")
+        for name, ms in r['top_modules']:
+            print(f"  {ms:8.1f} ms  {name}")
+
+
+def compare(results, baseline, tolerance):
+    """Modos cuyo tiempo de import o memoria empeoró más que la tolerancia"""
+    regressions = []
+    for mode, r in results.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        for key in ('import_ms', 'rss_mib'):
+            if r.get(key) is None or base.get(key) is None:
+                continue
+            if r[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{mode}: {key} {base[key]:.1f} -> {r[key]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Costo de arranque de cada modo')
+    parser.add_argument('--mode', choices=sorted(MODES), action='append',
+                        help='Modo a medir (se puede repetir; por defecto todos)')
+    parser.add_argument('--repeat', type=int, default=5, help='Arranques por modo (se usa la mediana)')
+    parser.add_argument('--save', help='Guardar los resultados en este JSON')
+    parser.add_argument('--compare', help='JSON de referencia; sale con código 1 si hay regresión')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Empeoramiento permitido frente a la referencia (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    results = run(args.mode or list(MODES), args.repeat)
+    print_report(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print('\n❌ Regresiones de arranque:')
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print('\n✅ Sin regresiones de arranque')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,11 @@
 import requests
 import time
+from collections import deque
 from datetime import datetime, timezone, timedelta
+import hashlib
 import json
-from database_setup import insert_air_quality_data
+import statistics
+from database_setup import insert_air_quality_data, record_collection_outcome
 
 class AirQualityCollector:
     def __init__(self, api_key):
@@ -64,6 +67,14 @@ class AirQualityCollector:
         # Caché simple por día para meteo histórica (lat, lon, 'YYYY-MM-DD') -> { dt: {temp,humidity,pressure,wind_speed} }
         self._wx_cache = {}
 
+        # Última observación guardada por ubicación: location_id -> (timestamp, huella del registro)
+        self._last_seen = {}
+        # 'dt' distintos observados por ubicación (para estimar cada cuánto actualiza OpenWeather)
+        self._dt_history = {}
+        # Observaciones sin cambios que no se escribieron (total y en la última recolección)
+        self.skipped_unchanged = 0
+        self.last_run_skipped = 0
+
     def get_air_quality_data(self, lat, lon):
         """Obtener datos de calidad del aire de OpenWeather API"""
         try:
@@ -130,23 +141,38 @@ class AirQualityCollector:
                 timestamp = datetime.fromtimestamp(obs_dt, tz=timezone.utc).isoformat(timespec='seconds')
             else:
                 timestamp = datetime.now(timezone.utc).isoformat()
+
+            record = {
+                'location_id': location['id'],
+                'location_name': location['name'],
+                'lat': location['lat'],
+                'lon': location['lon'],
+                'timestamp': timestamp,
+                'pm2_5': components.get('pm2_5'),
+                'pm10': components.get('pm10'),
+                'o3': components.get('o3'),
+                'no2': components.get('no2'),
+                'aqi': aqi,
+                'temp': temp,
+                'humidity': humidity,
+                'pressure': pressure,
+                'wind_speed': wind_speed
+            }
+            
+            # Si 'dt' y todos los valores coinciden con lo último guardado, no escribir
+            fingerprint = hashlib.sha1(json.dumps(record, sort_keys=True).encode('utf-8')).hexdigest()
+            if self._last_seen.get(location['id']) == (timestamp, fingerprint):
+                self.skipped_unchanged += 1
+                self.last_run_skipped += 1
+                print(f"⏭️ Sin cambios para {location['name']} (observación {timestamp})")
+                return True
+            
             # Guardar en base de datos
-            success = insert_air_quality_data(
-                location_id=location['id'],
-                location_name=location['name'],
-                lat=location['lat'],
-                lon=location['lon'],
-                timestamp=timestamp,
-                pm2_5=components.get('pm2_5'),
-                pm10=components.get('pm10'),
-                o3=components.get('o3'),
-                no2=components.get('no2'),
-                aqi=aqi,
-                temp=temp,
-                humidity=humidity,
-                pressure=pressure,
-                wind_speed=wind_speed
-            )
+            success = insert_air_quality_data(**record)
+            if success:
+                self._last_seen[location['id']] = (timestamp, fingerprint)
+                if obs_dt:
+                    self._remember_dt(location['id'], obs_dt)
             
             if success:
                 print(f"✅ Datos guardados para {location['name']}")
@@ -159,6 +185,30 @@ class AirQualityCollector:
             print(f"Error procesando datos para {location['name']}: {e}")
             return False
 
+    def _remember_dt(self, location_id, obs_dt):
+        history = self._dt_history.setdefault(location_id, deque(maxlen=12))
+        if not history or obs_dt > history[-1]:
+            history.append(obs_dt)
+
+    def upstream_cadence(self):
+        """Segundos entre actualizaciones de OpenWeather (mediana observada), o None.
+
+        Si se consulta más lento que la cadencia real, la estimación es un
+        múltiplo de ella; sirve igual como cota para el intervalo de consulta.
+        """
+        deltas = []
+        for history in self._dt_history.values():
+            values = list(history)
+            deltas.extend(b - a for a, b in zip(values, values[1:]) if b > a)
+        if len(deltas) < 3:
+            return None
+        return statistics.median(deltas)
+
+    def latest_observation_dt(self):
+        """Último 'dt' (unix) guardado entre todas las ubicaciones, o None"""
+        latest = [history[-1] for history in self._dt_history.values() if history]
+        return max(latest) if latest else None
+
     # ======= NUEVO: utilidades para meteo histórica =======
     def _weather_day_cache(self, lat, lon, unix_ts):
         """Descarga y cachea las horas de meteo del día (UTC) de unix_ts."""
@@ -229,6 +279,7 @@ class AirQualityCollector:
         
         successful = 0
         failed = 0
+        self.last_run_skipped = 0
         
         for location in self.locations:
             print(f"📡 Recolectando datos para {location['name']}...")
@@ -240,11 +291,14 @@ class AirQualityCollector:
                 # Procesar y guardar
                 if self.process_and_save_data(location, api_data):
                     successful += 1
+                    self._record_outcome(location, True)
                 else:
                     failed += 1
+                    self._record_outcome(location, False, 'save failed')
             else:
                 print(f"❌ Error en API para {location['name']}: {api_data.get('error', 'Unknown')}")
                 failed += 1
+                self._record_outcome(location, False, api_data.get('error', 'Unknown'))
             
             # Esperar entre peticiones para evitar límites de rate
             time.sleep(2)
@@ -252,6 +306,7 @@ class AirQualityCollector:
         print(f"\n📊 Resumen de recolección:")
         print(f"   ✅ Exitosos: {successful}")
         print(f"   ❌ Fallidos: {failed}")
+        print(f"   ⏭️ Sin cambios (no escritos): {self.last_run_skipped}")
         print(f"   📅 Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         
         return successful, failed
@@ -269,11 +324,28 @@ class AirQualityCollector:
         api_data = self.get_air_quality_data(location['lat'], location['lon'])
         
         if api_data['success']:
-            return self.process_and_save_data(location, api_data)
+            ok = self.process_and_save_data(location, api_data)
+            self._record_outcome(location, ok, None if ok else 'save failed')
+            return ok
         else:
             print(f"❌ Error en API: {api_data.get('error', 'Unknown')}")
+            self._record_outcome(location, False, api_data.get('error', 'Unknown'))
             return False
 
+    def _record_outcome(self, location, success, error=None):
+        """Guardar el resultado de la recolección en location_stats (sin interrumpir la recolección)"""
+        try:
+            record_collection_outcome(
+                location_id=location['id'],
+                location_name=location['name'],
+                success=success,
+                error=error,
+                lat=location['lat'],
+                lon=location['lon']
+            )
+        except Exception as e:
+            print(f"Error registrando resultado para {location['name']}: {e}")
+
 
     def collect_history_window(self, location, days=5, backfill_buffer_seconds=3600):
         """
@@ -0,0 +1,457 @@
+# data_export.py - Exportación de datos históricos en streaming
+from datetime import datetime, timedelta, timezone
+import csv
+import io
+import math
+import os
+import zlib
+
+# openpyxl y pyarrow se importan dentro de las funciones que los usan: solo
+# se cargan al exportar en esos formatos, no en cada arranque del API
+
+from database_setup import DATA_COLUMNS, iter_historical_rows, get_location_info
+
+# Días cubiertos por cada período de exportación
+PERIOD_DAYS = {
+    '24h': 1,
+    'month': 30,
+    'year': 365
+}
+
+# Nombre del período en el archivo generado
+PERIOD_NAMES = {
+    '24h': '24horas',
+    'month': 'ultimo_mes',
+    'year': 'ultimo_año'
+}
+
+# Nombres legibles de las columnas exportadas
+COLUMN_NAMES = {
+    'timestamp': 'Fecha y Hora',
+    'location_id': 'ID Ubicación',
+    'location_name': 'Nombre Ubicación',
+    'latitude': 'Latitud',
+    'longitude': 'Longitud',
+    'aqi': 'Índice de Calidad del Aire (AQI)',
+    'pm2_5': 'PM2.5 (µg/m³)',
+    'pm10': 'PM10 (µg/m³)',
+    'co': 'Monóxido de Carbono - CO (µg/m³)',
+    'no': 'Óxido Nítrico - NO (µg/m³)',
+    'no2': 'Dióxido de Nitrógeno - NO2 (µg/m³)',
+    'o3': 'Ozono - O3 (µg/m³)',
+    'so2': 'Dióxido de Azufre - SO2 (µg/m³)',
+    'nh3': 'Amoníaco - NH3 (µg/m³)',
+    'temperature': 'Temperatura (°C)',
+    'humidity': 'Humedad (%)',
+    'pressure': 'Presión Atmosférica (hPa)',
+    'wind_speed': 'Velocidad del Viento (m/s)'
+}
+
+# Columnas con estadísticas en la hoja 'Estadísticas'
+STATS_COLUMNS = ('pm2_5', 'pm10', 'aqi')
+
+POLLUTANT_DESCRIPTIONS = [
+    ['AQI', 'Índice de Calidad del Aire (1-5): 1=Bueno, 2=Aceptable, 3=Moderado, 4=Deficiente, 5=Muy deficiente'],
+    ['PM2.5', 'Material particulado fino (≤2.5 µm). Límite OMS: 15 µg/m³ (24h)'],
+    ['PM10', 'Material particulado (≤10 µm). Límite OMS: 45 µg/m³ (24h)'],
+    ['CO', 'Monóxido de carbono. Límite OMS: 4 mg/m³ (24h)'],
+    ['NO2', 'Dióxido de nitrógeno. Límite OMS: 25 µg/m³ (24h)'],
+    ['O3', 'Ozono troposférico. Límite OMS: 100 µg/m³ (8h)'],
+    ['SO2', 'Dióxido de azufre. Límite OMS: 40 µg/m³ (24h)'],
+    ['NH3', 'Amoníaco'],
+]
+
+# Formatos disponibles: extensión y tipo MIME
+EXPORT_FORMATS = {
+    'xlsx': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('csv', 'text/csv; charset=utf-8'),
+    'csv.gz': ('csv.gz', 'application/gzip'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet')
+}
+
+# Filas usadas para estimar el ancho de las columnas
+WIDTH_SAMPLE_ROWS = 500
+
+
+def export_window(period):
+    """Fechas (inicio, fin) del período solicitado"""
+    days = PERIOD_DAYS.get(period, 1)
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    return start_date, end_date
+
+
+def export_filename(location_id, period, extension):
+    """Nombre del archivo descargado"""
+    period_name = PERIOD_NAMES.get(period, period)
+    return f"datos_calidad_aire_{location_id}_{period_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def format_timestamp(value):
+    """Fecha legible 'YYYY-MM-DD HH:MM:SS' (acepta datetime o texto ISO)"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return value
+    return value
+
+
+def open_export_batches(location_id, start_date, end_date):
+    """Iterador de lotes para la exportación, o None si no hay datos.
+
+    Lee el primer lote por adelantado para poder responder 'sin datos'
+    antes de empezar a enviar el archivo.
+    """
+    batches = iter_historical_rows(
+        location_id=location_id,
+        start_date=start_date.isoformat(),
+        end_date=end_date.isoformat()
+    )
+    first_batch = next(batches, None)
+    if not first_batch:
+        batches.close()
+        return None
+
+    def chained():
+        yield first_batch
+        yield from batches
+
+    return chained()
+
+
+def iter_csv_export(batches):
+    """CSV en bloques de bytes, un bloque por lote del cursor"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(DATA_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+
+
+def iter_csv_gzip_export(batches):
+    """CSV comprimido con gzip en streaming (sin archivo intermedio)"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in iter_csv_export(batches):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _to_datetime(value, tz=None):
+    if value is None or isinstance(value, datetime):
+        return value
+    parsed = datetime.fromisoformat(value)
+    if tz is not None and parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz)
+    return parsed
+
+
+def write_parquet_export(output, batches, compression='zstd'):
+    """Parquet tipado y comprimido, escrito lote por lote (requiere pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ('id', pa.int64()),
+        ('location_id', pa.string()),
+        ('location_name', pa.string()),
+        ('latitude', pa.float64()),
+        ('longitude', pa.float64()),
+        ('timestamp', pa.timestamp('s', tz='UTC')),
+        ('pm2_5', pa.float64()),
+        ('pm10', pa.float64()),
+        ('o3', pa.float64()),
+        ('no2', pa.float64()),
+        ('aqi', pa.int8()),
+        ('temperature', pa.float64()),
+        ('humidity', pa.float64()),
+        ('pressure', pa.float64()),
+        ('wind_speed', pa.float64()),
+        ('created_at', pa.timestamp('s'))
+    ])
+    ts_idx = DATA_COLUMNS.index('timestamp')
+    created_idx = DATA_COLUMNS.index('created_at')
+
+    total_rows = 0
+    with pq.ParquetWriter(output, schema, compression=compression) as writer:
+        for batch in batches:
+            columns = [list(col) for col in zip(*batch)]
+            columns[ts_idx] = [_to_datetime(v, timezone.utc) for v in columns[ts_idx]]
+            columns[created_idx] = [_to_datetime(v) for v in columns[created_idx]]
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema
+            ))
+            total_rows += len(batch)
+    return total_rows
+
+
+class RunningStats:
+    """Promedio, mínimo, máximo y desviación estándar en una sola pasada (Welford)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def std(self):
+        # Desviación muestral (igual que pandas)
+        if self.count < 2:
+            return float('nan')
+        return math.sqrt(self.m2 / (self.count - 1))
+
+
+def _header_cells(ws, values, alignment):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+
+    cells = []
+    for value in values:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
+        cell.font = Font(bold=True, color='FFFFFF', size=11)
+        cell.alignment = alignment
+        cells.append(cell)
+    return cells
+
+
+def write_excel_export(output, location_id, period, start_date, end_date, batches=None, summary=None):
+    """Escribir el Excel de exportación en `output` fila por fila (modo write-only).
+
+    Las filas se leen del cursor por lotes y se escriben con estilo directamente,
+    sin DataFrame ni segunda pasada sobre las celdas; la memoria no depende del
+    número de filas. Devuelve el número de filas exportadas (0 = sin datos, no
+    se escribe nada).
+
+    `summary` (de get_export_summary) evita volver a consultar la ubicación y
+    calcular las estadísticas fila por fila.
+    """
+    if batches is None:
+        batches = iter_historical_rows(
+            location_id=location_id,
+            start_date=start_date.isoformat(),
+            end_date=end_date.isoformat()
+        )
+    batches = iter(batches)
+
+    first_batch = next(batches, None)
+    if not first_batch:
+        return 0
+
+    location_info = summary if summary is not None else get_location_info(location_id)
+    location_name = location_info['name'] if location_info else location_id
+    latitude = location_info['latitude'] if location_info else 'N/A'
+    longitude = location_info['longitude'] if location_info else 'N/A'
+
+    headers = [COLUMN_NAMES.get(col, col) for col in DATA_COLUMNS]
+    ts_idx = DATA_COLUMNS.index('timestamp')
+    stats_idx = {col: DATA_COLUMNS.index(col) for col in STATS_COLUMNS}
+    stats = {col: RunningStats() for col in STATS_COLUMNS}
+    if summary is not None:
+        # Estadísticas ya calculadas en la consulta agrupada
+        stats_idx = {}
+        for col, values in summary['stats'].items():
+            stats[col].count = values['count']
+            stats[col].mean = values['mean']
+            stats[col].min = values['min']
+            stats[col].max = values['max']
+            stats[col].m2 = values['m2']
+
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, Border, Side, NamedStyle
+    from openpyxl.utils import get_column_letter
+
+    thin = Side(style='thin')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    wb = Workbook(write_only=True)
+    data_style = NamedStyle(name='export_data', border=thin_border, alignment=Alignment(vertical='center'))
+    wb.add_named_style(data_style)
+
+    # Hoja de datos
+    worksheet = wb.create_sheet('Datos')
+
+    # Ancho de columna a partir de una muestra (se fija antes de escribir filas)
+    sample = first_batch[:WIDTH_SAMPLE_ROWS]
+    for col_idx, header in enumerate(headers):
+        if col_idx == ts_idx:
+            max_length = len('YYYY-MM-DD HH:MM:SS')
+        else:
+            max_length = max((len(str(row[col_idx])) for row in sample), default=0)
+        max_length = max(max_length, len(header))
+        worksheet.column_dimensions[get_column_letter(col_idx + 1)].width = min(max_length + 2, 50)
+
+    header_alignment = Alignment(horizontal='center', vertical='center')
+    header_row = _header_cells(worksheet, headers, header_alignment)
+    for cell in header_row:
+        cell.border = thin_border
+    worksheet.append(header_row)
+
+    total_rows = 0
+    batch = first_batch
+    while batch:
+        for row in batch:
+            for col, idx in stats_idx.items():
+                stats[col].add(row[idx])
+
+            values = list(row)
+            values[ts_idx] = format_timestamp(values[ts_idx])
+
+            cells = []
+            for value in values:
+                cell = WriteOnlyCell(worksheet, value=value)
+                cell.style = 'export_data'
+                cells.append(cell)
+            worksheet.append(cells)
+            total_rows += 1
+        batch = next(batches, None)
+
+    # Hoja de metadatos (se escribe al final para conocer el total de filas)
+    meta_sheet = wb.create_sheet('Metadatos')
+    meta_sheet.column_dimensions['A'].width = 30
+    meta_sheet.column_dimensions['B'].width = 80
+
+    title = WriteOnlyCell(meta_sheet, value='INFORMACIÓN DEL REPORTE')
+    title.font = Font(bold=True, size=14, color='4472C4')
+    section = WriteOnlyCell(meta_sheet, value='DESCRIPCIÓN DE CONTAMINANTES')
+    section.font = Font(bold=True, size=12, color='4472C4')
+
+    meta_data = [
+        [title],
+        [''],
+        ['Ubicación:', location_name],
+        ['ID Ubicación:', location_id],
+        ['Latitud:', latitude],
+        ['Longitud:', longitude],
+        [''],
+        ['Período:', period],
+        ['Fecha de inicio:', start_date.strftime('%Y-%m-%d %H:%M:%S')],
+        ['Fecha de fin:', end_date.strftime('%Y-%m-%d %H:%M:%S')],
+        ['Total de registros:', total_rows],
+        [''],
+        ['Fecha de generación:', datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
+        [''],
+        [section],
+        [''],
+    ] + POLLUTANT_DESCRIPTIONS
+
+    for row in meta_data:
+        meta_sheet.append(row)
+
+    # Hoja de estadísticas
+    stats_sheet = wb.create_sheet('Estadísticas')
+    for col in range(1, 6):
+        stats_sheet.column_dimensions[get_column_letter(col)].width = 25
+
+    stats_sheet.append(_header_cells(
+        stats_sheet,
+        ['Contaminante', 'Promedio', 'Mínimo', 'Máximo', 'Desv. Estándar'],
+        Alignment(horizontal='center')
+    ))
+    for col in STATS_COLUMNS:
+        col_stats = stats[col]
+        if col_stats.count > 0:
+            stats_sheet.append([
+                COLUMN_NAMES[col],
+                round(col_stats.mean, 2),
+                round(col_stats.min, 2),
+                round(col_stats.max, 2),
+                round(col_stats.std(), 2)
+            ])
+
+    wb.save(output)
+    return total_rows
+
+
+def write_export(output, location_id, period, export_format, start_date=None, end_date=None, summary=None):
+    """Escribir la exportación completa en un archivo binario, en cualquier formato.
+
+    Devuelve el número de filas exportadas (0 = sin datos).
+    """
+    if start_date is None or end_date is None:
+        start_date, end_date = export_window(period)
+
+    batches = open_export_batches(location_id, start_date, end_date)
+    if batches is None:
+        return 0
+
+    if export_format == 'xlsx':
+        return write_excel_export(output, location_id, period, start_date, end_date,
+                                  batches=batches, summary=summary)
+    if export_format == 'parquet':
+        return write_parquet_export(output, batches)
+
+    total_rows = 0
+
+    def counted(batches):
+        nonlocal total_rows
+        for batch in batches:
+            total_rows += len(batch)
+            yield batch
+
+    generator = iter_csv_export if export_format == 'csv' else iter_csv_gzip_export
+    for chunk in generator(counted(batches)):
+        output.write(chunk)
+    return total_rows
+
+
+def build_location_export(location_id, period, export_format, start_date, end_date, directory, summary=None):
+    """Generar el archivo de una ubicación en `directory` (se ejecuta en un proceso del pool)"""
+    extension = EXPORT_FORMATS[export_format][0]
+    path = os.path.join(directory, f"{location_id}.{extension}")
+    with open(path, 'wb') as output:
+        rows = write_export(output, location_id, period, export_format,
+                            start_date=start_date, end_date=end_date, summary=summary)
+    if not rows:
+        os.remove(path)
+        return location_id, None, 0
+    return location_id, path, rows
+
+
+def write_summary_csv(summary, period, start_date, end_date):
+    """Resumen por ubicación (metadatos y estadísticas) como texto CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['periodo', period, 'inicio', start_date.strftime('%Y-%m-%d %H:%M:%S'),
+                     'fin', end_date.strftime('%Y-%m-%d %H:%M:%S')])
+    header = ['location_id', 'location_name', 'latitude', 'longitude', 'total_registros']
+    for col in STATS_COLUMNS:
+        header += [f'{col}_promedio', f'{col}_min', f'{col}_max', f'{col}_desv_estandar']
+    writer.writerow(header)
+
+    for location_id, info in summary.items():
+        row = [location_id, info['name'], info['latitude'], info['longitude'], info['count']]
+        for col in STATS_COLUMNS:
+            col_stats = RunningStats()
+            values = info['stats'][col]
+            col_stats.count, col_stats.mean, col_stats.m2 = values['count'], values['mean'], values['m2']
+            if values['count']:
+                row += [round(values['mean'], 2), round(values['min'], 2),
+                        round(values['max'], 2), round(col_stats.std(), 2)]
+            else:
+                row += ['', '', '', '']
+        writer.writerow(row)
+    return buffer.getvalue()
@@ -1,14 +1,103 @@
 import sqlite3
 
-from datetime import datetime
+from datetime import datetime, timezone
+from decimal import Decimal
+import logging
 import os
+import threading
 import psycopg2
 
+from metrics import InstrumentedConnection
+from singleflight import coalesce
+from rolling_stats import RollingWindow, DISTRIBUTION_WINDOW_HOURS, hour_index
+from anomaly_detection import LocationDetector, ANOMALY_METRICS, ANOMALY_WARMUP, anomaly_detection_enabled
+from exceedances import (
+    EXCEEDANCE_POLLUTANTS, EXCEEDANCE_MIN_READINGS, WHO_24H_LIMITS, day_flags, local_day, split_range
+)
+
+# Pool de conexiones por proceso (se inicializa en cada worker del servidor WSGI)
+_connection_pool = None
+# Conexiones libres del pool: get_connection espera una en lugar de fallar
+_pool_slots = None
+# Segundos que get_connection espera una conexión libre del pool
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+
+
+class _PooledConnection:
+    """Conexión del pool: close() la devuelve al pool en lugar de cerrarla"""
+
+    def __init__(self, pool, conn, slots):
+        self._pool = pool
+        self._conn = conn
+        self._slots = slots
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._pool.putconn(self._conn)
+            finally:
+                self._conn = None
+                self._slots.release()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def sqlite_path(db_url):
+    """Ruta del archivo si DATABASE_URL es sqlite:///ruta (desarrollo y benchmarks)"""
+    if db_url and db_url.startswith('sqlite:///'):
+        return db_url[len('sqlite:///'):]
+    return None
+
+
+def init_connection_pool(minconn=1, maxconn=10):
+    """Crear el pool de conexiones del proceso actual (llamar después del fork)"""
+    global _connection_pool, _pool_slots
+    from psycopg2.pool import ThreadedConnectionPool
+
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        raise Exception("DATABASE_URL no está configurada")
+    if sqlite_path(db_url):
+        # SQLite abre un archivo local por conexión: no hay pool
+        return None
+
+    close_connection_pool()
+    _connection_pool = ThreadedConnectionPool(minconn, maxconn, db_url)
+    _pool_slots = threading.BoundedSemaphore(maxconn)
+    return _connection_pool
+
+
+def close_connection_pool():
+    """Cerrar todas las conexiones del pool del proceso actual"""
+    global _connection_pool, _pool_slots
+    if _connection_pool is not None:
+        _connection_pool.closeall()
+        _connection_pool = None
+        _pool_slots = None
+
+
 def get_connection():
+    # Los cursores de la conexión miden cada consulta (ver /api/metrics)
+    pool, slots = _connection_pool, _pool_slots
+    if pool is not None:
+        # getconn() lanza PoolError si el pool está agotado: se espera turno
+        # (hasta DB_POOL_TIMEOUT) y solo entonces se pide la conexión
+        if not slots.acquire(timeout=DB_POOL_TIMEOUT):
+            from psycopg2.pool import PoolError
+            raise PoolError(f"sin conexiones libres en el pool tras {DB_POOL_TIMEOUT:g} s")
+        try:
+            return InstrumentedConnection(_PooledConnection(pool, pool.getconn(), slots))
+        except Exception:
+            slots.release()
+            raise
     db_url = os.getenv("DATABASE_URL")
     if not db_url:
         raise Exception("DATABASE_URL no está configurada")
-    return psycopg2.connect(db_url)
+    path = sqlite_path(db_url)
+    if path:
+        return InstrumentedConnection(sqlite3.connect(path, timeout=30))
+    return InstrumentedConnection(psycopg2.connect(db_url))
 
 
 
@@ -19,6 +108,36 @@ def create_database():
     if not os.path.exists('data'):
         os.makedirs('data')
     
+    _create_schema()
+    print("Base de datos creada exitosamente en: data/air_quality.db")
+
+# Bases (DATABASE_URL) cuyo esquema ya se verificó en este proceso
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def ensure_schema():
+    """Crear las tablas que falten y poblar los agregados vacíos, una vez por proceso.
+
+    Lo llaman todos los modos al arrancar (scheduler, api, serve, both): una
+    base creada con una versión anterior (p. ej. data/air_quality.db) recibe
+    las tablas nuevas antes de la primera ingesta o consulta. Es idempotente
+    y barato si el esquema ya está completo.
+    """
+    db_url = os.getenv("DATABASE_URL")
+    if db_url in _schema_ready:
+        return
+    with _schema_lock:
+        if db_url in _schema_ready:
+            return
+        path = sqlite_path(db_url)
+        if path and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        _create_schema()
+        _schema_ready.add(db_url)
+
+def _create_schema():
+    """CREATE TABLE/INDEX IF NOT EXISTS de todas las tablas y relleno de los agregados que falten"""
+    
 
     ##local
     # Conectar a la base de datos (se crea si no existe)
@@ -29,46 +148,728 @@ def create_database():
     conn = get_connection()
     cursor = conn.cursor()
 
+    try:
+        # Crear tabla para datos de calidad del aire
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS air_quality_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location_id TEXT NOT NULL,
+            location_name TEXT NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            timestamp DATETIME NOT NULL,
+            pm2_5 REAL,
+            pm10 REAL,
+            o3 REAL,
+            no2 REAL,
+            aqi INTEGER,
+            temperature REAL,
+            humidity REAL,
+            pressure REAL,
+            wind_speed REAL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(location_id, timestamp)
+        )
+        ''')
+    
+        # Crear índices para búsquedas rápidas
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_location_timestamp 
+        ON air_quality_data(location_id, timestamp)
+        ''')
+    
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_timestamp 
+        ON air_quality_data(timestamp)
+        ''')
+    
+        # Tabla de contadores por ubicación (mantenida por la ingesta)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS location_stats (
+            location_id TEXT PRIMARY KEY,
+            location_name TEXT NOT NULL,
+            latitude REAL,
+            longitude REAL,
+            data_count INTEGER NOT NULL DEFAULT 0,
+            first_timestamp DATETIME,
+            last_timestamp DATETIME,
+            last_collection_at DATETIME,
+            last_collection_success INTEGER,
+            last_collection_error TEXT,
+            revision INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        # Bases creadas antes de que existiera la columna
+        _add_missing_columns(cursor, 'location_stats', {'revision': 'INTEGER NOT NULL DEFAULT 0'})
+    
+        # Ventanas móviles por ubicación (mantenidas por la ingesta, ver rolling_stats.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS location_rolling_stats (
+            location_id TEXT PRIMARY KEY,
+            window_end DATETIME,
+            pm25_sum_24h REAL,
+            pm25_count_24h INTEGER,
+            pm25_mean_24h REAL,
+            pm10_sum_24h REAL,
+            pm10_count_24h INTEGER,
+            pm10_mean_24h REAL,
+            pm25_nowcast REAL,
+            pm10_nowcast REAL,
+            aqi_1_7d INTEGER,
+            aqi_2_7d INTEGER,
+            aqi_3_7d INTEGER,
+            aqi_4_7d INTEGER,
+            aqi_5_7d INTEGER,
+            state TEXT,
+            updated_at DATETIME
+        )
+        ''')
+    
+        # Detector de anomalías: estado por ubicación y lecturas marcadas o en cuarentena
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS anomaly_detector_state (
+            location_id TEXT PRIMARY KEY,
+            state TEXT,
+            updated_at DATETIME
+        )
+        ''')
+    
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reading_anomalies (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            location_id TEXT NOT NULL,
+            timestamp DATETIME NOT NULL,
+            metric TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            value REAL,
+            expected REAL,
+            score REAL,
+            quarantined INTEGER NOT NULL DEFAULT 0,
+            detected_at DATETIME,
+            UNIQUE(location_id, timestamp, metric, kind)
+        )
+        ''')
+    
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_anomalies_timestamp 
+        ON reading_anomalies(timestamp)
+        ''')
+    
+        # Superación de guías OMS 24 h: agregados por día local y acumulados por mes/año
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_exceedances (
+            location_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            pm2_5_sum REAL NOT NULL DEFAULT 0,
+            pm2_5_count INTEGER NOT NULL DEFAULT 0,
+            pm2_5_exceeds INTEGER NOT NULL DEFAULT 0,
+            pm10_sum REAL NOT NULL DEFAULT 0,
+            pm10_count INTEGER NOT NULL DEFAULT 0,
+            pm10_exceeds INTEGER NOT NULL DEFAULT 0,
+            no2_sum REAL NOT NULL DEFAULT 0,
+            no2_count INTEGER NOT NULL DEFAULT 0,
+            no2_exceeds INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (location_id, day)
+        )
+        ''')
+    
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS exceedance_rollups (
+            location_id TEXT NOT NULL,
+            pollutant TEXT NOT NULL,
+            period TEXT NOT NULL,
+            period_key TEXT NOT NULL,
+            exceedance_days INTEGER NOT NULL DEFAULT 0,
+            complete_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (location_id, pollutant, period, period_key)
+        )
+        ''')
+    
+        # Confirmar cambios
+        conn.commit()
+    finally:
+        conn.close()
+    
+    # Poblar contadores a partir de los datos ya existentes (solo lo que falta)
+    rebuild_location_stats(only_missing=True)
+    rebuild_rolling_stats(only_missing=True)
+    rebuild_exceedances(only_if_empty=True)
+
+def _add_missing_columns(cursor, table, columns):
+    """ALTER TABLE ADD COLUMN de las columnas {nombre: tipo} que la tabla aún no tiene"""
+    cursor.execute(f"SELECT * FROM {table} LIMIT 0")
+    existing = {description[0] for description in cursor.description}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+def rebuild_location_stats(only_missing=False):
+    """Recalcular location_stats desde air_quality_data (uso puntual, no por petición).
+
+    Con only_missing solo las ubicaciones sin datos en location_stats.
+    """
     
-    # Crear tabla para datos de calidad del aire
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        query = '''
+        SELECT location_id, MAX(location_name), MAX(latitude), MAX(longitude),
+               COUNT(*), MIN(timestamp), MAX(timestamp)
+        FROM air_quality_data 
+        '''
+        if only_missing:
+            query += ''' WHERE location_id NOT IN (
+          SELECT location_id FROM location_stats WHERE last_timestamp IS NOT NULL)
+        '''
+        cursor.execute(query + "GROUP BY location_id")
+        rows = cursor.fetchall()
+        
+        for row in rows:
+            cursor.execute('''
+            INSERT INTO location_stats
+            (location_id, location_name, latitude, longitude, 
+             data_count, first_timestamp, last_timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(location_id) DO UPDATE SET
+              location_name = excluded.location_name,
+              latitude = excluded.latitude,
+              longitude = excluded.longitude,
+              data_count = excluded.data_count,
+              first_timestamp = excluded.first_timestamp,
+              last_timestamp = excluded.last_timestamp,
+              revision = location_stats.revision + 1
+            ''', row)
+        
+        conn.commit()
+        return len(rows)
+    finally:
+        conn.close()
+
+def _update_location_stats(cursor, location_id, location_name, lat, lon, timestamp, new_rows):
+    """Actualizar contadores de una ubicación dentro de la transacción de ingesta.
+
+    `revision` sube con cada fila insertada o actualizada: a diferencia de
+    data_count y last_timestamp, también cambia cuando una corrección
+    reescribe valores de una fila existente.
+    """
     cursor.execute('''
-    CREATE TABLE IF NOT EXISTS air_quality_data (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        location_id TEXT NOT NULL,
-        location_name TEXT NOT NULL,
-        latitude REAL NOT NULL,
-        longitude REAL NOT NULL,
-        timestamp DATETIME NOT NULL,
-        pm2_5 REAL,
-        pm10 REAL,
-        o3 REAL,
-        no2 REAL,
-        aqi INTEGER,
-        temperature REAL,
-        humidity REAL,
-        pressure REAL,
-        wind_speed REAL,
-        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-        UNIQUE(location_id, timestamp)
-    )
-    ''')
-    
-    # Crear índices para búsquedas rápidas
+    INSERT INTO location_stats
+    (location_id, location_name, latitude, longitude, 
+     data_count, first_timestamp, last_timestamp, revision)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT(location_id) DO UPDATE SET
+      revision = location_stats.revision + 1,
+      location_name = excluded.location_name,
+      latitude = excluded.latitude,
+      longitude = excluded.longitude,
+      data_count = location_stats.data_count + excluded.data_count,
+      first_timestamp = CASE
+        WHEN location_stats.first_timestamp IS NULL 
+          OR excluded.first_timestamp < location_stats.first_timestamp
+        THEN excluded.first_timestamp ELSE location_stats.first_timestamp END,
+      last_timestamp = CASE
+        WHEN location_stats.last_timestamp IS NULL 
+          OR excluded.last_timestamp > location_stats.last_timestamp
+        THEN excluded.last_timestamp ELSE location_stats.last_timestamp END
+    ''', (location_id, location_name, lat, lon, new_rows, timestamp, timestamp))
+
+# Columnas de location_rolling_stats que se sirven (sin el estado interno)
+ROLLING_STATS_COLUMNS = (
+    'window_end', 'pm25_sum_24h', 'pm25_count_24h', 'pm25_mean_24h',
+    'pm10_sum_24h', 'pm10_count_24h', 'pm10_mean_24h', 'pm25_nowcast', 'pm10_nowcast',
+    'aqi_1_7d', 'aqi_2_7d', 'aqi_3_7d', 'aqi_4_7d', 'aqi_5_7d'
+)
+
+def _save_rolling_stats(cursor, location_id, window):
+    summary = window.summary()
+    if summary is None:
+        return
+    columns = ('location_id',) + ROLLING_STATS_COLUMNS + ('state', 'updated_at')
+    values = [location_id] + [summary[c] for c in ROLLING_STATS_COLUMNS] + [
+        window.to_json(), datetime.now(timezone.utc).isoformat(timespec='seconds')]
+    updates = ',\n      '.join(f"{c} = excluded.{c}" for c in columns[1:])
+    cursor.execute(f'''
+    INSERT INTO location_rolling_stats ({', '.join(columns)})
+    VALUES ({', '.join('?' for _ in columns)})
+    ON CONFLICT(location_id) DO UPDATE SET
+      {updates}
+    ''', values)
+
+def _update_rolling_stats(cursor, location_id, timestamp, previous, stored):
+    """Llevar una lectura a la ventana móvil de su ubicación (dentro de la transacción de ingesta).
+
+    `previous` son los valores que la fila tenía antes (todos None si es
+    nueva) y `stored` los que quedaron: se resta lo anterior y se suma lo nuevo.
+    """
+    cursor.execute('SELECT state FROM location_rolling_stats WHERE location_id = ?', (location_id,))
+    row = cursor.fetchone()
+    window = RollingWindow.from_json(row[0] if row else None)
+    removed = window.newest_hour is not None and window.remove(
+        timestamp, previous['pm2_5'], previous['pm10'], previous['aqi'])
+    if window.add(timestamp, stored['pm2_5'], stored['pm10'], stored['aqi']) or removed:
+        _save_rolling_stats(cursor, location_id, window)
+
+def rebuild_rolling_stats(only_missing=False):
+    """Recalcular location_rolling_stats desde los últimos 7 días de cada ubicación (uso puntual)"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        query = '''
+        SELECT s.location_id, s.last_timestamp FROM location_stats s
+        WHERE s.last_timestamp IS NOT NULL
+        '''
+        if only_missing:
+            query += ''' AND NOT EXISTS (
+              SELECT 1 FROM location_rolling_stats r WHERE r.location_id = s.location_id)'''
+        cursor.execute(query)
+        locations = cursor.fetchall()
+        
+        for location_id, last_timestamp in locations:
+            window = RollingWindow()
+            since = datetime.fromtimestamp(
+                (hour_index(last_timestamp) - DISTRIBUTION_WINDOW_HOURS + 1) * 3600, timezone.utc)
+            cursor.execute('''
+            SELECT timestamp, pm2_5, pm10, aqi FROM air_quality_data
+            WHERE location_id = ? AND timestamp >= ?
+            ORDER BY timestamp
+            ''', (location_id, since.isoformat()))
+            for timestamp, pm2_5, pm10, aqi in cursor.fetchall():
+                window.add(timestamp, pm2_5, pm10, aqi)
+            _save_rolling_stats(cursor, location_id, window)
+        
+        conn.commit()
+        return len(locations)
+    finally:
+        conn.close()
+
+@coalesce
+def get_rolling_stats(location_id=None):
+    """Ventanas móviles precalculadas (una fila por ubicación, sin recorrer el histórico)"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = f"SELECT location_id, {', '.join(ROLLING_STATS_COLUMNS)} FROM location_rolling_stats"
+        params = []
+        if location_id:
+            query += " WHERE location_id = ?"
+            params.append(location_id)
+        query += " ORDER BY location_id"
+    
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return results
+
+def _load_detector(cursor, location_id, before):
+    """Estado del detector; sin estado guardado se aprende de las últimas lecturas"""
+    cursor.execute('SELECT state FROM anomaly_detector_state WHERE location_id = ?', (location_id,))
+    row = cursor.fetchone()
+    if row:
+        return LocationDetector.from_json(row[0])
+    
+    detector = LocationDetector()
     cursor.execute('''
-    CREATE INDEX IF NOT EXISTS idx_location_timestamp 
-    ON air_quality_data(location_id, timestamp)
-    ''')
+    SELECT timestamp, pm2_5, pm10, o3, no2 FROM air_quality_data
+    WHERE location_id = ? AND timestamp < ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+    ''', (location_id, before, ANOMALY_WARMUP * 2))
+    for timestamp, *values in reversed(cursor.fetchall()):
+        detector.check(timestamp, dict(zip(ANOMALY_METRICS, values)))
+    return detector
+
+def _screen_reading(cursor, location_id, timestamp, values):
+    """Evaluar una lectura nueva con el detector de su ubicación (dentro de la transacción de ingesta)"""
+    detector = _load_detector(cursor, location_id, timestamp)
+    anomalies = detector.check(timestamp, values)
+    cursor.execute('''
+    INSERT INTO anomaly_detector_state (location_id, state, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(location_id) DO UPDATE SET
+      state = excluded.state,
+      updated_at = excluded.updated_at
+    ''', (location_id, detector.to_json(), datetime.now(timezone.utc).isoformat(timespec='seconds')))
+    return anomalies
+
+def _quarantined_metrics(cursor, location_id, timestamp):
+    """Métricas de una lectura que quedaron en cuarentena al ingerirla por primera vez"""
+    cursor.execute('''
+    SELECT DISTINCT metric FROM reading_anomalies
+    WHERE location_id = ? AND timestamp = ? AND quarantined = 1
+    ''', (location_id, timestamp))
+    return {row[0] for row in cursor.fetchall()}
+
+def _record_anomalies(cursor, location_id, timestamp, anomalies):
+    detected_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    for anomaly in anomalies:
+        cursor.execute('''
+        INSERT INTO reading_anomalies
+        (location_id, timestamp, metric, kind, value, expected, score, quarantined, detected_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(location_id, timestamp, metric, kind) DO NOTHING
+        ''', (location_id, timestamp, anomaly['metric'], anomaly['kind'], anomaly['value'],
+              anomaly['expected'], anomaly['score'], 1 if anomaly['quarantined'] else 0, detected_at))
+
+@coalesce
+def get_anomaly_counts(since=None):
+    """Anomalías por ubicación y tipo (lecturas con timestamp >= since)"""
     
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = '''
+        SELECT location_id, kind, COUNT(*), SUM(quarantined), MAX(timestamp)
+        FROM reading_anomalies
+        '''
+        params = []
+        if since:
+            query += " WHERE timestamp >= ?"
+            params.append(since)
+        query += " GROUP BY location_id, kind ORDER BY location_id, kind"
+    
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    return [{'location_id': r[0], 'kind': r[1], 'count': r[2], 'quarantined': r[3] or 0,
+             'last_timestamp': r[4]} for r in rows]
+
+def get_anomalies(location_id, since=None, limit=100):
+    """Anomalías de una ubicación, de la más reciente a la más antigua"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = '''
+        SELECT timestamp, metric, kind, value, expected, score, quarantined, detected_at
+        FROM reading_anomalies
+        WHERE location_id = ?
+        '''
+        params = [location_id]
+        if since:
+            query += " AND timestamp >= ?"
+            params.append(since)
+        query += " ORDER BY timestamp DESC LIMIT ?"
+        params.append(limit)
+    
+        cursor.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        conn.close()
+    return results
+
+def _add_exceedance_rollups(cursor, location_id, pollutant, day, complete_delta, exceedance_delta):
+    """Sumar el cambio de un día a los acumulados de su mes y su año"""
+    for period, period_key in (('month', day[:7]), ('year', day[:4])):
+        cursor.execute('''
+        INSERT INTO exceedance_rollups
+        (location_id, pollutant, period, period_key, exceedance_days, complete_days)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(location_id, pollutant, period, period_key) DO UPDATE SET
+          exceedance_days = exceedance_rollups.exceedance_days + excluded.exceedance_days,
+          complete_days = exceedance_rollups.complete_days + excluded.complete_days
+        ''', (location_id, pollutant, period, period_key, exceedance_delta, complete_delta))
+
+def _update_exceedances(cursor, location_id, timestamp, previous, stored):
+    """Llevar una lectura a su día y, si cambia la marca del día, a los acumulados.
+
+    Como en _update_rolling_stats, se resta lo que la fila aportaba antes
+    (`previous`, todo None si es nueva) y se suma lo que quedó (`stored`).
+    """
+    day = local_day(timestamp, BOGOTA_UTC_OFFSET_HOURS)
     cursor.execute('''
-    CREATE INDEX IF NOT EXISTS idx_timestamp 
-    ON air_quality_data(timestamp)
-    ''')
+    SELECT pm2_5_sum, pm2_5_count, pm10_sum, pm10_count, no2_sum, no2_count
+    FROM daily_exceedances WHERE location_id = ? AND day = ?
+    ''', (location_id, day))
+    row = cursor.fetchone() or (0, 0, 0, 0, 0, 0)
     
-    # Confirmar cambios
-    conn.commit()
-    conn.close()
+    totals = []
+    changed = False
+    for i, pollutant in enumerate(EXCEEDANCE_POLLUTANTS):
+        total, count = row[2 * i], row[2 * i + 1]
+        old = day_flags(total, count, WHO_24H_LIMITS[pollutant])
+        if previous[pollutant] != stored[pollutant]:
+            if previous[pollutant] is not None:
+                total, count = total - float(previous[pollutant]), count - 1
+            if stored[pollutant] is not None:
+                total, count = total + float(stored[pollutant]), count + 1
+            changed = True
+        new = day_flags(total, count, WHO_24H_LIMITS[pollutant])
+        totals.extend([total, count, new[1]])
+        if new != old:
+            _add_exceedance_rollups(cursor, location_id, pollutant, day, new[0] - old[0], new[1] - old[1])
+    if not changed:
+        return
     
-    print("Base de datos creada exitosamente en: data/air_quality.db")
+    cursor.execute('''
+    INSERT INTO daily_exceedances
+    (location_id, day, pm2_5_sum, pm2_5_count, pm2_5_exceeds, pm10_sum, pm10_count, pm10_exceeds,
+     no2_sum, no2_count, no2_exceeds)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(location_id, day) DO UPDATE SET
+      pm2_5_sum = excluded.pm2_5_sum,
+      pm2_5_count = excluded.pm2_5_count,
+      pm2_5_exceeds = excluded.pm2_5_exceeds,
+      pm10_sum = excluded.pm10_sum,
+      pm10_count = excluded.pm10_count,
+      pm10_exceeds = excluded.pm10_exceeds,
+      no2_sum = excluded.no2_sum,
+      no2_count = excluded.no2_count,
+      no2_exceeds = excluded.no2_exceeds
+    ''', [location_id, day] + totals)
+
+def rebuild_exceedances(only_if_empty=False):
+    """Recalcular días y acumulados de superación desde air_quality_data (uso puntual)"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        if only_if_empty:
+            cursor.execute('SELECT 1 FROM daily_exceedances LIMIT 1')
+            if cursor.fetchone():
+                return 0
+        
+        # Un solo recorrido; el día local se calcula igual que en la ingesta
+        days = {}
+        cursor.execute('SELECT location_id, timestamp, pm2_5, pm10, no2 FROM air_quality_data')
+        while True:
+            rows = cursor.fetchmany(5000)
+            if not rows:
+                break
+            for location_id, timestamp, *values in rows:
+                key = (location_id, local_day(timestamp, BOGOTA_UTC_OFFSET_HOURS))
+                totals = days.get(key)
+                if totals is None:
+                    totals = days[key] = [0.0, 0] * len(EXCEEDANCE_POLLUTANTS)
+                for i, value in enumerate(values):
+                    if value is not None:
+                        totals[2 * i] += float(value)
+                        totals[2 * i + 1] += 1
+        
+        daily_rows = []
+        rollups = {}
+        for (location_id, day), totals in days.items():
+            row = [location_id, day]
+            for i, pollutant in enumerate(EXCEEDANCE_POLLUTANTS):
+                complete, exceeds = day_flags(totals[2 * i], totals[2 * i + 1], WHO_24H_LIMITS[pollutant])
+                row.extend([totals[2 * i], totals[2 * i + 1], exceeds])
+                for period, period_key in (('month', day[:7]), ('year', day[:4])):
+                    counts = rollups.setdefault((location_id, pollutant, period, period_key), [0, 0])
+                    counts[0] += exceeds
+                    counts[1] += complete
+            daily_rows.append(row)
+        
+        cursor.execute('DELETE FROM daily_exceedances')
+        cursor.execute('DELETE FROM exceedance_rollups')
+        cursor.executemany('''
+        INSERT INTO daily_exceedances
+        (location_id, day, pm2_5_sum, pm2_5_count, pm2_5_exceeds, pm10_sum, pm10_count, pm10_exceeds,
+         no2_sum, no2_count, no2_exceeds)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', daily_rows)
+        cursor.executemany('''
+        INSERT INTO exceedance_rollups
+        (location_id, pollutant, period, period_key, exceedance_days, complete_days)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', [key + tuple(counts) for key, counts in rollups.items()])
+        
+        conn.commit()
+        return len(daily_rows)
+    finally:
+        conn.close()
+
+@coalesce
+def get_exceedance_counts(start_day, end_day, location_id=None):
+    """Días completos y días sobre la guía OMS por ubicación y contaminante en [start_day, end_day].
+
+    Los extremos se suman desde daily_exceedances y los meses/años completos
+    desde exceedance_rollups: el número de consultas no depende del largo del rango.
+    Devuelve {location_id: {contaminante: {'exceedance_days', 'complete_days'}}}.
+    """
+    day_ranges, months, years = split_range(start_day, end_day)
+    results = {}
+    
+    def add(location, pollutant, exceedance_days, complete_days):
+        counts = results.setdefault(location, {
+            p: {'exceedance_days': 0, 'complete_days': 0} for p in EXCEEDANCE_POLLUTANTS
+        })[pollutant]
+        counts['exceedance_days'] += int(exceedance_days or 0)
+        counts['complete_days'] += int(complete_days or 0)
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        location_filter = " AND location_id = ?" if location_id else ""
+        for first, last in day_ranges:
+            params = [EXCEEDANCE_MIN_READINGS] * 3 + [first, last]
+            if location_id:
+                params.append(location_id)
+            cursor.execute(f'''
+            SELECT location_id,
+                   SUM(pm2_5_exceeds), SUM(CASE WHEN pm2_5_count >= ? THEN 1 ELSE 0 END),
+                   SUM(pm10_exceeds), SUM(CASE WHEN pm10_count >= ? THEN 1 ELSE 0 END),
+                   SUM(no2_exceeds), SUM(CASE WHEN no2_count >= ? THEN 1 ELSE 0 END)
+            FROM daily_exceedances
+            WHERE day BETWEEN ? AND ?{location_filter}
+            GROUP BY location_id
+            ''', params)
+            for location, *sums in cursor.fetchall():
+                for i, pollutant in enumerate(EXCEEDANCE_POLLUTANTS):
+                    add(location, pollutant, sums[2 * i], sums[2 * i + 1])
+        
+        for period, keys in (('month', months), ('year', years)):
+            if not keys:
+                continue
+            params = [period] + keys
+            if location_id:
+                params.append(location_id)
+            cursor.execute(f'''
+            SELECT location_id, pollutant, SUM(exceedance_days), SUM(complete_days)
+            FROM exceedance_rollups
+            WHERE period = ? AND period_key IN ({', '.join('?' for _ in keys)}){location_filter}
+            GROUP BY location_id, pollutant
+            ''', params)
+            for location, pollutant, exceedance_days, complete_days in cursor.fetchall():
+                if pollutant in WHO_24H_LIMITS:
+                    add(location, pollutant, exceedance_days, complete_days)
+    finally:
+        conn.close()
+    
+    return results
+
+def get_daily_exceedances(location_id, start_day, end_day):
+    """Promedio, lecturas y marca de cada día local de una ubicación"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+        SELECT day, pm2_5_sum, pm2_5_count, pm2_5_exceeds, pm10_sum, pm10_count, pm10_exceeds,
+               no2_sum, no2_count, no2_exceeds
+        FROM daily_exceedances
+        WHERE location_id = ? AND day BETWEEN ? AND ?
+        ORDER BY day
+        ''', (location_id, start_day, end_day))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
+    
+    results = []
+    for day, *values in rows:
+        entry = {'day': day}
+        for i, pollutant in enumerate(EXCEEDANCE_POLLUTANTS):
+            total, count, exceeds = values[3 * i:3 * i + 3]
+            entry[pollutant] = {
+                'mean': round(total / count, 2) if count else None,
+                'readings': count,
+                'complete': count >= EXCEEDANCE_MIN_READINGS,
+                'exceeds': bool(exceeds)
+            }
+        results.append(entry)
+    return results
+
+def record_collection_outcome(location_id, location_name, success, error=None, lat=None, lon=None):
+    """Registrar el resultado de la última recolección de una ubicación"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+        INSERT INTO location_stats
+        (location_id, location_name, latitude, longitude, 
+         last_collection_at, last_collection_success, last_collection_error)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(location_id) DO UPDATE SET
+          last_collection_at = excluded.last_collection_at,
+          last_collection_success = excluded.last_collection_success,
+          last_collection_error = excluded.last_collection_error
+        ''', (location_id, location_name, lat, lon,
+              datetime.now(timezone.utc).isoformat(timespec='seconds'),
+              1 if success else 0, error))
+        
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        print(f"Error al registrar recolección: {e}")
+        return False
+    finally:
+        conn.close()
+
+@coalesce
+def get_location_stats():
+    """Obtener contadores por ubicación (O(ubicaciones), sin recorrer el histórico)"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+        SELECT * FROM location_stats 
+        ORDER BY location_name
+        ''')
+        rows = cursor.fetchall()
+    
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in rows]
+    finally:
+        conn.close()
+    return results
+
+def get_data_version(location_id=None):
+    """Versión de los datos (cambia con cada fila insertada o actualizada); sin location_id cubre todas las ubicaciones"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        query = "SELECT SUM(data_count), MAX(last_timestamp), SUM(revision) FROM location_stats"
+        params = []
+        if location_id:
+            query += " WHERE location_id = ?"
+            params.append(location_id)
+    
+        cursor.execute(query, params)
+        count, last_timestamp, revision = cursor.fetchone()
+    finally:
+        conn.close()
+    
+    return f"{count or 0}:{last_timestamp or ''}:{revision or 0}"
+
+# Funciones llamadas con cada lectura guardada por insert_air_quality_data
+# (dict con las columnas de air_quality_data); las usa la caché en memoria del API
+_ingest_listeners = []
+
+def add_ingest_listener(listener):
+    _ingest_listeners.append(listener)
+
+def remove_ingest_listener(listener):
+    if listener in _ingest_listeners:
+        _ingest_listeners.remove(listener)
+
+def _notify_ingest(row):
+    for listener in _ingest_listeners:
+        try:
+            listener(row)
+        except Exception as e:
+            print(f"Error notificando lectura guardada: {e}")
+
+# Columnas de air_quality_data que alimentan los agregados incrementales
+AGGREGATED_COLUMNS = ('pm2_5', 'pm10', 'o3', 'no2', 'aqi')
 
 def insert_air_quality_data(location_id, location_name, lat, lon, timestamp, 
                            pm2_5, pm10, o3, no2, aqi, temp=None, humidity=None, 
@@ -84,6 +885,30 @@ def insert_air_quality_data(location_id, location_name, lat, lon, timestamp,
 
     
     try:
+        # ¿Es una fila nueva o una actualización de una existente? (y sus valores actuales)
+        cursor.execute(
+            'SELECT pm2_5, pm10, o3, no2, aqi FROM air_quality_data WHERE location_id = ? AND timestamp = ?',
+            (location_id, timestamp)
+        )
+        row = cursor.fetchone()
+        is_new = row is None
+        previous = dict(zip(AGGREGATED_COLUMNS, row or (None,) * len(AGGREGATED_COLUMNS)))
+        
+        # Detector de anomalías: las lecturas nuevas se evalúan y los valores en
+        # cuarentena no se guardan aquí. Una re-ingesta (p. ej. el backfill) no
+        # se vuelve a evaluar, pero lo que quedó en cuarentena sigue fuera
+        anomalies = []
+        if anomaly_detection_enabled():
+            values = {'pm2_5': pm2_5, 'pm10': pm10, 'o3': o3, 'no2': no2}
+            if is_new:
+                anomalies = _screen_reading(cursor, location_id, timestamp, values)
+                quarantined = {a['metric'] for a in anomalies if a['quarantined']}
+            else:
+                quarantined = _quarantined_metrics(cursor, location_id, timestamp)
+            for metric in quarantined:
+                values[metric] = None
+            pm2_5, pm10, o3, no2 = values['pm2_5'], values['pm10'], values['o3'], values['no2']
+        
         cursor.execute('''
         INSERT INTO air_quality_data
         (location_id, location_name, latitude, longitude, timestamp, 
@@ -105,7 +930,29 @@ def insert_air_quality_data(location_id, location_name, lat, lon, timestamp,
         ''', (location_id, location_name, lat, lon, timestamp, 
               pm2_5, pm10, o3, no2, aqi, temp, humidity, pressure, wind_speed))
         
+        _update_location_stats(cursor, location_id, location_name, lat, lon,
+                               timestamp, 1 if is_new else 0)
+        # Valores que quedaron en la fila (el UPSERT no pisa con None). Una
+        # actualización que los cambia resta lo que la fila aportaba antes
+        incoming = {'pm2_5': pm2_5, 'pm10': pm10, 'o3': o3, 'no2': no2, 'aqi': aqi}
+        stored = {c: previous[c] if incoming[c] is None else incoming[c] for c in AGGREGATED_COLUMNS}
+        if is_new or stored != previous:
+            _update_rolling_stats(cursor, location_id, timestamp, previous, stored)
+            _update_exceedances(cursor, location_id, timestamp, previous, stored)
+        if anomalies:
+            _record_anomalies(cursor, location_id, timestamp, anomalies)
+            logging.warning(f"Anomalías en {location_id} {timestamp}: " + ', '.join(
+                f"{a['metric']} {a['kind']}{' (cuarentena)' if a['quarantined'] else ''}" for a in anomalies))
+        
         conn.commit()
+        if _ingest_listeners:
+            _notify_ingest({
+                'id': None, 'location_id': location_id, 'location_name': location_name,
+                'latitude': lat, 'longitude': lon, 'timestamp': timestamp,
+                'pm2_5': pm2_5, 'pm10': pm10, 'o3': o3, 'no2': no2, 'aqi': aqi,
+                'temperature': temp, 'humidity': humidity, 'pressure': pressure,
+                'wind_speed': wind_speed, 'created_at': None
+            })
         return True
     except sqlite3.Error as e:
         print(f"Error al insertar datos: {e}")
@@ -113,6 +960,7 @@ def insert_air_quality_data(location_id, location_name, lat, lon, timestamp,
     finally:
         conn.close()
 
+@coalesce
 def get_historical_data(location_id=None, start_date=None, end_date=None, limit=None):
     """Obtener datos históricos de la base de datos"""
     ##local
@@ -122,8 +970,58 @@ def get_historical_data(location_id=None, start_date=None, end_date=None, limit=
     conn = get_connection()
     cursor = conn.cursor()
 
+    try:
+        query = "SELECT * FROM air_quality_data WHERE 1=1"
+        params = []
+    
+        if location_id:
+            query += " AND location_id = ?"
+            params.append(location_id)
+    
+        if start_date:
+            query += " AND timestamp >= ?"
+            params.append(start_date)
+    
+        if end_date:
+            query += " AND timestamp <= ?"
+            params.append(end_date)
+    
+        query += " ORDER BY timestamp DESC"
+    
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
     
-    query = "SELECT * FROM air_quality_data WHERE 1=1"
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+    
+        # Convertir a lista de diccionarios
+        columns = [description[0] for description in cursor.description]
+        results = []
+        for row in rows:
+            results.append(dict(zip(columns, row)))
+    finally:
+        conn.close()
+    return results
+
+# Columnas de air_quality_data en el orden de la tabla
+DATA_COLUMNS = (
+    'id', 'location_id', 'location_name', 'latitude', 'longitude', 'timestamp',
+    'pm2_5', 'pm10', 'o3', 'no2', 'aqi',
+    'temperature', 'humidity', 'pressure', 'wind_speed', 'created_at'
+)
+
+def iter_historical_rows(location_id=None, start_date=None, end_date=None, batch_size=1000):
+    """Recorrer datos históricos por lotes de tuplas (orden DATA_COLUMNS) sin cargarlos todos"""
+    
+    conn = get_connection()
+    try:
+        # En PostgreSQL un cursor con nombre mantiene los resultados en el servidor
+        cursor = conn.cursor(name='historical_stream')
+    except TypeError:
+        cursor = conn.cursor()
+    
+    query = f"SELECT {', '.join(DATA_COLUMNS)} FROM air_quality_data WHERE 1=1"
     params = []
     
     if location_id:
@@ -140,22 +1038,116 @@ def get_historical_data(location_id=None, start_date=None, end_date=None, limit=
     
     query += " ORDER BY timestamp DESC"
     
-    if limit:
-        query += " LIMIT ?"
-        params.append(limit)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def get_location_info(location_id):
+    """Nombre y coordenadas de una ubicación (desde location_stats)"""
+    
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            'SELECT location_name, latitude, longitude FROM location_stats WHERE location_id = ?',
+            (location_id,)
+        )
+        row = cursor.fetchone()
+    finally:
+        conn.close()
     
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
+    if row:
+        return {'name': row[0], 'latitude': row[1], 'longitude': row[2]}
+    return None
+
+@coalesce
+def get_export_summary(start_date, end_date):
+    """Metadatos y estadísticas de PM2.5, PM10 y AQI de todas las ubicaciones en una consulta agrupada"""
     
-    # Convertir a lista de diccionarios
-    columns = [description[0] for description in cursor.description]
-    results = []
-    for row in rows:
-        results.append(dict(zip(columns, row)))
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        metrics = ('pm2_5', 'pm10', 'aqi')
+        select_metrics = ",\n        ".join(
+            f"COUNT({m}), AVG({m}), MIN({m}), MAX({m}), SUM({m} * {m})" for m in metrics
+        )
+        cursor.execute(f'''
+        SELECT 
+            location_id, MAX(location_name), MAX(latitude), MAX(longitude), COUNT(*),
+            {select_metrics}
+        FROM air_quality_data 
+        WHERE timestamp >= ? 
+        AND timestamp <= ?
+        GROUP BY location_id
+        ORDER BY location_id
+        ''', (start_date, end_date))
+        rows = cursor.fetchall()
+    finally:
+        conn.close()
     
-    conn.close()
+    summary = {}
+    for row in rows:
+        stats = {}
+        for i, metric in enumerate(metrics):
+            count, avg, min_value, max_value, sum_sq = (
+                float(v) if isinstance(v, Decimal) else v for v in row[5 + i * 5: 10 + i * 5]
+            )
+            # Suma de cuadrados de las desviaciones (para la desviación estándar)
+            m2 = max((sum_sq or 0) - count * (avg or 0) ** 2, 0.0) if count else 0.0
+            stats[metric] = {
+                'count': count,
+                'mean': avg,
+                'min': min_value,
+                'max': max_value,
+                'm2': m2
+            }
+        summary[row[0]] = {
+            'name': row[1],
+            'latitude': row[2],
+            'longitude': row[3],
+            'count': row[4],
+            'stats': stats
+        }
+    return summary
+
+@coalesce
+def get_latest_readings():
+    """Obtener la lectura más reciente de cada ubicación en una sola consulta"""
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    try:
+        # location_stats ya guarda la última lectura de cada ubicación (se
+        # actualiza en la misma transacción que la inserta): una búsqueda por
+        # clave única en air_quality_data por ubicación, sin recorrer el índice.
+        # CROSS JOIN fija el orden en SQLite (sin él recorre air_quality_data);
+        # en PostgreSQL equivale a un JOIN normal.
+        cursor.execute('''
+        SELECT a.* 
+        FROM location_stats s
+        CROSS JOIN air_quality_data a
+        WHERE a.location_id = s.location_id 
+        AND a.timestamp = s.last_timestamp
+        ORDER BY a.location_name
+        ''')
+        rows = cursor.fetchall()
+
+        columns = [description[0] for description in cursor.description]
+        results = [dict(zip(columns, row)) for row in rows]
+    finally:
+        conn.close()
     return results
 
+@coalesce
 def get_monthly_statistics(location_id, year, month):
     """Obtener estadísticas mensuales para boxplots"""
     
@@ -165,30 +1157,115 @@ def get_monthly_statistics(location_id, year, month):
     conn = get_connection()
     cursor = conn.cursor()
 
+    try:
+        cursor.execute('''
+        SELECT 
+            COUNT(*) as count,
+            AVG(pm2_5) as avg_pm25,
+            MIN(pm2_5) as min_pm25,
+            MAX(pm2_5) as max_pm25,
+            AVG(pm10) as avg_pm10,
+            MIN(pm10) as min_pm10,
+            MAX(pm10) as max_pm10
+        FROM air_quality_data 
+        WHERE location_id = ? 
+        AND strftime('%Y', timestamp) = ? 
+        AND strftime('%m', timestamp) = ?
+        ''', (location_id, str(year), f"{month:02d}"))
     
-    cursor.execute('''
-    SELECT 
-        COUNT(*) as count,
-        AVG(pm2_5) as avg_pm25,
-        MIN(pm2_5) as min_pm25,
-        MAX(pm2_5) as max_pm25,
-        AVG(pm10) as avg_pm10,
-        MIN(pm10) as min_pm10,
-        MAX(pm10) as max_pm10
-    FROM air_quality_data 
-    WHERE location_id = ? 
-    AND strftime('%Y', timestamp) = ? 
-    AND strftime('%m', timestamp) = ?
-    ''', (location_id, str(year), f"{month:02d}"))
-    
-    result = cursor.fetchone()
-    conn.close()
+        result = cursor.fetchone()
+    finally:
+        conn.close()
     
     if result and result[0] > 0:
         columns = [description[0] for description in cursor.description]
         return dict(zip(columns, result))
     return None
 
+# Bogotá no tiene horario de verano: UTC-5 fijo todo el año
+BOGOTA_UTC_OFFSET_HOURS = -5
+
+
+@coalesce
+def get_hourly_aggregates(start_date, end_date, aqi_start_date):
+    """Promedios horarios (hora Bogotá) de TODOS los puntos y distribución de AQI.
+
+    Los promedios de PM2.5, PM10, O3 y NO2 se agrupan en SQL por hora local
+    dentro de [start_date, end_date]; el histograma de AQI cubre desde
+    aqi_start_date hasta ahora.
+
+    Son tres consultas y no una a propósito: las ventanas son distintas
+    (24 h y 7 días) y una sola consulta con CASE sobre los 7 días resultó
+    3-4 veces más lenta (benchmarks/query_plans.py, escala medium); cada
+    una usa idx_timestamp y solo lee su ventana.
+    """
+
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    offset = f"{BOGOTA_UTC_OFFSET_HOURS} hours"
+
+    try:
+        # Promedios por hora local (una sola consulta agrupada)
+        cursor.execute('''
+        SELECT 
+            CAST(strftime('%H', timestamp, ?) AS INTEGER) as hour,
+            AVG(pm2_5) as avg_pm25,
+            AVG(pm10) as avg_pm10,
+            AVG(o3) as avg_o3,
+            AVG(no2) as avg_no2,
+            COUNT(*) as count
+        FROM air_quality_data 
+        WHERE timestamp >= ? 
+        AND timestamp <= ?
+        GROUP BY hour
+        ''', (offset, start_date, end_date))
+        hourly_rows = cursor.fetchall()
+
+        # Distribución de AQI (categorías 1..5)
+        cursor.execute('''
+        SELECT aqi, COUNT(*) 
+        FROM air_quality_data 
+        WHERE timestamp >= ? 
+        AND aqi BETWEEN 1 AND 5
+        GROUP BY aqi
+        ''', (aqi_start_date,))
+        aqi_rows = cursor.fetchall()
+
+        cursor.execute('''
+        SELECT COUNT(DISTINCT location_id) 
+        FROM air_quality_data 
+        WHERE timestamp >= ? 
+        AND timestamp <= ?
+        ''', (start_date, end_date))
+        location_count = cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+    hourly = {}
+    for hour, avg_pm25, avg_pm10, avg_o3, avg_no2, count in hourly_rows:
+        if hour is None:
+            continue
+        hourly[int(hour)] = {
+            'pm25': avg_pm25,
+            'pm10': avg_pm10,
+            'o3': avg_o3,
+            'no2': avg_no2,
+            'count': count
+        }
+
+    aqi_distribution = {str(i): 0 for i in range(1, 6)}
+    for aqi, count in aqi_rows:
+        key = str(int(aqi))
+        if key in aqi_distribution:
+            aqi_distribution[key] += count
+
+    return {
+        'hourly': hourly,
+        'aqi_distribution': aqi_distribution,
+        'location_count': location_count
+    }
+
 if __name__ == "__main__":
     create_database()
     print("Configuración de base de datos completada.")
@@ -0,0 +1,146 @@
+# downsampling.py - Reducción de series de tiempo para gráficos (LTTB y min/max)
+from datetime import datetime
+
+# numpy se importa al reducir la primera serie, no al arrancar el API
+
+# Métodos disponibles para el parámetro 'downsample'
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+# Columnas numéricas de air_quality_data válidas para 'downsample_by'
+DOWNSAMPLE_METRICS = ('pm2_5', 'pm10', 'o3', 'no2', 'aqi', 'temperature', 'humidity', 'pressure', 'wind_speed')
+
+
+def lttb_indices(x, y, n_out):
+    """Índices elegidos por Largest-Triangle-Three-Buckets.
+
+    Conserva la forma visual de la serie: en cada bucket se queda con el punto
+    que forma el triángulo de mayor área con el punto anterior elegido y el
+    promedio del bucket siguiente. El cálculo dentro de cada bucket es
+    vectorizado; solo se itera una vez por punto de salida.
+    """
+    import numpy as np
+
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Límites de los n_out - 2 buckets interiores (el primero y el último se conservan)
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(np.int64)
+    edges[-1] = n - 1
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], edges[i + 2]
+        else:
+            next_start, next_end = n - 1, n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return selected
+
+
+def minmax_indices(y, n_out):
+    """Índices del mínimo y el máximo de cada bucket (totalmente vectorizado)"""
+    import numpy as np
+
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+
+    buckets = n_out // 2
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)[:-1]
+    bucket_id = np.repeat(np.arange(buckets), np.diff(np.append(edges, n)))
+
+    mins = np.minimum.reduceat(y, edges)
+    maxs = np.maximum.reduceat(y, edges)
+
+    # Primera posición de cada bucket donde se alcanza el mínimo / máximo
+    min_pos = np.flatnonzero(y == mins[bucket_id])
+    max_pos = np.flatnonzero(y == maxs[bucket_id])
+    _, first_min = np.unique(bucket_id[min_pos], return_index=True)
+    _, first_max = np.unique(bucket_id[max_pos], return_index=True)
+
+    return np.union1d(min_pos[first_min], max_pos[first_max])
+
+
+def _to_epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _evenly_spaced(candidates, count):
+    """`count` elementos equiespaciados de una lista ordenada (con el primero y el último)"""
+    import numpy as np
+
+    if count >= len(candidates):
+        return list(candidates)
+    if count <= 0:
+        return []
+    picks = np.round(np.linspace(0, len(candidates) - 1, count)).astype(np.int64)
+    return [candidates[i] for i in picks]
+
+
+def downsample_rows(rows, max_points, metrics=('pm2_5', 'pm10'), method='lttb', time_key='timestamp'):
+    """Reducir una lista de filas (dicts) a max_points (o menos si no hay tantas).
+
+    Se eligen puntos por cada métrica (repartiendo el presupuesto) y se unen,
+    de modo que los picos de cualquiera de las series se conservan. Como las
+    métricas suelen coincidir en muchos puntos, lo que queda del presupuesto
+    se completa con puntos equiespaciados en el tiempo; si ninguna métrica
+    tiene valores, la selección es solo equiespaciada. Si la unión supera
+    max_points (presupuesto mínimo de 3 por métrica), se toman puntos
+    equiespaciados de ella. Las filas devueltas mantienen el orden original.
+    """
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Método no soportado. Opciones: {', '.join(DOWNSAMPLE_METHODS)}")
+    if not max_points or len(rows) <= max_points:
+        return rows
+
+    import numpy as np
+
+    x_all = np.array([_to_epoch(row[time_key]) for row in rows], dtype=np.float64)
+    order = np.argsort(x_all, kind='stable')
+    x_sorted = x_all[order]
+
+    budget = max(max_points // max(len(metrics), 1), 3)
+    # Posiciones dentro de la serie ordenada por tiempo (índices de `order`)
+    keep = set()
+    for metric in metrics:
+        y_sorted = np.array(
+            [rows[i].get(metric) for i in order], dtype=np.float64
+        )
+        valid = np.flatnonzero(~np.isnan(y_sorted))
+        if len(valid) == 0:
+            continue
+        if method == 'lttb':
+            chosen = lttb_indices(x_sorted[valid], y_sorted[valid], budget)
+        else:
+            chosen = minmax_indices(y_sorted[valid], budget)
+        keep.update(valid[chosen].tolist())
+
+    keep = sorted(keep)
+    if len(keep) > max_points:
+        keep = _evenly_spaced(keep, max_points)
+    elif len(keep) < max_points:
+        chosen = set(keep)
+        rest = [i for i in range(len(rows)) if i not in chosen]
+        keep += _evenly_spaced(rest, max_points - len(keep))
+    return [rows[i] for i in sorted(order[keep].tolist())]
+
+
+def downsample_series(points, max_points, method='lttb'):
+    """Reducir una serie [{'t': timestamp, 'v': valor}, ...] a como máximo max_points"""
+    return downsample_rows(points, max_points, metrics=('v',), method=method, time_key='t')
@@ -0,0 +1,144 @@
+# event_stream.py - Difusión de nuevas lecturas por Server-Sent Events
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from database_setup import get_latest_readings, get_location_stats
+
+# Campos enviados en cada evento (mensaje compacto)
+EVENT_FIELDS = ('location_id', 'location_name', 'timestamp', 'pm2_5', 'pm10', 'o3', 'no2', 'aqi')
+
+# Suscriptores simultáneos por proceso (sin valor: el stream dentro de los
+# workers usa la mitad de sus hilos; el de desarrollo y stream_server.py no limitan)
+STREAM_MAX_SUBSCRIBERS = os.environ.get('STREAM_MAX_SUBSCRIBERS')
+# Puerto de stream_server.py; si está definido, /api/stream del API redirige allí
+STREAM_PORT = os.environ.get('STREAM_PORT')
+# URL pública del stream (detrás de un proxy); por defecto el host del API en STREAM_PORT
+STREAM_URL = os.environ.get('STREAM_URL')
+
+
+class ReadingBroadcaster:
+    """Detecta lecturas nuevas y las reparte a todos los suscriptores del proceso.
+
+    Un único hilo consulta location_stats (una fila por ubicación) cada
+    `poll_seconds`, y solo si hay suscriptores. Cuando cambia el último
+    timestamp de una ubicación, se lee la última fila y se encola un evento
+    para cada suscriptor. Así el costo en BD no depende del número de
+    clientes conectados.
+
+    Dentro de un worker del API cada suscriptor ocupa un hilo mientras está
+    conectado, así que `max_subscribers` (None = sin límite) deja hilos
+    libres para el resto del API: por encima del límite subscribe() devuelve
+    None. stream_server.py atiende a todos desde un solo hilo (asyncio).
+    """
+
+    def __init__(self, poll_seconds=15, queue_size=100, max_subscribers=None):
+        self.poll_seconds = poll_seconds
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last_seen = None
+        self._snapshot = {}
+        self._thread = None
+
+    def subscribe(self, q=None):
+        """Registrar un suscriptor; devuelve su cola de eventos (None si se alcanzó el límite)
+
+        `q` es cualquier objeto con put_nowait (por defecto una queue.Queue).
+        """
+        if q is None:
+            q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if self.max_subscribers is not None and len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(q)
+            snapshot = list(self._snapshot.values())
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+        # Estado actual para que el cliente no necesite una petición inicial
+        for event in snapshot:
+            self._offer(q, event)
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event):
+        """Enviar un evento a todos los suscriptores (descarta si un cliente va atrasado)"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            self._offer(q, event)
+
+    @staticmethod
+    def _offer(q, event):
+        try:
+            q.put_nowait(event)
+        except queue.Full:
+            pass
+
+    def check_for_updates(self):
+        """Comparar location_stats con lo último visto y publicar las ubicaciones nuevas"""
+        stats = get_location_stats()
+        current = {row['location_id']: row['last_timestamp'] for row in stats if row['last_timestamp']}
+
+        if self._last_seen is None:
+            changed = set(current)
+        else:
+            changed = {loc for loc, ts in current.items() if self._last_seen.get(loc) != ts}
+        self._last_seen = current
+
+        if not changed:
+            return 0
+
+        published = 0
+        for row in get_latest_readings():
+            if row['location_id'] not in changed:
+                continue
+            event = {field: row.get(field) for field in EVENT_FIELDS}
+            with self._lock:
+                self._snapshot[row['location_id']] = event
+            self.publish(event)
+            published += 1
+        return published
+
+    def _run(self):
+        while True:
+            if self.subscriber_count() == 0:
+                # Sin suscriptores: no consultar la BD
+                time.sleep(self.poll_seconds)
+                continue
+            try:
+                self.check_for_updates()
+            except Exception as e:
+                logging.error(f"Error consultando nuevas lecturas para stream: {e}")
+            time.sleep(self.poll_seconds)
+
+
+def format_sse(event, event_type='reading'):
+    """Formatear un evento como texto SSE"""
+    return f"event: {event_type}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+def stream_subscriber_limit(threads):
+    """Suscriptores por proceso con `threads` hilos: STREAM_MAX_SUBSCRIBERS o la mitad de los hilos"""
+    if STREAM_MAX_SUBSCRIBERS:
+        return int(STREAM_MAX_SUBSCRIBERS)
+    return max(threads // 2, 1)
+
+
+broadcaster = ReadingBroadcaster(
+    poll_seconds=int(os.environ.get('STREAM_POLL_SECONDS', 15)),
+    max_subscribers=int(STREAM_MAX_SUBSCRIBERS) if STREAM_MAX_SUBSCRIBERS else None
+)
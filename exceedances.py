@@ -0,0 +1,67 @@
+# exceedances.py - Días que superan las guías 24 h de la OMS y sus acumulados
+#
+# La ingesta mantiene, por ubicación y día local, la suma y el conteo de
+# cada contaminante; con eso marca si el día superó la guía. Los cambios de
+# marca se suman a acumulados por mes y por año, de modo que un rango
+# cualquiera se responde con los días sueltos de los extremos, los meses
+# completos y los años completos (un número fijo de consultas).
+from datetime import date, datetime, timedelta, timezone
+import os
+
+# Guías OMS 2021 de 24 h (µg/m³) para los contaminantes que se recolectan.
+# El O3 tiene guía de 8 h (máximo diario de medias móviles) y no entra aquí.
+WHO_24H_LIMITS = {
+    'pm2_5': 15,
+    'pm10': 45,
+    'no2': 25,
+}
+EXCEEDANCE_POLLUTANTS = tuple(WHO_24H_LIMITS)
+
+# Lecturas mínimas para que un día cuente (75% de las horas)
+EXCEEDANCE_MIN_READINGS = int(os.environ.get('EXCEEDANCE_MIN_READINGS', 18))
+
+
+def local_day(timestamp, offset_hours):
+    """Día local 'YYYY-MM-DD' de un timestamp ISO o datetime (sin zona = UTC)"""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return timestamp.astimezone(timezone(timedelta(hours=offset_hours))).date().isoformat()
+
+
+def day_flags(total, count, limit, min_readings=EXCEEDANCE_MIN_READINGS):
+    """(día completo, supera la guía) a partir de la suma y el conteo del día"""
+    if count < min_readings:
+        return 0, 0
+    return 1, 1 if total / count > limit else 0
+
+
+def _month_end(day):
+    next_month = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def split_range(start, end):
+    """Partir [start, end] (fechas, inclusive) en tramos de días, meses completos y años completos.
+
+    Devuelve (day_ranges, months, years): day_ranges son pares
+    ('YYYY-MM-DD', 'YYYY-MM-DD') (solo en los extremos), months 'YYYY-MM'
+    y years 'YYYY'.
+    """
+    day_ranges, months, years = [], [], []
+    current = start
+    while current <= end:
+        year_end = date(current.year, 12, 31)
+        month_end = _month_end(current)
+        if current.month == 1 and current.day == 1 and year_end <= end:
+            years.append(str(current.year))
+            current = year_end + timedelta(days=1)
+        elif current.day == 1 and month_end <= end:
+            months.append(current.strftime('%Y-%m'))
+            current = month_end + timedelta(days=1)
+        else:
+            last = min(month_end, end)
+            day_ranges.append((current.isoformat(), last.isoformat()))
+            current = last + timedelta(days=1)
+    return day_ranges, months, years
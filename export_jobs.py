@@ -0,0 +1,241 @@
+# export_jobs.py - Exportaciones asíncronas con caché de archivos en disco
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+
+from database_setup import get_data_version
+from data_export import EXPORT_FORMATS, PERIOD_DAYS, write_export
+
+# Directorio de artefactos y estado de los trabajos
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR', os.path.join('data', 'exports'))
+# Tamaño máximo de la caché antes de borrar los archivos menos usados
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get('EXPORT_CACHE_MAX_MB', 500)) * 1024 * 1024
+# Antigüedad máxima de un archivo en caché (la ventana del período se desplaza)
+EXPORT_CACHE_MAX_AGE_SECONDS = int(os.environ.get('EXPORT_CACHE_MAX_AGE_HOURS', 6)) * 3600
+# Un trabajo 'running' sin cambios en este tiempo se considera abandonado
+EXPORT_JOB_TIMEOUT_SECONDS = int(os.environ.get('EXPORT_JOB_TIMEOUT_MINUTES', 30)) * 60
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+def job_key(location_id, period, export_format, data_version):
+    """Identificador del trabajo = clave de caché (ubicación, período, formato, versión de datos)"""
+    raw = f"{location_id}|{period}|{export_format}|{data_version}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def _job_path(cache_dir, job_id):
+    return os.path.join(cache_dir, f"{job_id}.json")
+
+
+def artifact_path(cache_dir, job):
+    extension = EXPORT_FORMATS[job['format']][0]
+    return os.path.join(cache_dir, f"{job['id']}.{extension}")
+
+
+def read_job(job_id, cache_dir=EXPORT_CACHE_DIR):
+    """Leer el estado de un trabajo (None si no existe)"""
+    if not re.fullmatch(r'[0-9a-f]{20}', job_id or ''):
+        return None
+    try:
+        with open(_job_path(cache_dir, job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _write_job(cache_dir, job):
+    # Escritura atómica: cualquier worker puede leer el estado en todo momento
+    job['updated_at'] = _now()
+    path = _job_path(cache_dir, job['id'])
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(job, f)
+    os.replace(tmp_path, path)
+
+
+def _age_seconds(iso_value):
+    return (datetime.now(timezone.utc) - datetime.fromisoformat(iso_value)).total_seconds()
+
+
+def evict_cache(cache_dir=EXPORT_CACHE_DIR, max_bytes=EXPORT_CACHE_MAX_BYTES):
+    """Borrar los artefactos menos usados hasta que la caché quepa en max_bytes"""
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        job_id = os.path.basename(path).split('.', 1)[0]
+        for target in (path, _job_path(cache_dir, job_id)):
+            try:
+                os.remove(target)
+            except FileNotFoundError:
+                pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def run_export_job(job_id, cache_dir=EXPORT_CACHE_DIR):
+    """Construir el archivo de un trabajo (se ejecuta en un proceso del pool)"""
+    job = read_job(job_id, cache_dir)
+    if job is None:
+        return
+
+    job['status'] = 'running'
+    job['started_at'] = _now()
+    _write_job(cache_dir, job)
+
+    path = artifact_path(cache_dir, job)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as output:
+            rows = write_export(output, job['location_id'], job['period'], job['format'])
+
+        if not rows:
+            os.remove(tmp_path)
+            job['status'] = 'error'
+            job['error'] = 'No hay datos disponibles para exportar'
+        else:
+            os.replace(tmp_path, path)
+            job['status'] = 'done'
+            job['rows'] = rows
+            job['size'] = os.path.getsize(path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        job['status'] = 'error'
+        job['error'] = str(e)
+
+    job['finished_at'] = _now()
+    _write_job(cache_dir, job)
+
+    if job['status'] == 'done':
+        evict_cache(cache_dir)
+
+
+class ExportJobManager:
+    """Cola de exportaciones pesadas en un pool de procesos separado del API.
+
+    El estado de cada trabajo vive en disco (data/exports/<id>.json), así que
+    cualquier worker del servidor puede responder el estado o la descarga, y
+    dos peticiones iguales comparten el mismo trabajo y el mismo archivo.
+    """
+
+    def __init__(self, cache_dir=EXPORT_CACHE_DIR, max_workers=None):
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers or int(os.environ.get('EXPORT_WORKERS', 2))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                # 'spawn': el proceso hijo no hereda sockets ni el pool de conexiones
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _is_reusable(self, job):
+        """¿Se puede devolver este trabajo en lugar de crear uno nuevo?"""
+        if job is None:
+            return False
+        if job['status'] == 'done':
+            return (os.path.exists(artifact_path(self.cache_dir, job))
+                    and _age_seconds(job['finished_at']) < EXPORT_CACHE_MAX_AGE_SECONDS)
+        if job['status'] in ('pending', 'running'):
+            return _age_seconds(job['updated_at']) < EXPORT_JOB_TIMEOUT_SECONDS
+        return False
+
+    def submit(self, location_id, period, export_format):
+        """Crear (o reutilizar) el trabajo de exportación; devuelve su estado"""
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Formato no soportado. Opciones: {', '.join(EXPORT_FORMATS)}")
+        if period not in PERIOD_DAYS:
+            raise ValueError(f"Período no soportado. Opciones: {', '.join(PERIOD_DAYS)}")
+
+        data_version = get_data_version(location_id)
+        job_id = job_key(location_id, period, export_format, data_version)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        job = read_job(job_id, self.cache_dir)
+        if self._is_reusable(job):
+            if job['status'] == 'done':
+                # Marcar como usado recientemente para la expulsión LRU
+                os.utime(artifact_path(self.cache_dir, job))
+            return job
+
+        job = {
+            'id': job_id,
+            'location_id': location_id,
+            'period': period,
+            'format': export_format,
+            'data_version': data_version,
+            'status': 'pending',
+            'created_at': _now()
+        }
+        _write_job(self.cache_dir, job)
+
+        future = self._get_executor().submit(run_export_job, job_id, self.cache_dir)
+        future.add_done_callback(lambda f: self._on_done(job_id, f))
+        logging.info(f"Exportación en cola: {location_id} {period} {export_format} ({job_id})")
+        return job
+
+    def _on_done(self, job_id, future):
+        # Solo para fallos del propio proceso (p. ej. el hijo murió)
+        error = future.exception()
+        if error is None:
+            return
+        logging.error(f"Error en trabajo de exportación {job_id}: {error}")
+        job = read_job(job_id, self.cache_dir)
+        if job is not None and job['status'] != 'done':
+            job['status'] = 'error'
+            job['error'] = str(error)
+            _write_job(self.cache_dir, job)
+
+    def submit_task(self, fn, *args, **kwargs):
+        """Ejecutar una tarea cualquiera en el pool de exportación"""
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def get(self, job_id):
+        return read_job(job_id, self.cache_dir)
+
+    def artifact(self, job):
+        """Ruta del archivo terminado, o None si no existe (expulsado de la caché)"""
+        path = artifact_path(self.cache_dir, job)
+        if job['status'] != 'done' or not os.path.exists(path):
+            return None
+        os.utime(path)
+        return path
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+export_jobs = ExportJobManager()
@@ -820,8 +820,8 @@ function updateDailySummary(pm25, pm10, aqi) {
 //pave si funciona
 // ===== Tendencias y distribución (añadir al final de script.js) =====
 (function () {
-    const TRENDS_DAYS = 7;
-    const LIMIT = 5000;
+    // Puntos por serie: el servidor reduce la serie de 24 h (LTTB) antes de enviarla
+    const TRENDS_MAX_POINTS = 200;
     let pm25Chart, pm10Chart, aqiChart;
 
     function getSelectedLocationId() {
@@ -838,23 +838,18 @@ function updateDailySummary(pm25, pm10, aqi) {
         return 'aguachica_general';
     }
 
-    async function fetchHistorical(locationId) {
-        const url = `${API_BASE}/api/historical/${encodeURIComponent(locationId)}?days=${TRENDS_DAYS}&limit=${LIMIT}`;
+    async function fetchTrends(locationId) {
+        // Series de 24 h ya reducidas y distribución AQI de 7 días en una sola respuesta
+        const url = `${API_BASE}/api/trends/${encodeURIComponent(locationId)}?max_points=${TRENDS_MAX_POINTS}`;
         const r = await fetch(url);
         const j = await r.json();
         if (!j.success) throw new Error(j.error || 'No data');
-        return j.data || [];
+        return j;
     }
 
-    function last24h(data) {
-        const now = Date.now();
-        const from = now - 24 * 3600 * 1000;
-        return data.filter(d => new Date(d.timestamp).getTime() >= from);
-    }
-
-    function buildSeries(data, field) {
-        const arr = data
-            .map(d => ({ t: new Date(d.timestamp), v: d[field] }))
+    function buildSeries(points) {
+        const arr = (points || [])
+            .map(p => ({ t: new Date(p.t), v: p.v }))
             .filter(p => p.v != null && !isNaN(p.v))
             .sort((a, b) => a.t - b.t);
 
@@ -866,14 +861,10 @@ function updateDailySummary(pm25, pm10, aqi) {
         };
     }
 
-    function groupAQICategories(data) {
+    function groupAQICategories(distribution) {
         // OpenWeather AQI: 1..5 (1=Bueno ... 5=Muy malo)  :contentReference[oaicite:6]{index=6}
         const labels = ['Bueno', 'Aceptable', 'Moderado', 'Malo', 'Muy malo'];
-        const counts = [0, 0, 0, 0, 0];
-        data.forEach(d => {
-            const a = Number(d.aqi);
-            if (a >= 1 && a <= 5) counts[a - 1]++;
-        });
+        const counts = ['1', '2', '3', '4', '5'].map(k => Number((distribution || {})[k] || 0));
         return { labels, values: counts };
     }
 
@@ -890,11 +881,10 @@ function updateDailySummary(pm25, pm10, aqi) {
             if (btn) { btn.disabled = true; btn.textContent = 'Generando...'; }
 
             const locationId = getSelectedLocationId();
-            const data = await fetchHistorical(locationId);
-            const data24 = last24h(data);
+            const trends = await fetchTrends(locationId);
 
-            const s25 = buildSeries(data24, 'pm2_5');
-            const s10 = buildSeries(data24, 'pm10');
+            const s25 = buildSeries(trends.pm25_24h);
+            const s10 = buildSeries(trends.pm10_24h);
 
             showTrendsSection();
 
@@ -916,7 +906,7 @@ function updateDailySummary(pm25, pm10, aqi) {
                 options: { responsive: true, maintainAspectRatio: false, scales: { y: { beginAtZero: true } }, plugins: { legend: { display: false } } }
             });
 
-            const aqi = groupAQICategories(data);
+            const aqi = groupAQICategories(trends.aqi_distribution_7d);
             aqiChart = new Chart(ctxAqi, {
                 type: 'doughnut',
                 data: { labels: aqi.labels, datasets: [{ data: aqi.values }] },
@@ -943,6 +933,65 @@ function updateDailySummary(pm25, pm10, aqi) {
 
 
 
+// ACTUALIZACIONES EN VIVO (SSE)
+// ================================
+// El servidor avisa por /api/stream cuando se guarda una lectura nueva;
+// solo entonces se recargan los datos del punto afectado. Si el stream no
+// está disponible se consulta /api/current cada 60 s hasta poder reconectar.
+const liveLastSeen = new Map();
+
+function handleLiveReading(reading) {
+    const previous = liveLastSeen.get(reading.location_id);
+    liveLastSeen.set(reading.location_id, reading.timestamp);
+
+    // El primer dato de cada punto es el estado actual (ya cargado)
+    if (previous && previous !== reading.timestamp) {
+        window.retryPointData(reading.location_id);
+    }
+}
+
+async function pollLatestReadings() {
+    try {
+        const r = await fetch(`${API_BASE}/api/current`);
+        const json = await r.json();
+        (json.data || []).forEach(handleLiveReading);
+    } catch (err) {
+        console.error('Error consultando lecturas recientes:', err);
+    }
+}
+
+function subscribeToReadings() {
+    if (!window.EventSource) {
+        setInterval(pollLatestReadings, 60000);
+        return;
+    }
+
+    const source = new EventSource(`${API_BASE}/api/stream`);
+
+    source.addEventListener('reading', (e) => {
+        try {
+            handleLiveReading(JSON.parse(e.data));
+        } catch (err) {
+            console.error('Evento de stream inválido:', err);
+        }
+    });
+
+    source.onerror = () => {
+        // EventSource reconecta solo usando el 'retry' enviado por el servidor,
+        // salvo si la respuesta no fue un stream (p. ej. 503 por límite de
+        // conexiones): entonces queda cerrado, se consulta /api/current y se
+        // vuelve a intentar el stream más tarde
+        if (source.readyState === EventSource.CLOSED) {
+            console.warn('Actualizaciones en vivo no disponibles, consultando cada 60 s...');
+            pollLatestReadings();
+            setTimeout(subscribeToReadings, 60000);
+            return;
+        }
+        console.warn('Conexión de actualizaciones en vivo interrumpida, reintentando...');
+    };
+}
+
+// ================================
 // INICIALIZACIÓN DEL MAPA
 // ================================
 function initializeMap() {
@@ -961,4 +1010,5 @@ function initializeMap() {
 window.onload = function () {
     initializeMap();
     loadAllPointsData();
+    subscribeToReadings();
 };
\ No newline at end of file
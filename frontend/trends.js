@@ -7,7 +7,7 @@
  * - Se ejecuta solo cuando el usuario hace clic en el botón "Generar Interpretación".
  *
  * Requisitos:
- *  - API disponible en /api/locations y /api/historical/:id
+ *  - API disponible en /api/aggregate/hourly (promedios calculados en el servidor)
  *  - Chart.js 4.x cargado en index.html
  */
 
@@ -49,62 +49,6 @@
     });
   }
 
-  // ====== Helpers de tiempo ======
-  function toBogota(dateLike) {
-    // Convierte un ISO UTC a objeto Date, luego ajusta a hora local del navegador.
-    // Para agrupar por hora en Bogotá, usaremos las funciones de Intl.DateTimeFormat.
-    const d = new Date(dateLike);
-    return d; // usaremos formateadores con TZ para obtener la hora en Bogotá
-  }
-
-  /**
-   * Devuelve ventana de 24 h [start, end) con inicio 05:00 del "día de ayer" (zona Bogotá)
-   * y fin 04:59:59 del "día de hoy".
-   */
-  function getWindow24h_5to4() {
-    const now = new Date();
-    // Construimos "hoy" en Bogotá
-    const fmtDate = new Intl.DateTimeFormat("es-CO", {
-      timeZone: TZ, year: "numeric", month: "2-digit", day: "2-digit"
-    });
-    const parts = fmtDate.formatToParts(now);
-    const y = parts.find(p => p.type === "year").value;
-    const m = parts.find(p => p.type === "month").value;
-    const d = parts.find(p => p.type === "day").value;
-
-    // Crear 04:59:59 de HOY (fin de ventana) en Bogotá
-    const endLocal = new Date(`${y}-${m}-${d}T04:59:59`);
-    // Para evitar desfases por TZ, obtenemos timestamp aplicando offset de Bogotá
-    const endZoned = zonedTimeToUtc(endLocal, TZ);
-
-    // Inicio es el día anterior a las 05:00:00 Bogotá
-    const startLocal = new Date(endLocal);
-    startLocal.setDate(startLocal.getDate() - 1);
-    startLocal.setHours(5, 0, 0, 0);
-    const startZoned = zonedTimeToUtc(startLocal, TZ);
-
-    return { start: startZoned, end: endZoned };
-  }
-
-  // Polyfill mínimo: convertir fecha "local en TZ" a UTC (sin librerías externas)
-  function zonedTimeToUtc(localDate, timeZone) {
-    // Interpreta localDate como si estuviera en "timeZone", y devuelve Date en UTC del mismo instante
-    const fmt = new Intl.DateTimeFormat("en-US", {
-      timeZone, hour12: false,
-      year: "numeric", month: "2-digit", day: "2-digit",
-      hour: "2-digit", minute: "2-digit", second: "2-digit"
-    });
-    const parts = fmt.formatToParts(localDate);
-    const y = Number(parts.find(p => p.type === "year").value);
-    const m = Number(parts.find(p => p.type === "month").value);
-    const d = Number(parts.find(p => p.type === "day").value);
-    const hh = Number(parts.find(p => p.type === "hour").value);
-    const mm = Number(parts.find(p => p.type === "minute").value);
-    const ss = Number(parts.find(p => p.type === "second").value);
-    // Construir fecha como si fuera UTC
-    return new Date(Date.UTC(y, m - 1, d, hh, mm, ss));
-  }
-
   function formatHourLabel(idxStartAt5) {
     // Genera etiquetas 24h iniciando en 05:00 → 04:00
     const labels = [];
@@ -124,115 +68,32 @@
     return j.data;
   }
 
-  async function getAllLocations() {
-    return await fetchJson(`${API_BASE}/api/locations`);
-  }
-
-  async function getHistoryForLocation(id, days = 2, limit = 2000) {
-    return await fetchJson(`${API_BASE}/api/historical/${encodeURIComponent(id)}?days=${days}&limit=${limit}`);
-  }
-
-  // ====== Agregación: promedio horario sobre TODOS los puntos ======
-  function aggregateHourlyAverages(allRecords, windowStart, windowEnd) {
-    // Estructuras de suma y conteo por hora (24 bins 05→04)
-    const bins = Array.from({ length: 24 }, () => ({
-      sum_pm25: 0, c_pm25: 0,
-      sum_pm10: 0, c_pm10: 0,
-      sum_o3:   0, c_o3:   0,
-      sum_no2:  0, c_no2:  0
-    }));
-
-    // Para localizar la hora 05:00 como índice 0
-    function hourToIndex(h) {
-      // h = 0..23 (hora Bogotá)
-      const idx = (h - 5);
-      return (idx < 0) ? (24 + idx) : idx; // rotado
-    }
-
-    const hourFmt = new Intl.DateTimeFormat("en-CA", { timeZone: TZ, hour: "2-digit", hour12: false });
-
-    for (const rec of allRecords) {
-      const ts = new Date(rec.timestamp); // timestamp ISO UTC guardado en DB
-      if (!(ts >= windowStart && ts <= windowEnd)) continue;
-
-      // Obtener hora en Bogotá (00..23)
-      const parts = hourFmt.formatToParts(ts);
-      const h = Number(parts.find(p => p.type === "hour").value);
-      const idx = hourToIndex(h);
-
-      const pm25 = safeNumber(rec.pm2_5);
-      const pm10 = safeNumber(rec.pm10);
-      const o3   = safeNumber(rec.o3);
-      const no2  = safeNumber(rec.no2);
-
-      if (pm25 != null) { bins[idx].sum_pm25 += pm25; bins[idx].c_pm25++; }
-      if (pm10 != null) { bins[idx].sum_pm10 += pm10; bins[idx].c_pm10++; }
-      if (o3   != null) { bins[idx].sum_o3   += o3;   bins[idx].c_o3++;   }
-      if (no2  != null) { bins[idx].sum_no2  += no2;  bins[idx].c_no2++;  }
-    }
-
-    // Calcular promedios
-    const avg_pm25 = bins.map(b => (b.c_pm25 ? +(b.sum_pm25 / b.c_pm25).toFixed(2) : null));
-    const avg_pm10 = bins.map(b => (b.c_pm10 ? +(b.sum_pm10 / b.c_pm10).toFixed(2) : null));
-    const avg_o3   = bins.map(b => (b.c_o3   ? +(b.sum_o3   / b.c_o3).toFixed(2)   : null));
-    const avg_no2  = bins.map(b => (b.c_no2  ? +(b.sum_no2  / b.c_no2).toFixed(2)  : null));
-
-    return { avg_pm25, avg_pm10, avg_o3, avg_no2 };
-  }
-
-  function safeNumber(v) {
-    const n = Number(v);
-    return Number.isFinite(n) ? n : null;
-  }
-
-  // ====== Donut de distribución de AQI (7 días, todos los puntos) ======
-  function buildAqiHistogram(allRecords7d) {
-    const hist = [0, 0, 0, 0, 0]; // índices 0..4 -> AQI 1..5
-    for (const r of allRecords7d) {
-      const aqi = Number(r.aqi);
-      if (Number.isFinite(aqi) && aqi >= 1 && aqi <= 5) {
-        hist[aqi - 1]++;
-      }
-    }
-    return hist;
+  async function getHourlyAggregate(days = 7) {
+    return await fetchJson(`${API_BASE}/api/aggregate/hourly?days=${days}`);
   }
 
   // ====== Render principal ======
   async function renderAll() {
     try {
       trendsMsg.textContent = "Calculando promedios de todos los puntos (24 h, 05:00–04:00)...";
-      const { start, end } = getWindow24h_5to4();
-
-      // 1) Todas las ubicaciones
-      const locs = await getAllLocations();
-      if (!locs?.length) {
+      // 1) Promedios horarios y distribución AQI (una sola petición, agregada en el servidor)
+      const agg = await getHourlyAggregate(7);
+      if (!agg?.location_count) {
         throw new Error("No hay ubicaciones disponibles en la base de datos.");
       }
 
-      // 2) Descarga históricos en paralelo (2 días para cubrir la ventana 05→04)
-      const histories = await Promise.all(
-        locs.map(l => getHistoryForLocation(l.id, 2, 4000).catch(() => []))
-      );
-
-      // "histories" es un array de arrays; aplanamos
-      const all24h = histories.flat();
-
-      // 3) Filtrar ventana y promediar por hora (todos los puntos)
-      const { avg_pm25, avg_pm10, avg_o3, avg_no2 } = aggregateHourlyAverages(all24h, start, end);
-      const labels = formatHourLabel();
-
-      // 4) Pintar/actualizar gráfico combinado
-      renderCombinedChart(labels, avg_pm25, avg_pm10, avg_o3, avg_no2);
+      // 2) Pintar/actualizar gráfico combinado
+      const labels = agg.labels || formatHourLabel();
+      renderCombinedChart(labels, agg.pm25, agg.pm10, agg.o3, agg.no2);
 
-      // 5) Donut AQI últimos 7 días (todos los puntos)
-      const histories7d = await Promise.all(
-        locs.map(l => getHistoryForLocation(l.id, 7, 10000).catch(() => []))
-      );
-      const all7d = histories7d.flat();
-      renderAqiDonut(buildAqiHistogram(all7d));
+      // 3) Donut AQI últimos 7 días (todos los puntos)
+      const dist = agg.aqi_distribution_7d || {};
+      renderAqiDonut([1, 2, 3, 4, 5].map(k => dist[k] || 0));
 
+      const start = new Date(agg.window_start);
+      const end = new Date(agg.window_end);
       const fmt = new Intl.DateTimeFormat("es-CO", { timeZone: TZ, dateStyle: "medium", timeStyle: "short" });
-      trendsMsg.textContent = `Promedio de ${locs.length} puntos. Ventana: ${fmt.format(start)} → ${fmt.format(end)} (${TZ}).`;
+      trendsMsg.textContent = `Promedio de ${agg.location_count} puntos. Ventana: ${fmt.format(start)} → ${fmt.format(end)} (${TZ}).`;
     } catch (err) {
       console.error(err);
       trendsMsg.textContent = "No se pudieron generar las tendencias. Revisa que haya datos históricos suficientes.";
@@ -0,0 +1,230 @@
+# heatmap.py - Superficie interpolada (IDW) sobre las últimas lecturas, con caché por rejilla
+#
+# La rejilla se calcula con NumPy de forma vectorizada: por bloques de
+# filas se arma la matriz de distancias celda-sitio (separable en dx² + dy²)
+# y el promedio ponderado es un producto matriz-vector. Cada rejilla calculada se guarda ya serializada,
+# con clave (lecturas usadas, métrica, rejilla): mientras no llegue una
+# lectura nueva, la misma petición no vuelve a interpolar.
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import hashlib
+import json
+import math
+import os
+import threading
+
+from singleflight import single_flight
+
+HEATMAP_METRICS = ('pm2_5', 'pm10', 'o3', 'no2', 'aqi')
+# Celdas del lado mayor de la rejilla (el otro lado sigue la proporción del bbox)
+HEATMAP_DEFAULT_RESOLUTION = int(os.environ.get('HEATMAP_DEFAULT_RESOLUTION', 64))
+HEATMAP_MAX_RESOLUTION = int(os.environ.get('HEATMAP_MAX_RESOLUTION', 256))
+# Sitios que pesan en cada celda: los N más cercanos (0 = todos, IDW clásico)
+HEATMAP_NEIGHBORS = int(os.environ.get('HEATMAP_NEIGHBORS', 0))
+# Se descartan sitios cuya última lectura es más vieja que esto respecto a la más reciente
+HEATMAP_MAX_AGE_HOURS = float(os.environ.get('HEATMAP_MAX_AGE_HOURS', 3))
+# Rejillas guardadas (LRU)
+HEATMAP_CACHE_SIZE = int(os.environ.get('HEATMAP_CACHE_SIZE', 128))
+# Celdas por bloque: acota la memoria de la matriz de distancias
+HEATMAP_CHUNK_CELLS = 2048
+# Margen alrededor de los sitios cuando no se pasa bbox (fracción del tamaño)
+HEATMAP_PADDING = 0.1
+
+KM_PER_DEGREE_LAT = 110.574
+KM_PER_DEGREE_LON = 111.320
+
+
+def _to_datetime(value):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def parse_bbox(text):
+    """'min_lon,min_lat,max_lon,max_lat' -> tupla de floats (ValueError si no es válido)"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(part) for part in text.split(','))
+    except ValueError:
+        raise ValueError('bbox debe ser min_lon,min_lat,max_lon,max_lat')
+    if not (min_lon < max_lon and min_lat < max_lat):
+        raise ValueError('bbox vacío: se requiere min < max')
+    if not (-180 <= min_lon and max_lon <= 180 and -90 <= min_lat and max_lat <= 90):
+        raise ValueError('bbox fuera de rango')
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def default_bbox(lats, lons):
+    """Extensión de los sitios con un margen (mínimo ~1 km por lado)"""
+    pad_lat = max((max(lats) - min(lats)) * HEATMAP_PADDING, 0.01)
+    pad_lon = max((max(lons) - min(lons)) * HEATMAP_PADDING, 0.01)
+    return (min(lons) - pad_lon, min(lats) - pad_lat, max(lons) + pad_lon, max(lats) + pad_lat)
+
+
+def grid_shape(bbox, resolution):
+    """(columnas, filas) con `resolution` celdas en el lado mayor (en km)"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+    mid_lat = math.radians((min_lat + max_lat) / 2)
+    width = (max_lon - min_lon) * KM_PER_DEGREE_LON * math.cos(mid_lat)
+    height = (max_lat - min_lat) * KM_PER_DEGREE_LAT
+    if width >= height:
+        return resolution, max(1, round(resolution * height / width))
+    return max(1, round(resolution * width / height)), resolution
+
+
+def idw_grid(lats, lons, values, bbox, cols, rows, power=2.0, neighbors=HEATMAP_NEIGHBORS):
+    """Interpolación por distancia inversa en el centro de cada celda.
+
+    Devuelve un arreglo (rows, cols); la fila 0 es el borde norte. Las
+    distancias se miden en km sobre una proyección equirectangular local.
+    Con `neighbors` > 0 solo pesan los sitios más cercanos a cada celda.
+    """
+    import numpy as np
+
+    min_lon, min_lat, max_lon, max_lat = bbox
+    cos_lat = math.cos(math.radians((min_lat + max_lat) / 2))
+    site_x = np.asarray(lons, dtype=np.float64) * KM_PER_DEGREE_LON * cos_lat
+    site_y = np.asarray(lats, dtype=np.float64) * KM_PER_DEGREE_LAT
+    site_v = np.asarray(values, dtype=np.float64)
+    n_sites = len(site_v)
+    k = min(neighbors, n_sites) if neighbors else n_sites
+
+    cell_x = (min_lon + (np.arange(cols) + 0.5) * (max_lon - min_lon) / cols) * KM_PER_DEGREE_LON * cos_lat
+    cell_y = (max_lat - (np.arange(rows) + 0.5) * (max_lat - min_lat) / rows) * KM_PER_DEGREE_LAT
+    # La rejilla es separable: dist² = dx²(columna) + dy²(fila)
+    dx2 = (cell_x[:, None] - site_x[None, :]) ** 2
+    dy2 = (cell_y[:, None] - site_y[None, :]) ** 2
+
+    out = np.empty((rows, cols), dtype=np.float64)
+    rows_per_block = max(1, HEATMAP_CHUNK_CELLS // cols)
+    for first in range(0, rows, rows_per_block):
+        last = min(first + rows_per_block, rows)
+        dist2 = (dy2[first:last, None, :] + dx2[None, :, :]).reshape(-1, n_sites)
+        if k < n_sites:
+            nearest = np.argpartition(dist2, k - 1, axis=1)[:, :k]
+            dist2 = np.take_along_axis(dist2, nearest, axis=1)
+            near_v = site_v[nearest]
+        else:
+            near_v = None
+        # Una celda sobre un sitio toma su valor exacto
+        exact = dist2 < 1e-12
+        hit = exact.any(axis=1)
+        if hit.any():
+            dist2[exact] = 1.0
+        if power == 2:
+            weights = np.reciprocal(dist2, out=dist2)
+        else:
+            weights = np.power(dist2, -power / 2, out=dist2)
+        if near_v is None:
+            block = (weights @ site_v) / weights.sum(axis=1)
+        else:
+            block = (weights * near_v).sum(axis=1) / weights.sum(axis=1)
+        if hit.any():
+            index = exact[hit].argmax(axis=1)
+            block[hit] = site_v[index] if near_v is None else near_v[hit][np.arange(len(index)), index]
+        out[first:last] = block.reshape(last - first, cols)
+    return out
+
+
+class HeatmapCache:
+    """LRU de rejillas ya serializadas"""
+
+    def __init__(self, size=HEATMAP_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            body = self._items.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._items[key] = body
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+heatmap_cache = HeatmapCache()
+
+
+def select_sites(readings, metric, max_age_hours=HEATMAP_MAX_AGE_HOURS):
+    """Sitios con valor y posición, descartando los que llevan mucho sin reportar"""
+    sites = [r for r in readings
+             if r.get(metric) is not None and r.get('latitude') is not None
+             and r.get('longitude') is not None and r.get('timestamp')]
+    if not sites:
+        return []
+    times = [_to_datetime(r['timestamp']) for r in sites]
+    cutoff = max(times) - timedelta(hours=max_age_hours)
+    return [r for r, t in zip(sites, times) if t >= cutoff]
+
+
+def heatmap_json(readings, metric='pm2_5', bbox=None, resolution=HEATMAP_DEFAULT_RESOLUTION,
+                 power=2.0, max_age_hours=HEATMAP_MAX_AGE_HOURS):
+    """Rejilla IDW serializada en JSON (desde la caché si las lecturas no cambiaron).
+
+    `readings` son las últimas lecturas por ubicación (filas de
+    air_quality_data). Lanza ValueError si los parámetros no son válidos.
+    """
+    if metric not in HEATMAP_METRICS:
+        raise ValueError(f"metric debe ser una de: {', '.join(HEATMAP_METRICS)}")
+    if not 2 <= resolution <= HEATMAP_MAX_RESOLUTION:
+        raise ValueError(f"resolution debe estar entre 2 y {HEATMAP_MAX_RESOLUTION}")
+    if not 0.5 <= power <= 5:
+        raise ValueError('power debe estar entre 0.5 y 5')
+
+    sites = select_sites(readings, metric, max_age_hours)
+    if not sites:
+        return json.dumps({'success': False, 'error': 'No data found'})
+
+    # Huella de las lecturas usadas: cambia solo cuando llega una lectura nueva
+    signature = hashlib.sha1(repr(sorted(
+        (r['location_id'], str(r['timestamp']), r[metric]) for r in sites
+    )).encode('utf-8')).hexdigest()
+    lats = [float(r['latitude']) for r in sites]
+    lons = [float(r['longitude']) for r in sites]
+    bbox = bbox or default_bbox(lats, lons)
+    key = (signature, metric, tuple(round(v, 6) for v in bbox), resolution, power)
+
+    body = heatmap_cache.get(key)
+    if body is not None:
+        return body
+    body = single_flight.do(('heatmap',) + key, _render, sites, lats, lons, metric, bbox, resolution, power)
+    heatmap_cache.put(key, body)
+    return body
+
+
+def _render(sites, lats, lons, metric, bbox, resolution, power):
+    cols, rows = grid_shape(bbox, resolution)
+    grid = idw_grid(lats, lons, [float(r[metric]) for r in sites], bbox, cols, rows, power)
+    newest = max(_to_datetime(r['timestamp']) for r in sites)
+    return json.dumps({
+        'success': True,
+        'metric': metric,
+        'time_bucket': newest.replace(minute=0, second=0, microsecond=0).isoformat(),
+        'bbox': list(bbox),
+        'cols': cols,
+        'rows': rows,
+        'power': power,
+        'min': round(float(grid.min()), 2),
+        'max': round(float(grid.max()), 2),
+        'sites': [{'location_id': r['location_id'], 'latitude': r['latitude'],
+                   'longitude': r['longitude'], 'value': r[metric]} for r in sites],
+        # Fila 0 = borde norte, columna 0 = borde oeste
+        'values': [[round(v, 2) for v in row] for row in grid.tolist()]
+    }, default=str)
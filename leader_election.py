@@ -0,0 +1,307 @@
+# leader_election.py - Una sola instancia recolecta aunque haya varias réplicas
+#
+# - SQLite: fila de arriendo (lease) con vencimiento; el líder la renueva
+#   periódicamente y, si muere, otra instancia la toma cuando vence.
+# - Postgres: advisory lock de sesión en una conexión dedicada; si el líder
+#   muere, Postgres libera el lock al cerrarse la conexión.
+#
+# En ambos casos la tabla scheduler_lease guarda quién es el líder y cuándo
+# empezó la última recolección, para que un nuevo líder no la repita.
+#
+# Prueba local con dos procesos sobre la misma base:
+#   DATABASE_URL=sqlite:///data/air_quality.db python leader_election.py
+#   DATABASE_URL=sqlite:///data/air_quality.db python leader_election.py
+#   (detener el líder con Ctrl-C o kill -9: el otro toma el relevo)
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from database_setup import sqlite_path
+
+# Duración del arriendo: el relevo tarda como máximo esto (más un ciclo de renovación)
+LEADER_LEASE_SECONDS = float(os.environ.get('LEADER_LEASE_SECONDS', 30))
+
+
+def leader_election_enabled():
+    """Activa si hay base de datos configurada, salvo LEADER_ELECTION=0"""
+    return bool(os.getenv('DATABASE_URL')) and os.environ.get('LEADER_ELECTION', '1') != '0'
+
+
+def _advisory_key(name):
+    # Clave bigint estable derivada del nombre
+    return int.from_bytes(hashlib.sha1(name.encode('utf-8')).digest()[:8], 'big', signed=True)
+
+
+class _SqliteLease:
+    """Arriendo con vencimiento en una fila de SQLite"""
+
+    def __init__(self, path, name, holder, ttl):
+        self.path = path
+        self.name = name
+        self.holder = holder
+        self.ttl = ttl
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def setup(self):
+        conn = self._connect()
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_lease (
+                name TEXT PRIMARY KEY,
+                holder TEXT,
+                expires_at REAL,
+                acquired_at TEXT,
+                last_run_started TEXT
+            )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def try_acquire(self):
+        """Tomar o renovar el arriendo; True si esta instancia es el líder"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            # Atómico: solo se escribe si el arriendo es nuestro o ya venció
+            conn.execute('''
+            INSERT INTO scheduler_lease (name, holder, expires_at, acquired_at)
+            VALUES (?, ?, ?, datetime('now'))
+            ON CONFLICT(name) DO UPDATE SET
+              holder = excluded.holder,
+              expires_at = excluded.expires_at,
+              acquired_at = CASE WHEN scheduler_lease.holder = excluded.holder
+                                 THEN scheduler_lease.acquired_at ELSE excluded.acquired_at END
+            WHERE scheduler_lease.holder = excluded.holder OR scheduler_lease.expires_at < ?
+            ''', (self.name, self.holder, now + self.ttl, now))
+            conn.commit()
+            row = conn.execute(
+                'SELECT holder FROM scheduler_lease WHERE name = ?', (self.name,)
+            ).fetchone()
+            return bool(row) and row[0] == self.holder
+        finally:
+            conn.close()
+
+    def release(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE scheduler_lease SET expires_at = 0 WHERE name = ? AND holder = ?',
+                (self.name, self.holder)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_run(self, started):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'UPDATE scheduler_lease SET last_run_started = ? WHERE name = ? AND holder = ?',
+                (started, self.name, self.holder)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def last_run_started(self):
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                'SELECT last_run_started FROM scheduler_lease WHERE name = ?', (self.name,)
+            ).fetchone()
+            return row[0] if row else None
+        finally:
+            conn.close()
+
+    def close(self):
+        pass
+
+
+class _PostgresLease:
+    """Advisory lock de sesión en una conexión dedicada (fuera del pool)"""
+
+    def __init__(self, db_url, name, holder):
+        self.db_url = db_url
+        self.name = name
+        self.holder = holder
+        self.key = _advisory_key(name)
+        self._conn = None
+        self._locked = False
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            import psycopg2
+            self._conn = psycopg2.connect(self.db_url)
+            self._conn.autocommit = True
+            self._locked = False
+        return self._conn
+
+    def setup(self):
+        with self._connection().cursor() as cursor:
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduler_lease (
+                name TEXT PRIMARY KEY,
+                holder TEXT,
+                expires_at DOUBLE PRECISION,
+                acquired_at TIMESTAMP,
+                last_run_started TEXT
+            )
+            ''')
+
+    def try_acquire(self):
+        try:
+            with self._connection().cursor() as cursor:
+                if self._locked:
+                    # Ya tenemos el lock: solo comprobar que la sesión sigue viva
+                    cursor.execute('SELECT 1')
+                    return True
+                cursor.execute('SELECT pg_try_advisory_lock(%s)', (self.key,))
+                self._locked = bool(cursor.fetchone()[0])
+                if self._locked:
+                    cursor.execute('''
+                    INSERT INTO scheduler_lease (name, holder, acquired_at)
+                    VALUES (%s, %s, NOW())
+                    ON CONFLICT (name) DO UPDATE SET holder = EXCLUDED.holder, acquired_at = NOW()
+                    ''', (self.name, self.holder))
+                return self._locked
+        except Exception:
+            # Conexión perdida: el lock ya no es nuestro
+            self.close()
+            raise
+
+    def release(self):
+        if self._locked and self._conn is not None and not self._conn.closed:
+            with self._conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', (self.key,))
+        self._locked = False
+
+    def record_run(self, started):
+        with self._connection().cursor() as cursor:
+            cursor.execute(
+                'UPDATE scheduler_lease SET last_run_started = %s WHERE name = %s',
+                (started, self.name)
+            )
+
+    def last_run_started(self):
+        with self._connection().cursor() as cursor:
+            cursor.execute('SELECT last_run_started FROM scheduler_lease WHERE name = %s', (self.name,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+
+    def close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+        self._conn = None
+        self._locked = False
+
+
+class LeaderElection:
+    """Elección de líder con renovación en segundo plano.
+
+    is_leader() es barato (no consulta la base): refleja la última
+    renovación exitosa y deja de ser cierto si no se renovó a tiempo.
+    """
+
+    def __init__(self, name='collector', ttl=LEADER_LEASE_SECONDS, db_url=None):
+        db_url = db_url or os.getenv('DATABASE_URL')
+        if not db_url:
+            raise Exception("DATABASE_URL no está configurada")
+        self.name = name
+        self.ttl = ttl
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        path = sqlite_path(db_url)
+        if path:
+            self._backend = _SqliteLease(path, name, self.holder, ttl)
+        else:
+            self._backend = _PostgresLease(db_url, name, self.holder)
+        self._lock = threading.Lock()
+        self._valid_until = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._backend.setup()
+
+    def is_leader(self):
+        return time.monotonic() < self._valid_until
+
+    def refresh(self):
+        """Intentar tomar o renovar el liderazgo ahora; devuelve si somos líder"""
+        with self._lock:
+            was_leader = self.is_leader()
+            start = time.monotonic()
+            try:
+                leader = self._backend.try_acquire()
+            except Exception as e:
+                logging.error(f"Elección de líder: error renovando ({e})")
+                leader = False
+            # Margen: dejar de actuar como líder antes de que el arriendo venza
+            self._valid_until = start + self.ttl * 0.8 if leader else 0.0
+        if leader and not was_leader:
+            logging.info(f"Elección de líder: esta instancia es líder de '{self.name}' ({self.holder})")
+        elif was_leader and not leader:
+            logging.warning(f"Elección de líder: se perdió el liderazgo de '{self.name}'")
+        return leader
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(self.ttl / 3):
+            self.refresh()
+
+    def start(self):
+        """Intentar el liderazgo y renovarlo (o reintentarlo) cada ttl/3 en un hilo"""
+        self._stop_event.clear()
+        self.refresh()
+        self._thread = threading.Thread(target=self._heartbeat, name='leader-election', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Detener la renovación y liberar el liderazgo para un relevo inmediato"""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(5)
+            self._thread = None
+        with self._lock:
+            try:
+                if self.is_leader():
+                    self._backend.release()
+            except Exception as e:
+                logging.error(f"Elección de líder: error liberando ({e})")
+            self._valid_until = 0.0
+            self._backend.close()
+
+    def record_run(self, started):
+        """Guardar el inicio de la última recolección (visible para las demás instancias)"""
+        try:
+            self._backend.record_run(started)
+        except Exception as e:
+            logging.error(f"Elección de líder: no se pudo registrar la recolección ({e})")
+
+    def last_run_started(self):
+        try:
+            return self._backend.last_run_started()
+        except Exception as e:
+            logging.error(f"Elección de líder: no se pudo leer la última recolección ({e})")
+            return None
+
+
+if __name__ == '__main__':
+    # Demostración: varias copias de este script sobre la misma base
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    election = LeaderElection('demo', ttl=float(os.environ.get('LEADER_LEASE_SECONDS', 6)))
+    election.start()
+    try:
+        while True:
+            print(f"{time.strftime('%H:%M:%S')} pid {os.getpid()}: "
+                  f"{'LÍDER' if election.is_leader() else 'seguidor'}", flush=True)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        election.stop()
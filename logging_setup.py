@@ -0,0 +1,18 @@
+# logging_setup.py - Configuración de logging compartida por el scheduler y el API
+import logging
+import os
+
+
+def configure_logging():
+    """Log a data/air_quality.log y a consola (sin efecto si ya está configurado)"""
+    if not os.path.exists('data'):
+        os.makedirs('data')
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('data/air_quality.log'),
+            logging.StreamHandler()
+        ]
+    )
@@ -0,0 +1,225 @@
+# metrics.py - Métricas de latencia del API y de consultas SQL (formato Prometheus)
+from collections import defaultdict
+from functools import lru_cache
+import re
+import threading
+import time
+
+# Límites de los histogramas (segundos y bytes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Longitud máxima de la huella de una consulta usada como etiqueta
+MAX_FINGERPRINT_LENGTH = 200
+
+
+class Histogram:
+    """Histograma acumulativo por combinación de etiquetas"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counts = defaultdict(lambda: [0] * len(self.buckets))
+        self._sums = defaultdict(float)
+        self._totals = defaultdict(int)
+
+    def observe(self, labels, value):
+        with self._lock:
+            counts = self._counts[labels]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._sums[labels] += value
+            self._totals[labels] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels in sorted(self._totals):
+                base = _format_labels(self.label_names, labels)
+                for bound, count in zip(self.buckets, self._counts[labels]):
+                    lines.append(f"{self.name}_bucket{_with_le(base, bound)} {count}")
+                lines.append(f"{self.name}_bucket{_with_le(base, '+Inf')} {self._totals[labels]}")
+                lines.append(f"{self.name}_sum{_braces(base)} {self._sums[labels]:.6f}")
+                lines.append(f"{self.name}_count{_braces(base)} {self._totals[labels]}")
+        return lines
+
+
+class Counter:
+    """Contador por combinación de etiquetas"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels in sorted(self._values):
+                base = _format_labels(self.label_names, labels)
+                lines.append(f"{self.name}{_braces(base)} {self._values[labels]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _braces(base):
+    return f"{{{base}}}" if base else ''
+
+
+def _with_le(base, bound):
+    le = f'le="{bound}"'
+    return f"{{{base},{le}}}" if base else f"{{{le}}}"
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_PYFORMAT_TOKEN = re.compile(r"'(?:[^']|'')*'|\?|%")
+
+
+def query_fingerprint(sql):
+    """Huella normalizada de una consulta: sin literales ni espacios repetidos"""
+    normalized = _STRING_LITERAL.sub('?', sql)
+    normalized = _NUMBER_LITERAL.sub('?', normalized)
+    normalized = _WHITESPACE.sub(' ', normalized).strip()
+    normalized = _PLACEHOLDER_LIST.sub('(?...)', normalized)
+    return normalized[:MAX_FINGERPRINT_LENGTH]
+
+
+@lru_cache(maxsize=512)
+def to_pyformat(sql):
+    """SQL con marcadores '?' (sqlite3) en el estilo '%s' de psycopg2.
+
+    Los '%' se duplican (también dentro de literales, como pide psycopg2 al
+    pasar parámetros) y los '?' dentro de literales se dejan igual.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token == '?':
+            return '%s'
+        return token.replace('%', '%%')
+    return _PYFORMAT_TOKEN.sub(replace, sql)
+
+
+request_latency = Histogram(
+    'api_request_duration_seconds', 'Latencia de las peticiones por ruta',
+    ('route', 'method'), LATENCY_BUCKETS
+)
+response_size = Histogram(
+    'api_response_size_bytes', 'Tamaño de las respuestas por ruta',
+    ('route', 'method'), SIZE_BUCKETS
+)
+request_status = Counter(
+    'api_requests_total', 'Peticiones por ruta y código de estado',
+    ('route', 'method', 'status')
+)
+query_latency = Histogram(
+    'db_query_duration_seconds', 'Duración de las consultas SQL por huella',
+    ('query',), LATENCY_BUCKETS
+)
+query_errors = Counter(
+    'db_query_errors_total', 'Consultas SQL que lanzaron error por huella',
+    ('query',)
+)
+
+
+# Funciones llamadas después de cada consulta con (sql, parámetros, segundos);
+# las usan herramientas como benchmarks/query_plans.py para capturar el SQL real
+_query_listeners = []
+
+
+def add_query_listener(listener):
+    _query_listeners.append(listener)
+
+
+def remove_query_listener(listener):
+    if listener in _query_listeners:
+        _query_listeners.remove(listener)
+
+
+def observe_request(route, method, status, seconds, size=None):
+    request_latency.observe((route, method), seconds)
+    request_status.inc((route, method, str(status)))
+    if size is not None:
+        response_size.observe((route, method), size)
+
+
+class TimedCursor:
+    """Cursor que mide cada execute/executemany por huella de la consulta.
+
+    El SQL de la aplicación usa '?' como marcador; con un cursor de psycopg2
+    se traduce a '%s' antes de ejecutarlo.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._pyformat = type(cursor).__module__.startswith('psycopg2')
+
+    def _timed(self, method, sql, *args, **kwargs):
+        fingerprint = query_fingerprint(sql)
+        # Sin parámetros psycopg2 no interpreta '%': el SQL va tal cual
+        driver_sql = to_pyformat(sql) if self._pyformat and args and args[0] is not None else sql
+        start = time.perf_counter()
+        try:
+            return method(driver_sql, *args, **kwargs)
+        except Exception:
+            query_errors.inc((fingerprint,))
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            query_latency.observe((fingerprint,), elapsed)
+            for listener in _query_listeners:
+                listener(sql, args[0] if args else None, elapsed)
+
+    def execute(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.execute, sql, *args, **kwargs)
+
+    def executemany(self, sql, *args, **kwargs):
+        return self._timed(self._cursor.executemany, sql, *args, **kwargs)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Conexión cuyos cursores miden las consultas"""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self._conn.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def render_metrics(extra_lines=None):
+    """Todas las métricas del proceso en formato de texto Prometheus"""
+    lines = []
+    for metric in (request_latency, response_size, request_status, query_latency, query_errors):
+        lines.extend(metric.render())
+    if extra_lines:
+        lines.extend(extra_lines)
+    return '\n'.join(lines) + '\n'
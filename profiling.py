@@ -0,0 +1,179 @@
+# profiling.py - Perfilado bajo demanda (cProfile y tracemalloc), apagado por defecto
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+
+# Directorio donde se guardan los perfiles
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join('data', 'profiles'))
+
+# Segundos entre muestras de pila para el flamegraph
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+
+# Solo se permite un perfil a la vez (cProfile no soporta perfiles simultáneos)
+_profile_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """El perfilado solo está disponible si PROFILING_ENABLED=1 o hay PROFILING_TOKEN"""
+    return os.environ.get('PROFILING_ENABLED') == '1' or bool(os.environ.get('PROFILING_TOKEN'))
+
+
+def is_authorized(token):
+    """Validar el token de administrador (si está configurado)"""
+    if not profiling_enabled():
+        return False
+    expected = os.environ.get('PROFILING_TOKEN')
+    if not expected:
+        return True
+    return bool(token) and hmac.compare_digest(token, expected)
+
+
+def _safe_name(label):
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', label).strip('_')[:80] or 'perfil'
+
+
+class _StackSampler:
+    """Muestreo periódico de la pila completa de un hilo (sys._current_frames).
+
+    cProfile solo guarda pares llamador -> llamado, que no alcanzan para
+    reconstruir pilas; para los flamegraphs se toma la pila entera del hilo
+    perfilado cada `interval` segundos y se cuenta cuántas veces aparece.
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Pilas en formato 'collapsed' (raíz;...;hoja muestras) para flamegraph.pl / speedscope"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+@contextmanager
+def profile_block(label, memory=False, directory=PROFILE_DIR):
+    """Perfilar el bloque con cProfile (y tracemalloc si memory=True).
+
+    Guarda en `directory`:
+    - <nombre>.prof: perfil binario (snakeviz, pstats)
+    - <nombre>.txt: top de funciones por tiempo acumulado
+    - <nombre>.collapsed: pilas completas muestreadas del hilo que entra al
+      bloque, para flamegraph.pl / speedscope
+    - <nombre>.mem.txt: top de asignaciones de memoria (si memory=True)
+
+    Entrega un dict donde, al salir, queda 'files' con las rutas generadas
+    (o 'busy' si ya había otro perfil en curso).
+    """
+    result = {'files': []}
+    if not _profile_lock.acquire(blocking=False):
+        result['busy'] = True
+        yield result
+        return
+
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{_safe_name(label)}")
+
+    profile = cProfile.Profile()
+    sampler = _StackSampler(threading.get_ident())
+    started_tracemalloc = False
+    try:
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+            started_tracemalloc = True
+        sampler.start()
+        profile.enable()
+        try:
+            yield result
+        finally:
+            profile.disable()
+            sampler.stop()
+
+            profile.dump_stats(f"{base}.prof")
+            result['files'].append(f"{base}.prof")
+
+            text = io.StringIO()
+            pstats.Stats(profile, stream=text).sort_stats('cumulative').print_stats(50)
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                f.write(text.getvalue())
+            result['files'].append(f"{base}.txt")
+
+            with open(f"{base}.collapsed", 'w', encoding='utf-8') as f:
+                f.write(sampler.collapsed())
+            result['files'].append(f"{base}.collapsed")
+
+            if memory and tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot()
+                current, peak = tracemalloc.get_traced_memory()
+                with open(f"{base}.mem.txt", 'w', encoding='utf-8') as f:
+                    f.write(f"Memoria actual: {current / 1024:.1f} KiB - pico: {peak / 1024:.1f} KiB\n\n")
+                    for stat in snapshot.statistics('lineno')[:50]:
+                        f.write(f"{stat}\n")
+                result['files'].append(f"{base}.mem.txt")
+    finally:
+        if started_tracemalloc:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+
+def _collection_marker(directory=PROFILE_DIR):
+    return os.path.join(directory, 'collect.request')
+
+
+def request_collection_profile(memory=False, directory=PROFILE_DIR):
+    """Pedir que la próxima recolección se perfile (funciona entre procesos)"""
+    os.makedirs(directory, exist_ok=True)
+    with open(_collection_marker(directory), 'w', encoding='utf-8') as f:
+        f.write('memory' if memory else 'cpu')
+
+
+def take_collection_profile_request(directory=PROFILE_DIR):
+    """¿Hay que perfilar esta recolección? Devuelve (perfilar, memoria)"""
+    if not profiling_enabled():
+        return False, False
+    if os.environ.get('PROFILE_COLLECTOR') == '1':
+        return True, os.environ.get('PROFILE_MEMORY') == '1'
+    marker = _collection_marker(directory)
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            mode = f.read().strip()
+        os.remove(marker)
+    except FileNotFoundError:
+        return False, False
+    return True, mode == 'memory'
+
+
+def list_profiles(directory=PROFILE_DIR):
+    """Archivos de perfil guardados (más recientes primero)"""
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name != 'collect.request']
+    return sorted(names, reverse=True)
@@ -0,0 +1,289 @@
+# recent_cache.py - Lecturas recientes por ubicación en memoria (anillos de arreglos tipados)
+#
+# Cada ubicación tiene un anillo de capacidad fija con un array('d') por
+# métrica (NaN = sin valor) y otro con el instante en segundos epoch. Así
+# /api/current/<id> y /api/trends/<id> responden sin tocar la base ni crear
+# un dict por fila.
+#
+# Se mantiene caliente de dos formas:
+# - Precarga al arrancar y un hilo que consulta location_stats (una fila por
+#   ubicación) y revisa la revisión de cada una: si solo se agregaron
+#   lecturas al final trae esas, y si hubo correcciones o lecturas más
+#   antiguas recarga el anillo; sirve cuando la recolección corre en otro
+#   proceso.
+# - Un listener de insert_air_quality_data que agrega cada lectura en el
+#   momento, cuando la recolección corre en este mismo proceso.
+from array import array
+from datetime import datetime, timezone
+import logging
+import math
+import os
+import threading
+import time
+
+from database_setup import add_ingest_listener, get_historical_data, get_location_stats
+
+# Horas de historia que se conservan (trends usa 24 h y 7 días)
+RECENT_CACHE_HOURS = float(os.environ.get('RECENT_CACHE_HOURS', 168))
+# Lecturas por ubicación (168 h a una lectura por hora, con margen)
+RECENT_CACHE_CAPACITY = int(os.environ.get('RECENT_CACHE_CAPACITY', 512))
+# Cada cuánto se buscan lecturas nuevas en location_stats
+RECENT_CACHE_REFRESH_SECONDS = float(os.environ.get('RECENT_CACHE_REFRESH_SECONDS', 15))
+
+METRICS = ('pm2_5', 'pm10', 'o3', 'no2', 'aqi', 'temperature', 'humidity', 'pressure', 'wind_speed')
+
+NAN = float('nan')
+
+
+def recent_cache_enabled():
+    return os.environ.get('RECENT_CACHE_ENABLED', '1') != '0'
+
+
+def _to_epoch(value):
+    """Segundos epoch de un timestamp ISO o datetime (sin zona = UTC)"""
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class ReadingRing:
+    """Anillo de capacidad fija: la lectura más nueva pisa la más antigua"""
+
+    __slots__ = ('capacity', 'size', 'head', 'epochs', 'timestamps', 'values', 'latest', 'stale',
+                 'revision', 'data_count')
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 0
+        self.head = 0  # próxima posición a escribir
+        self.epochs = array('d', [NAN]) * capacity
+        self.timestamps = [None] * capacity
+        self.values = {metric: array('d', [NAN]) * capacity for metric in METRICS}
+        self.latest = None  # última fila tal como la devuelve /api/current/<id>
+        # Llegó una lectura más antigua que la última: hay que recargar desde la BD
+        self.stale = False
+        # revision y data_count de location_stats que refleja el anillo
+        self.revision = None
+        self.data_count = None
+
+    def newest_epoch(self):
+        if not self.size:
+            return None
+        return self.epochs[(self.head - 1) % self.capacity]
+
+    def append(self, row):
+        """Agregar una fila (dict con las columnas de air_quality_data).
+
+        Si trae el mismo timestamp que la última, se combina como el UPSERT
+        (los valores nuevos None no pisan los existentes).
+        """
+        epoch = _to_epoch(row['timestamp'])
+        newest = self.newest_epoch()
+        if newest is not None and epoch < newest:
+            self.stale = True
+            return
+
+        if newest is not None and epoch == newest:
+            index = (self.head - 1) % self.capacity
+            latest = dict(self.latest)
+            for key, value in row.items():
+                if value is not None or key not in latest:
+                    latest[key] = value
+        else:
+            index = self.head
+            self.head = (self.head + 1) % self.capacity
+            self.size = min(self.size + 1, self.capacity)
+            latest = dict(row)
+
+        self.epochs[index] = epoch
+        self.timestamps[index] = latest['timestamp']
+        for metric in METRICS:
+            value = latest.get(metric)
+            self.values[metric][index] = NAN if value is None else float(value)
+        self.latest = latest
+
+    def indices_since(self, since_epoch):
+        """Posiciones con epoch >= since_epoch, de la más antigua a la más nueva"""
+        result = []
+        index = self.head
+        for _ in range(self.size):
+            index = (index - 1) % self.capacity
+            if self.epochs[index] < since_epoch:
+                break
+            result.append(index)
+        result.reverse()
+        return result
+
+
+class RecentReadingsCache:
+    """Anillos por ubicación con precarga, refresco en segundo plano y listener de ingesta"""
+
+    def __init__(self, hours=RECENT_CACHE_HOURS, capacity=RECENT_CACHE_CAPACITY,
+                 refresh_seconds=RECENT_CACHE_REFRESH_SECONDS):
+        self.hours = hours
+        self.capacity = capacity
+        self.refresh_seconds = refresh_seconds
+        self._rings = {}
+        self._lock = threading.Lock()
+        self._ready = False
+        self._thread = None
+        self._listening = False
+
+    # --- mantenimiento ---
+
+    def ensure_started(self):
+        """Arrancar la precarga y el refresco (barato si ya están en marcha; seguro tras fork)"""
+        if not recent_cache_enabled():
+            return
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            if not self._listening:
+                add_ingest_listener(self.on_ingest)
+                self._listening = True
+            self._thread = threading.Thread(target=self._run, name='recent-cache', daemon=True)
+            self._thread.start()
+
+    def _load_location(self, stats):
+        """Anillo nuevo con la ventana que termina en la última lectura de la ubicación"""
+        ring = ReadingRing(self.capacity)
+        since = datetime.fromtimestamp(_to_epoch(stats['last_timestamp']) - self.hours * 3600, timezone.utc)
+        rows = get_historical_data(location_id=stats['location_id'], start_date=since.isoformat(),
+                                   limit=self.capacity)
+        for row in reversed(rows):
+            ring.append(row)
+        ring.revision, ring.data_count = stats['revision'], stats['data_count']
+        return ring
+
+    def preload(self):
+        """Cargar todas las ubicaciones con datos (una consulta por ubicación)"""
+        rings = {}
+        for stats in get_location_stats():
+            if stats['last_timestamp']:
+                rings[stats['location_id']] = self._load_location(stats)
+        with self._lock:
+            self._rings = rings
+            self._ready = True
+        return len(rings)
+
+    def refresh(self):
+        """Poner al día los anillos de las ubicaciones cuya revisión cambió.
+
+        Cada fila insertada o actualizada sube `revision` en uno. Si todo lo
+        nuevo son filas agregadas después de la última del anillo (tantas
+        como suben revision y data_count), se traen solo esas; si no (una
+        corrección, una lectura más antigua), se recarga el anillo.
+        """
+        updated = 0
+        for stats in get_location_stats():
+            location_id, last_timestamp = stats['location_id'], stats['last_timestamp']
+            if not last_timestamp:
+                continue
+            with self._lock:
+                ring = self._rings.get(location_id)
+                newest = ring.newest_epoch() if ring is not None else None
+                stale = ring is not None and ring.stale
+            if ring is not None and not stale and ring.revision == stats['revision']:
+                continue
+            if ring is None or stale or newest is None or ring.revision is None:
+                self._replace_ring(stats)
+                updated += 1
+                continue
+            changes = stats['revision'] - ring.revision
+            rows = []
+            if stats['data_count'] - ring.data_count == changes and _to_epoch(last_timestamp) > newest:
+                since = datetime.fromtimestamp(newest, timezone.utc).isoformat()
+                rows = [row for row in get_historical_data(location_id=location_id, start_date=since)
+                        if _to_epoch(row['timestamp']) > newest]
+            if len(rows) != changes:
+                self._replace_ring(stats)
+                updated += 1
+                continue
+            with self._lock:
+                for row in reversed(rows):
+                    ring.append(row)
+                ring.revision, ring.data_count = stats['revision'], stats['data_count']
+            updated += 1
+        return updated
+
+    def _replace_ring(self, stats):
+        ring = self._load_location(stats)
+        with self._lock:
+            self._rings[stats['location_id']] = ring
+
+    def _run(self):
+        while True:
+            try:
+                if not self._ready:
+                    started = time.perf_counter()
+                    count = self.preload()
+                    logging.info(f"Caché de lecturas recientes: {count} ubicaciones en "
+                                 f"{time.perf_counter() - started:.2f}s")
+                else:
+                    self.refresh()
+            except Exception as e:
+                logging.error(f"Error actualizando la caché de lecturas recientes: {e}")
+            time.sleep(self.refresh_seconds)
+
+    def on_ingest(self, row):
+        """Listener de insert_air_quality_data: agrega la lectura en el momento"""
+        if not self._ready:
+            return
+        with self._lock:
+            ring = self._rings.get(row['location_id'])
+            if ring is None:
+                ring = self._rings[row['location_id']] = ReadingRing(self.capacity)
+            ring.append(row)
+
+    # --- consultas ---
+
+    def ready(self):
+        return self._ready
+
+    def location_count(self):
+        with self._lock:
+            return len(self._rings)
+
+    def latest(self, location_id):
+        """Última fila de la ubicación (None si no hay datos)"""
+        with self._lock:
+            ring = self._rings.get(location_id)
+            return ring.latest if ring is not None else None
+
+    def latest_readings(self):
+        """Última fila de cada ubicación (compartidas: no modificarlas)"""
+        with self._lock:
+            return [ring.latest for ring in self._rings.values() if ring.latest is not None]
+
+    def trends(self, location_id, now=None):
+        """Series PM2.5/PM10 de 24 h y distribución AQI de 7 días, igual que /api/trends"""
+        now = time.time() if now is None else now
+        pm25_24h, pm10_24h = [], []
+        dist = {'1': 0, '2': 0, '3': 0, '4': 0, '5': 0}
+        with self._lock:
+            ring = self._rings.get(location_id)
+            if ring is None:
+                return pm25_24h, pm10_24h, dist
+            since_24h = now - 86400
+            pm25, pm10, aqi = ring.values['pm2_5'], ring.values['pm10'], ring.values['aqi']
+            for index in ring.indices_since(now - 7 * 86400):
+                value = aqi[index]
+                if not math.isnan(value):
+                    key = str(int(value))
+                    if key in dist:
+                        dist[key] += 1
+                if ring.epochs[index] < since_24h:
+                    continue
+                if not math.isnan(pm25[index]):
+                    pm25_24h.append({'t': ring.timestamps[index], 'v': round(pm25[index], 2)})
+                if not math.isnan(pm10[index]):
+                    pm10_24h.append({'t': ring.timestamps[index], 'v': round(pm10[index], 2)})
+        return pm25_24h, pm10_24h, dist
+
+
+recent_readings = RecentReadingsCache()
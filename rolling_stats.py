@@ -0,0 +1,187 @@
+# rolling_stats.py - Estadísticas de ventana móvil por ubicación, actualizadas en O(1) por lectura
+#
+# La ventana se guarda como cubetas horarias (hora epoch -> sumas y conteos)
+# más los totales acumulados. Una lectura nueva suma en su cubeta y, si
+# avanza la hora más reciente, resta las cubetas que salen de la ventana:
+# el trabajo por lectura no depende del histórico, solo de las horas que
+# avanzó el reloj (como máximo el tamaño de la ventana).
+#
+# Las ventanas terminan en la hora de la última lectura de la ubicación (no
+# en la hora actual), así que window_end indica qué tan recientes son.
+from datetime import datetime, timezone
+import json
+
+# Ventana de promedios PM (horas)
+MEAN_WINDOW_HOURS = 24
+# Ventana de la distribución de categorías AQI (horas)
+DISTRIBUTION_WINDOW_HOURS = 168
+# Horas que usa NowCast y factor de peso mínimo para material particulado (EPA)
+NOWCAST_HOURS = 12
+NOWCAST_MIN_WEIGHT = 0.5
+
+# Posiciones dentro de cada cubeta: sumas/conteos PM y conteos AQI 1..5
+PM25_SUM, PM25_COUNT, PM10_SUM, PM10_COUNT = 0, 1, 2, 3
+AQI_FIRST = 4
+BUCKET_SIZE = AQI_FIRST + 5
+
+
+def hour_index(timestamp):
+    """Horas desde epoch de un timestamp ISO o datetime (sin zona = UTC)"""
+    if not isinstance(timestamp, datetime):
+        timestamp = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    return int(timestamp.timestamp() // 3600)
+
+
+def nowcast(hourly_means):
+    """NowCast de PM (EPA) a partir de promedios horarios, del más reciente al más antiguo.
+
+    Las horas sin dato van como None. Requiere al menos 2 de las 3 horas
+    más recientes; si no, devuelve None.
+    """
+    hourly_means = hourly_means[:NOWCAST_HOURS]
+    if sum(1 for value in hourly_means[:3] if value is not None) < 2:
+        return None
+    present = [value for value in hourly_means if value is not None]
+    highest = max(present)
+    weight = 1.0 if highest <= 0 else max(1 - (highest - min(present)) / highest, NOWCAST_MIN_WEIGHT)
+
+    numerator = denominator = 0.0
+    factor = 1.0
+    for value in hourly_means:
+        if value is not None:
+            numerator += factor * value
+            denominator += factor
+        factor *= weight
+    return numerator / denominator
+
+
+class RollingWindow:
+    """Estado de la ventana móvil de una ubicación (serializable a JSON)"""
+
+    def __init__(self, newest_hour=None, buckets=None, totals=None):
+        self.newest_hour = newest_hour
+        self.buckets = buckets or {}
+        self.totals = totals or [0] * BUCKET_SIZE
+
+    @classmethod
+    def from_json(cls, text):
+        if not text:
+            return cls()
+        state = json.loads(text)
+        buckets = {int(hour): values for hour, values in state['buckets'].items()}
+        return cls(state['newest_hour'], buckets, state['totals'])
+
+    def to_json(self):
+        return json.dumps({
+            'newest_hour': self.newest_hour,
+            'buckets': self.buckets,
+            'totals': self.totals,
+        }, separators=(',', ':'))
+
+    def _expire_mean(self, hour):
+        bucket = self.buckets.get(hour)
+        if bucket:
+            for i in (PM25_SUM, PM25_COUNT, PM10_SUM, PM10_COUNT):
+                self.totals[i] -= bucket[i]
+
+    def _expire_distribution(self, hour):
+        bucket = self.buckets.pop(hour, None)
+        if bucket:
+            for i in range(AQI_FIRST, BUCKET_SIZE):
+                self.totals[i] -= bucket[i]
+
+    def _advance(self, hour):
+        """Mover la hora más reciente hasta `hour`, restando lo que sale de las ventanas"""
+        old = self.newest_hour
+        # Horas que salen de la ventana de 24 h: (old - 24, hour - 24]
+        # (no hay cubetas posteriores a old, así que son a lo sumo 24)
+        for h in range(old - MEAN_WINDOW_HOURS + 1, min(old, hour - MEAN_WINDOW_HOURS) + 1):
+            self._expire_mean(h)
+        # Horas que salen de la ventana de 7 días
+        for h in range(old - DISTRIBUTION_WINDOW_HOURS + 1, min(old, hour - DISTRIBUTION_WINDOW_HOURS) + 1):
+            self._expire_distribution(h)
+        if hour - old >= DISTRIBUTION_WINDOW_HOURS:
+            # Salto mayor que la ventana: no queda nada vigente
+            self.buckets = {}
+            self.totals = [0] * BUCKET_SIZE
+        self.newest_hour = hour
+
+    def add(self, timestamp, pm2_5=None, pm10=None, aqi=None):
+        """Sumar una lectura; devuelve False si quedó fuera de la ventana"""
+        hour = hour_index(timestamp)
+        if self.newest_hour is None:
+            self.newest_hour = hour
+        elif hour > self.newest_hour:
+            self._advance(hour)
+        elif hour <= self.newest_hour - DISTRIBUTION_WINDOW_HOURS:
+            return False
+
+        bucket = self.buckets.get(hour)
+        if bucket is None:
+            bucket = self.buckets[hour] = [0] * BUCKET_SIZE
+        self._put(hour, bucket, 1, pm2_5, pm10, aqi)
+        return True
+
+    def remove(self, timestamp, pm2_5=None, pm10=None, aqi=None):
+        """Restar una lectura ya sumada (cuando se corrigen sus valores); False si ya salió de la ventana"""
+        hour = hour_index(timestamp)
+        bucket = self.buckets.get(hour)
+        if bucket is None or hour <= self.newest_hour - DISTRIBUTION_WINDOW_HOURS:
+            return False
+        self._put(hour, bucket, -1, pm2_5, pm10, aqi)
+        return True
+
+    def _put(self, hour, bucket, sign, pm2_5, pm10, aqi):
+        in_mean_window = hour > self.newest_hour - MEAN_WINDOW_HOURS
+
+        def put(i, amount):
+            bucket[i] += amount
+            if in_mean_window or i >= AQI_FIRST:
+                self.totals[i] += amount
+
+        if pm2_5 is not None:
+            put(PM25_SUM, sign * float(pm2_5))
+            put(PM25_COUNT, sign)
+        if pm10 is not None:
+            put(PM10_SUM, sign * float(pm10))
+            put(PM10_COUNT, sign)
+        if aqi is not None and 1 <= int(aqi) <= 5:
+            put(AQI_FIRST + int(aqi) - 1, sign)
+
+    def _hourly_means(self, sum_index, count_index):
+        means = []
+        for hour in range(self.newest_hour, self.newest_hour - NOWCAST_HOURS, -1):
+            bucket = self.buckets.get(hour)
+            if bucket and bucket[count_index]:
+                means.append(bucket[sum_index] / bucket[count_index])
+            else:
+                means.append(None)
+        return means
+
+    def summary(self):
+        """Valores listos para guardar y servir (columnas de location_rolling_stats)"""
+        if self.newest_hour is None:
+            return None
+        totals = self.totals
+        pm25_count = int(round(totals[PM25_COUNT]))
+        pm10_count = int(round(totals[PM10_COUNT]))
+        pm25_nowcast = nowcast(self._hourly_means(PM25_SUM, PM25_COUNT))
+        pm10_nowcast = nowcast(self._hourly_means(PM10_SUM, PM10_COUNT))
+        return {
+            'window_end': datetime.fromtimestamp(self.newest_hour * 3600, timezone.utc).isoformat(),
+            'pm25_sum_24h': totals[PM25_SUM] if pm25_count else 0.0,
+            'pm25_count_24h': pm25_count,
+            'pm25_mean_24h': round(totals[PM25_SUM] / pm25_count, 2) if pm25_count else None,
+            'pm10_sum_24h': totals[PM10_SUM] if pm10_count else 0.0,
+            'pm10_count_24h': pm10_count,
+            'pm10_mean_24h': round(totals[PM10_SUM] / pm10_count, 2) if pm10_count else None,
+            'pm25_nowcast': round(pm25_nowcast, 2) if pm25_nowcast is not None else None,
+            'pm10_nowcast': round(pm10_nowcast, 2) if pm10_nowcast is not None else None,
+            'aqi_1_7d': int(round(totals[AQI_FIRST])),
+            'aqi_2_7d': int(round(totals[AQI_FIRST + 1])),
+            'aqi_3_7d': int(round(totals[AQI_FIRST + 2])),
+            'aqi_4_7d': int(round(totals[AQI_FIRST + 3])),
+            'aqi_5_7d': int(round(totals[AQI_FIRST + 4])),
+        }
@@ -0,0 +1,82 @@
+# singleflight.py - Coalescencia de consultas idénticas concurrentes
+from collections import defaultdict
+import functools
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Si llegan varias llamadas con la misma clave mientras una está en curso,
+    solo la primera ejecuta la función; las demás esperan y reciben el mismo
+    resultado (o la misma excepción).
+
+    El resultado es compartido: quien lo recibe no debe modificarlo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = defaultdict(lambda: {'calls': 0, 'executions': 0, 'coalesced': 0})
+
+    def do(self, key, fn, *args, **kwargs):
+        name = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            stats = self._stats[name]
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                stats['executions'] += 1
+            else:
+                stats['coalesced'] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    def stats(self):
+        """Métricas por función: llamadas, ejecuciones reales y llamadas coalescidas"""
+        with self._lock:
+            result = {name: dict(values) for name, values in self._stats.items()}
+            in_flight = len(self._calls)
+        return {'functions': result, 'in_flight': in_flight}
+
+
+single_flight = SingleFlight()
+
+
+def coalesce(fn):
+    """Decorador: llamadas concurrentes con los mismos argumentos comparten una ejecución"""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        try:
+            hash(key)
+        except TypeError:
+            # Argumentos no hashables: ejecutar sin coalescer
+            return fn(*args, **kwargs)
+        return single_flight.do(key, fn, *args, **kwargs)
+
+    return wrapper
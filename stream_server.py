@@ -0,0 +1,164 @@
+# stream_server.py - /api/stream en un proceso propio con asyncio (sin un hilo por cliente)
+#
+# En el API cada conexión SSE ocupa un hilo del worker durante toda su vida,
+# así que solo caben unos pocos visores. Aquí cada cliente es una corrutina:
+# miles de conexiones ociosas cuestan un socket y una cola cada una. Las
+# lecturas nuevas las detecta el mismo ReadingBroadcaster del API (un hilo
+# que consulta location_stats) y se pasan al event loop con
+# call_soon_threadsafe.
+#
+# Se inicia con `python scheduler.py stream` (el modo both con
+# BOTH_API_MODE=serve lo supervisa solo). Con STREAM_PORT definido, el
+# /api/stream del API redirige aquí, así que el frontend no cambia.
+import asyncio
+import logging
+import os
+import signal
+
+from event_stream import ReadingBroadcaster, format_sse, STREAM_MAX_SUBSCRIBERS
+
+# Segundos entre comentarios SSE que mantienen viva una conexión ociosa
+STREAM_HEARTBEAT_SECONDS = int(os.environ.get('STREAM_HEARTBEAT_SECONDS', 25))
+# Tiempo máximo para recibir la línea de petición y los encabezados
+STREAM_REQUEST_TIMEOUT = 10
+
+CORS_HEADERS = 'Access-Control-Allow-Origin: *\r\n'
+
+
+def stream_port():
+    """STREAM_PORT o, por defecto, el puerto siguiente al del API"""
+    return int(os.environ.get('STREAM_PORT') or int(os.environ.get('PORT', 5000)) + 1)
+
+
+class _LoopQueue:
+    """Cola asyncio que el hilo del broadcaster puede llenar (descarta si el cliente va atrasado)"""
+
+    def __init__(self, loop, maxsize):
+        self._loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def put_nowait(self, event):
+        self._loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+
+class StreamServer:
+    def __init__(self, broadcaster, heartbeat=STREAM_HEARTBEAT_SECONDS):
+        self.broadcaster = broadcaster
+        self.heartbeat = heartbeat
+        self._clients = set()
+
+    async def close_all(self):
+        """Cortar las conexiones abiertas (al detener el servidor)"""
+        tasks = list(self._clients)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def handle(self, reader, writer):
+        task = asyncio.current_task()
+        self._clients.add(task)
+        try:
+            try:
+                method, path = await asyncio.wait_for(self._read_request(reader), STREAM_REQUEST_TIMEOUT)
+            except (asyncio.TimeoutError, ValueError):
+                return
+            if method != 'GET':
+                await self._respond(writer, '405 Method Not Allowed', '{"success": false}')
+            elif path == '/api/health':
+                await self._respond(writer, '200 OK', '{"status": "healthy"}')
+            elif path == '/api/stream':
+                await self._stream(writer)
+            else:
+                await self._respond(writer, '404 Not Found', '{"success": false}')
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            self._clients.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _read_request(reader):
+        request_line = (await reader.readline()).decode('latin-1').split()
+        if len(request_line) < 2:
+            raise ValueError("petición vacía")
+        # Los encabezados no se usan; basta con consumirlos
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return request_line[0], request_line[1].split('?', 1)[0]
+
+    @staticmethod
+    async def _respond(writer, status, body):
+        data = body.encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{CORS_HEADERS}"
+            f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data
+        )
+        await writer.drain()
+
+    async def _stream(self, writer):
+        q = _LoopQueue(asyncio.get_running_loop(), self.broadcaster.queue_size)
+        if self.broadcaster.subscribe(q) is None:
+            writer.write(
+                f"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 60\r\n{CORS_HEADERS}"
+                "Content-Length: 0\r\nConnection: close\r\n\r\n".encode()
+            )
+            await writer.drain()
+            return
+        try:
+            writer.write(
+                f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n{CORS_HEADERS}"
+                "Cache-Control: no-cache\r\nX-Accel-Buffering: no\r\nConnection: close\r\n\r\n"
+                # Indicar al navegador cuánto esperar antes de reconectar
+                "retry: 10000\n\n".encode()
+            )
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(q.queue.get(), self.heartbeat)
+                    writer.write(format_sse(event).encode())
+                except asyncio.TimeoutError:
+                    # Comentario SSE para mantener viva la conexión (y notar si se cerró)
+                    writer.write(b": ping\n\n")
+                await writer.drain()
+        finally:
+            self.broadcaster.unsubscribe(q)
+
+
+async def serve(host='0.0.0.0', port=None, broadcaster=None):
+    """Atender /api/stream y /api/health hasta recibir SIGTERM o SIGINT"""
+    port = port or stream_port()
+    if broadcaster is None:
+        broadcaster = ReadingBroadcaster(
+            poll_seconds=int(os.environ.get('STREAM_POLL_SECONDS', 15)),
+            max_subscribers=int(STREAM_MAX_SUBSCRIBERS) if STREAM_MAX_SUBSCRIBERS else None
+        )
+    stream_server = StreamServer(broadcaster)
+    server = await asyncio.start_server(stream_server.handle, host, port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl-C llega como KeyboardInterrupt
+            pass
+
+    logging.info(f"Servidor de stream en puerto {port}")
+    await stop.wait()
+    server.close()
+    await stream_server.close_all()
+    await server.wait_closed()
+
+
+def run_stream_server():
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,155 @@
+# supervisor.py - Modo "both": scheduler y API en procesos separados
+#
+# Cada parte corre en su propio intérprete (sin compartir el GIL ni fallos).
+# El supervisor revisa su salud, los reinicia con espera creciente si caen y
+# los detiene de forma ordenada con SIGTERM o Ctrl-C.
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+# Cada cuánto se revisan los procesos hijos
+SUPERVISOR_CHECK_SECONDS = float(os.environ.get('SUPERVISOR_CHECK_SECONDS', 10))
+# Fallos seguidos del chequeo HTTP antes de reiniciar el API
+SUPERVISOR_HEALTH_FAILURES = int(os.environ.get('SUPERVISOR_HEALTH_FAILURES', 3))
+# Tiempo de gracia para que un hijo termine tras SIGTERM
+SUPERVISOR_SHUTDOWN_TIMEOUT = float(os.environ.get('SUPERVISOR_SHUTDOWN_TIMEOUT', 20))
+# Espera máxima entre reinicios (la espera se duplica con cada caída seguida)
+SUPERVISOR_MAX_BACKOFF = float(os.environ.get('SUPERVISOR_MAX_BACKOFF', 60))
+# Un hijo que lleva este tiempo vivo se considera estable (se reinicia la espera)
+SUPERVISOR_STABLE_SECONDS = float(os.environ.get('SUPERVISOR_STABLE_SECONDS', 60))
+
+SCHEDULER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scheduler.py')
+
+
+class ChildProcess:
+    """Un proceso hijo supervisado (con chequeo HTTP opcional)"""
+
+    def __init__(self, name, args, health_url=None, startup_grace=15):
+        self.name = name
+        self.args = args
+        self.health_url = health_url
+        self.startup_grace = startup_grace
+        self.process = None
+        self.started_at = None
+        self.restarts = 0
+        self.health_failures = 0
+        self.backoff = 1.0
+        self.next_start = 0.0
+        self.last_check = 0.0
+
+    def start(self):
+        kwargs = {}
+        if os.name == 'posix':
+            # Sesión propia: el Ctrl-C de la terminal lo recibe solo el supervisor
+            kwargs['start_new_session'] = True
+        self.process = subprocess.Popen(self.args, **kwargs)
+        self.started_at = time.monotonic()
+        self.health_failures = 0
+        logging.info(f"[supervisor] {self.name} iniciado (pid {self.process.pid})")
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def check_health(self):
+        """True si el proceso vive y (si aplica) responde al chequeo HTTP"""
+        if not self.is_alive():
+            return False
+        if not self.health_url or time.monotonic() - self.started_at < self.startup_grace:
+            return True
+        try:
+            with urllib.request.urlopen(self.health_url, timeout=5) as response:
+                healthy = response.status == 200
+        except Exception:
+            healthy = False
+        self.health_failures = 0 if healthy else self.health_failures + 1
+        return self.health_failures < SUPERVISOR_HEALTH_FAILURES
+
+    def stop(self, timeout=SUPERVISOR_SHUTDOWN_TIMEOUT):
+        """SIGTERM y, si no termina a tiempo, SIGKILL"""
+        if not self.is_alive():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logging.warning(f"[supervisor] {self.name} no terminó en {timeout:g}s; forzando cierre")
+            self.process.kill()
+            self.process.wait()
+        logging.info(f"[supervisor] {self.name} detenido (código {self.process.returncode})")
+
+
+class Supervisor:
+    def __init__(self, children, check_interval=SUPERVISOR_CHECK_SECONDS):
+        self.children = children
+        self.check_interval = check_interval
+        self._stop_event = threading.Event()
+
+    def _handle_signal(self, signum, frame):
+        logging.info(f"[supervisor] Señal {signum} recibida; deteniendo procesos")
+        self._stop_event.set()
+
+    def _schedule_restart(self, child, reason):
+        now = time.monotonic()
+        if child.started_at is not None and now - child.started_at >= SUPERVISOR_STABLE_SECONDS:
+            child.backoff = 1.0
+        child.next_start = now + child.backoff
+        logging.warning(f"[supervisor] {child.name} {reason}; reinicio en {child.backoff:g}s")
+        child.backoff = min(child.backoff * 2, SUPERVISOR_MAX_BACKOFF)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._handle_signal)
+        signal.signal(signal.SIGTERM, self._handle_signal)
+
+        for child in self.children:
+            child.start()
+
+        try:
+            while not self._stop_event.wait(min(self.check_interval, 1.0)):
+                now = time.monotonic()
+                for child in self.children:
+                    if child.process is None:
+                        if now >= child.next_start:
+                            child.restarts += 1
+                            child.start()
+                        continue
+                    if not child.is_alive():
+                        self._schedule_restart(child, f"terminó (código {child.process.returncode})")
+                        child.process = None
+                    elif now - child.last_check >= self.check_interval:
+                        child.last_check = now
+                        if not child.check_health():
+                            child.stop()
+                            self._schedule_restart(child, "no responde al chequeo de salud")
+                            child.process = None
+        finally:
+            # Detener en paralelo: el tiempo de gracia no se suma entre hijos
+            threads = [threading.Thread(target=child.stop) for child in self.children if child.is_alive()]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+
+def run_both(api_mode='api'):
+    """Supervisar `scheduler.py scheduler` y `scheduler.py <api_mode>` como procesos hijos
+
+    Con api_mode 'serve' también `scheduler.py stream`: los workers del API
+    redirigen /api/stream a ese proceso (STREAM_PORT se hereda).
+    """
+    port = int(os.environ.get('PORT', 5000))
+    children = [
+        ChildProcess('scheduler', [sys.executable, SCHEDULER_SCRIPT, 'scheduler']),
+        ChildProcess('api', [sys.executable, SCHEDULER_SCRIPT, api_mode],
+                     health_url=f"http://127.0.0.1:{port}/api/health"),
+    ]
+    if api_mode == 'serve':
+        stream_port = int(os.environ.setdefault('STREAM_PORT', str(port + 1)))
+        children.append(ChildProcess('stream', [sys.executable, SCHEDULER_SCRIPT, 'stream'],
+                                     health_url=f"http://127.0.0.1:{stream_port}/api/health"))
+    supervisor = Supervisor(children)
+    supervisor.run()
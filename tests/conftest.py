@@ -0,0 +1,31 @@
+# conftest.py - Base SQLite temporaria para las pruebas de ingesta y agregados
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database_setup
+
+START = datetime(2025, 3, 1, 5, 0, tzinfo=timezone.utc)
+
+
+def hour(n):
+    """Timestamp ISO UTC de la hora n desde START (como los guarda la ingesta)"""
+    return (START + timedelta(hours=n)).isoformat()
+
+
+def ingest(location_id, timestamp, pm2_5=None, pm10=None, o3=None, no2=None, aqi=None):
+    assert database_setup.insert_air_quality_data(
+        location_id, location_id.title(), 7.3, -73.6, timestamp, pm2_5, pm10, o3, no2, aqi)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Base vacía con el esquema completo; create_database escribe en tmp_path"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'air_quality.db'}")
+    database_setup.create_database()
+    return tmp_path / 'air_quality.db'
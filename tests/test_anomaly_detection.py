@@ -0,0 +1,55 @@
+# test_anomaly_detection.py - Cuarentena en la ingesta y rachas registradas una vez
+import sqlite3
+
+from anomaly_detection import ANOMALY_FLATLINE_RUN, ANOMALY_WARMUP, LocationDetector
+from database_setup import get_anomalies
+from conftest import hour, ingest
+
+
+def stored_pm25(db, timestamp):
+    with sqlite3.connect(db) as conn:
+        return conn.execute(
+            'SELECT pm2_5 FROM air_quality_data WHERE location_id = ? AND timestamp = ?',
+            ('norte', timestamp)).fetchone()[0]
+
+
+def warm_up(readings=ANOMALY_WARMUP + 6):
+    for n in range(readings):
+        ingest('norte', hour(n), pm2_5=10 + n % 4, pm10=20 + n % 3)
+    return readings
+
+
+def test_spike_is_quarantined(db):
+    n = warm_up()
+    ingest('norte', hour(n), pm2_5=500, pm10=21)
+    assert stored_pm25(db, hour(n)) is None
+    spikes = [a for a in get_anomalies('norte') if a['kind'] == 'spike']
+    assert [(a['metric'], a['value'], a['quarantined']) for a in spikes] == [('pm2_5', 500, 1)]
+
+
+def test_quarantined_value_stays_null_after_reingest(db):
+    n = warm_up()
+    ingest('norte', hour(n), pm2_5=500, pm10=21)
+    # El backfill vuelve a enviar la misma lectura
+    ingest('norte', hour(n), pm2_5=500, pm10=22)
+    assert stored_pm25(db, hour(n)) is None
+    with sqlite3.connect(db) as conn:
+        pm10 = conn.execute('SELECT pm10 FROM air_quality_data WHERE timestamp = ?', (hour(n),)).fetchone()[0]
+    assert pm10 == 22
+
+
+def test_flatline_is_recorded_once_per_run(db):
+    for n in range(ANOMALY_FLATLINE_RUN * 4):
+        ingest('norte', hour(n), pm2_5=0.5, pm10=20 + n % 3)
+    flatlines = [a for a in get_anomalies('norte') if a['kind'] == 'flatline']
+    assert len(flatlines) == 1
+    assert flatlines[0]['timestamp'] == hour(ANOMALY_FLATLINE_RUN - 1)
+
+
+def test_detector_state_round_trips():
+    detector = LocationDetector()
+    for n in range(ANOMALY_WARMUP):
+        detector.check(hour(n), {'pm2_5': 10 + n % 4})
+    restored = LocationDetector.from_json(detector.to_json())
+    assert restored.check(hour(ANOMALY_WARMUP), {'pm2_5': 500}) == \
+        detector.check(hour(ANOMALY_WARMUP), {'pm2_5': 500})
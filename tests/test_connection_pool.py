@@ -0,0 +1,61 @@
+# test_connection_pool.py - get_connection espera turno en el pool en lugar de fallar
+import sqlite3
+import threading
+import time
+
+import pytest
+from psycopg2.pool import PoolError
+
+import database_setup
+
+
+class FakePool:
+    """Pool mínimo con la interfaz de ThreadedConnectionPool (falla si se agota)"""
+
+    def __init__(self, maxconn):
+        self.free = [sqlite3.connect(':memory:', check_same_thread=False) for _ in range(maxconn)]
+
+    def getconn(self):
+        if not self.free:
+            raise PoolError("connection pool exhausted")
+        return self.free.pop()
+
+    def putconn(self, conn):
+        self.free.append(conn)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    fake = FakePool(2)
+    monkeypatch.setattr(database_setup, '_connection_pool', fake)
+    monkeypatch.setattr(database_setup, '_pool_slots', threading.BoundedSemaphore(2))
+    monkeypatch.setattr(database_setup, 'DB_POOL_TIMEOUT', 0.2)
+    return fake
+
+
+def test_checkout_waits_for_a_free_connection(pool):
+    first = database_setup.get_connection()
+    database_setup.get_connection()
+
+    threading.Timer(0.05, first.close).start()
+    started = time.monotonic()
+    third = database_setup.get_connection()
+    assert time.monotonic() - started >= 0.04
+    third.close()
+
+
+def test_checkout_times_out_when_pool_stays_exhausted(pool):
+    held = [database_setup.get_connection() for _ in range(2)]
+    with pytest.raises(PoolError):
+        database_setup.get_connection()
+    for conn in held:
+        conn.close()
+    database_setup.get_connection().close()
+
+
+def test_failed_query_returns_connection(pool):
+    # Las conexiones del pool falso no tienen tablas: cada consulta falla
+    for _ in range(3):
+        with pytest.raises(sqlite3.OperationalError):
+            database_setup.get_location_stats()
+    assert len(pool.free) == 2
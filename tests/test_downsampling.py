@@ -0,0 +1,43 @@
+# test_downsampling.py - downsample_rows usa todo el presupuesto y conserva los picos
+import math
+
+import pytest
+
+from downsampling import downsample_rows
+from conftest import hour
+
+N = 2000
+
+
+def make_rows(pm2_5=lambda n: 20 + 10 * math.sin(n / 50), pm10=lambda n: 40 + 15 * math.cos(n / 70)):
+    return [{'timestamp': hour(n), 'pm2_5': pm2_5(n), 'pm10': pm10(n)} for n in range(N)]
+
+
+@pytest.mark.parametrize('method', ['lttb', 'minmax'])
+def test_fills_the_budget_with_several_metrics(method):
+    rows = make_rows()
+    rows[1234]['pm2_5'] = 500
+    result = downsample_rows(rows, 200, metrics=('pm2_5', 'pm10'), method=method)
+    assert len(result) == 200
+    assert rows[1234] in result
+    timestamps = [r['timestamp'] for r in result]
+    assert timestamps == sorted(timestamps) and len(set(timestamps)) == 200
+
+
+def test_metric_without_values_falls_back_to_uniform():
+    rows = make_rows(pm2_5=lambda n: None)
+    result = downsample_rows(rows, 100, metrics=('pm2_5',))
+    assert len(result) == 100
+    assert result[0] is rows[0] and result[-1] is rows[-1]
+
+
+def test_tiny_budget_never_overshoots():
+    result = downsample_rows(make_rows(), 4, metrics=('pm2_5', 'pm10', 'o3'))
+    assert len(result) == 4
+
+
+def test_unknown_metric_is_rejected(db):
+    from api import app
+    response = app.test_client().get('/api/historical/norte?max_points=50&downsample_by=pm25')
+    assert response.status_code == 400
+    assert 'pm25' in response.get_json()['error']
@@ -0,0 +1,75 @@
+# test_exceedances.py - Días sobre la guía OMS incrementales frente a rebuild_exceedances
+import random
+import sqlite3
+from datetime import date
+
+import pytest
+
+from database_setup import get_exceedance_counts, rebuild_exceedances
+from exceedances import split_range
+from conftest import hour, ingest
+
+
+def snapshot(db):
+    with sqlite3.connect(db) as conn:
+        daily = conn.execute('SELECT * FROM daily_exceedances ORDER BY location_id, day').fetchall()
+        rollups = conn.execute('''
+        SELECT * FROM exceedance_rollups WHERE exceedance_days != 0 OR complete_days != 0
+        ORDER BY location_id, pollutant, period, period_key
+        ''').fetchall()
+    return daily, rollups
+
+
+def assert_matches_rebuild(db):
+    daily, rollups = snapshot(db)
+    rebuild_exceedances()
+    expected_daily, expected_rollups = snapshot(db)
+    assert rollups == expected_rollups
+    assert len(daily) == len(expected_daily)
+    for got, expected in zip(daily, expected_daily):
+        # Las sumas pueden diferir en el último decimal por el orden de las restas
+        assert got == pytest.approx(expected)
+
+
+def test_new_readings_match_rebuild(db):
+    for n in range(24 * 5):
+        ingest('norte', hour(n), pm2_5=12 + n % 8, pm10=40 + n % 10, no2=20 + n % 9)
+    assert_matches_rebuild(db)
+
+
+def test_updated_readings_match_rebuild(db):
+    for n in range(24 * 3):
+        ingest('norte', hour(n), pm2_5=14, pm10=None, no2=24)
+    # Corregir valores lleva el primer día sobre la guía; el PM10 llega después
+    for n in range(6):
+        ingest('norte', hour(n), pm2_5=30)
+    for n in range(24, 48):
+        ingest('norte', hour(n), pm10=60)
+    ingest('norte', hour(50), no2=25)
+    assert_matches_rebuild(db)
+
+
+def test_random_ingest_and_reingest_match_rebuild(db):
+    rng = random.Random(7)
+    hours = list(range(24 * 20))
+    for n in hours:
+        if rng.random() < 0.9:
+            ingest(rng.choice(['norte', 'sur']), hour(n), pm2_5=rng.uniform(5, 30),
+                   pm10=rng.uniform(20, 70), no2=rng.choice([None, rng.uniform(10, 40)]))
+    for n in rng.sample(hours, 200):
+        ingest(rng.choice(['norte', 'sur']), hour(n), pm2_5=rng.choice([None, rng.uniform(5, 30)]),
+               pm10=rng.choice([None, rng.uniform(20, 70)]), no2=rng.choice([None, rng.uniform(10, 40)]))
+    assert_matches_rebuild(db)
+
+
+def test_counts_for_a_range_sum_days_months_and_years(db):
+    for n in range(24 * 70):
+        ingest('norte', hour(n), pm2_5=10 + (n // 24) % 10, pm10=30, no2=20)
+    counts = get_exceedance_counts(date(2025, 3, 1), date(2025, 5, 9))['norte']['pm2_5']
+    with sqlite3.connect(db) as conn:
+        expected = conn.execute('''
+        SELECT SUM(pm2_5_exceeds), SUM(pm2_5_count >= 18) FROM daily_exceedances
+        WHERE day BETWEEN '2025-03-01' AND '2025-05-09'
+        ''').fetchone()
+    assert (counts['exceedance_days'], counts['complete_days']) == expected
+    assert split_range(date(2025, 3, 1), date(2025, 5, 9))[1] == ['2025-03', '2025-04']
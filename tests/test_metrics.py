@@ -0,0 +1,36 @@
+# test_metrics.py - Traducción de marcadores '?' para cursores de psycopg2
+from metrics import TimedCursor, to_pyformat
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+
+class PsycopgCursor(RecordingCursor):
+    pass
+
+
+PsycopgCursor.__module__ = 'psycopg2.extensions'
+
+
+def test_to_pyformat_skips_literals_and_escapes_percent():
+    sql = "SELECT strftime('%Y', ts) FROM t WHERE a = ? AND b LIKE 'x?%' AND c % 2 = ?"
+    assert to_pyformat(sql) == (
+        "SELECT strftime('%%Y', ts) FROM t WHERE a = %s AND b LIKE 'x?%%' AND c %% 2 = %s")
+
+
+def test_psycopg_cursor_gets_translated_sql():
+    raw = PsycopgCursor()
+    TimedCursor(raw).execute("SELECT * FROM t WHERE a = ?", ('x',))
+    TimedCursor(raw).execute("SELECT '%' FROM t")
+    assert raw.executed == [("SELECT * FROM t WHERE a = %s", ('x',)), ("SELECT '%' FROM t", None)]
+
+
+def test_sqlite_cursor_keeps_question_marks():
+    raw = RecordingCursor()
+    TimedCursor(raw).execute("SELECT * FROM t WHERE a = ?", ('x',))
+    assert raw.executed == [("SELECT * FROM t WHERE a = ?", ('x',))]
@@ -0,0 +1,32 @@
+# test_profiling.py - El .collapsed tiene pilas completas (raíz;...;hoja), no pares sueltos
+import time
+
+from profiling import profile_block
+
+
+def busy_leaf():
+    deadline = time.perf_counter() + 0.2
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def busy_middle():
+    busy_leaf()
+
+
+def busy_top():
+    busy_middle()
+
+
+def test_collapsed_has_full_stacks(tmp_path):
+    with profile_block('prueba', directory=str(tmp_path)) as result:
+        busy_top()
+
+    collapsed = next(f for f in result['files'] if f.endswith('.collapsed'))
+    with open(collapsed, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    frames = [line.rsplit(' ', 1)[0].split(';') for line in lines]
+    names = [[frame.rsplit(':', 1)[1] for frame in stack] for stack in frames]
+    assert any(stack[-3:] == ['busy_top', 'busy_middle', 'busy_leaf'] for stack in names)
+    assert any('test_collapsed_has_full_stacks' in stack for stack in names)
@@ -0,0 +1,44 @@
+# test_recent_cache.py - El refresco sigue la revisión de location_stats (otro proceso escribe)
+from recent_cache import RecentReadingsCache
+from conftest import hour, ingest
+
+
+def loaded_cache():
+    cache = RecentReadingsCache(hours=24 * 365)
+    cache.preload()
+    return cache
+
+
+def test_new_readings_are_appended_in_place(db):
+    ingest('norte', hour(0), pm2_5=10, aqi=1)
+    cache = loaded_cache()
+    ring = cache._rings['norte']
+
+    ingest('norte', hour(1), pm2_5=11, aqi=1)
+    ingest('norte', hour(2), pm2_5=12, aqi=2)
+    assert cache.refresh() == 1
+    assert cache._rings['norte'] is ring
+    assert cache.latest('norte')['pm2_5'] == 12
+    assert cache.refresh() == 0
+
+
+def test_correction_of_latest_reading_is_picked_up(db):
+    ingest('norte', hour(0), pm2_5=10, aqi=1)
+    ingest('norte', hour(1), pm2_5=11, aqi=1)
+    cache = loaded_cache()
+
+    # Mismo timestamp y mismo data_count: antes el refresco no lo veía
+    ingest('norte', hour(1), pm2_5=99)
+    assert cache.refresh() == 1
+    assert cache.latest('norte')['pm2_5'] == 99
+
+
+def test_older_reading_reloads_the_ring(db):
+    ingest('norte', hour(0), pm2_5=10, aqi=1)
+    ingest('norte', hour(5), pm2_5=15, aqi=1)
+    cache = loaded_cache()
+
+    ingest('norte', hour(3), pm2_5=13, aqi=1)
+    cache.refresh()
+    ring = cache._rings['norte']
+    assert [ring.timestamps[i] for i in ring.indices_since(0)] == [hour(0), hour(3), hour(5)]
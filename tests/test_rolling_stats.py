@@ -0,0 +1,49 @@
+# test_rolling_stats.py - La ventana móvil incremental debe coincidir con rebuild_rolling_stats
+import pytest
+
+from database_setup import get_rolling_stats, rebuild_rolling_stats, ROLLING_STATS_COLUMNS
+from rolling_stats import RollingWindow
+from conftest import hour, ingest
+
+
+def assert_matches_rebuild():
+    incremental = get_rolling_stats()
+    rebuild_rolling_stats()
+    rebuilt = get_rolling_stats()
+    assert len(incremental) == len(rebuilt)
+    for got, expected in zip(incremental, rebuilt):
+        for column in ('location_id',) + ROLLING_STATS_COLUMNS:
+            if isinstance(expected[column], float):
+                assert got[column] == pytest.approx(expected[column], abs=1e-6), column
+            else:
+                assert got[column] == expected[column], column
+
+
+def test_new_readings_match_rebuild(db):
+    for n in range(200):
+        ingest('norte', hour(n), pm2_5=10 + n % 7, pm10=20 + n % 5, aqi=1 + n % 5)
+    assert_matches_rebuild()
+
+
+def test_updated_readings_match_rebuild(db):
+    for n in range(40):
+        ingest('norte', hour(n), pm2_5=10 + n % 7, pm10=None, aqi=1 + n % 3)
+    # Correcciones y valores que llegan después para lecturas ya guardadas
+    ingest('norte', hour(39), pm2_5=18.5, aqi=4)
+    ingest('norte', hour(38), pm10=31.0)
+    ingest('norte', hour(30), pm2_5=9.25, pm10=22.0, aqi=2)
+    ingest('norte', hour(5), pm2_5=40.0)  # fuera de la ventana de 24 h, dentro de la de 7 días
+    ingest('norte', hour(39))  # sin valores: no cambia nada
+    assert_matches_rebuild()
+
+
+def test_remove_undoes_add():
+    window = RollingWindow()
+    for n in range(30):
+        window.add(hour(n), 10 + n, 20 + n, 1 + n % 5)
+    expected = window.summary()
+    window.add(hour(29), 99, None, 5)
+    window.remove(hour(29), 99, None, 5)
+    got = window.summary()
+    for key, value in expected.items():
+        assert got[key] == pytest.approx(value), key
@@ -0,0 +1,110 @@
+# test_schema.py - Una base creada con el esquema original se completa al arrancar
+import sqlite3
+
+import pytest
+
+import database_setup
+from database_setup import ensure_schema, get_data_version, get_location_stats, get_rolling_stats
+from conftest import hour, ingest
+
+# Esquema de data/air_quality.db antes de los agregados de ingesta
+BASELINE_SCHEMA = '''
+CREATE TABLE air_quality_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    location_id TEXT NOT NULL,
+    location_name TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    timestamp DATETIME NOT NULL,
+    pm2_5 REAL,
+    pm10 REAL,
+    o3 REAL,
+    no2 REAL,
+    aqi INTEGER,
+    temperature REAL,
+    humidity REAL,
+    pressure REAL,
+    wind_speed REAL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(location_id, timestamp)
+);
+CREATE INDEX idx_location_timestamp ON air_quality_data(location_id, timestamp);
+CREATE INDEX idx_timestamp ON air_quality_data(timestamp);
+'''
+
+
+@pytest.fixture
+def baseline_db(tmp_path, monkeypatch):
+    path = tmp_path / 'air_quality.db'
+    with sqlite3.connect(path) as conn:
+        conn.executescript(BASELINE_SCHEMA)
+        conn.executemany('''
+        INSERT INTO air_quality_data (location_id, location_name, latitude, longitude,
+                                      timestamp, pm2_5, pm10, aqi)
+        VALUES ('norte', 'Norte', 7.3, -73.6, ?, ?, ?, 2)
+        ''', [(hour(n), 10 + n, 30 + n) for n in range(6)])
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{path}")
+    monkeypatch.setattr(database_setup, '_schema_ready', set())
+    return path
+
+
+def test_ingest_without_schema_step_fails(baseline_db):
+    # Lo que ocurría antes: la ingesta falla en silencio y las consultas revientan
+    assert not database_setup.insert_air_quality_data(
+        'norte', 'Norte', 7.3, -73.6, hour(6), 16, 36, None, None, 2)
+    with pytest.raises(sqlite3.OperationalError):
+        get_location_stats()
+
+
+def test_ensure_schema_upgrades_baseline_db(baseline_db):
+    ensure_schema()
+    stats = {s['location_id']: s for s in get_location_stats()}
+    assert stats['norte']['data_count'] == 6
+    assert stats['norte']['last_timestamp'] == hour(5)
+
+    ingest('norte', hour(6), pm2_5=16, pm10=36, aqi=2)
+    ingest('sur', hour(6), pm2_5=8, pm10=20, aqi=1)
+
+    stats = {s['location_id']: s for s in get_location_stats()}
+    assert stats['norte']['data_count'] == 7
+    assert stats['norte']['last_timestamp'] == hour(6)
+    assert stats['sur']['data_count'] == 1
+    assert {r['location_id'] for r in get_rolling_stats()} == {'norte', 'sur'}
+
+
+def test_ensure_schema_is_idempotent(baseline_db):
+    ensure_schema()
+    ingest('norte', hour(6), pm2_5=16, pm10=36, aqi=2)
+    # Una segunda pasada (otro proceso) no altera los agregados ya mantenidos
+    database_setup._schema_ready.clear()
+    ensure_schema()
+    stats = {s['location_id']: s for s in get_location_stats()}
+    assert stats['norte']['data_count'] == 7
+
+
+def test_revision_column_added_to_existing_location_stats(baseline_db):
+    with sqlite3.connect(baseline_db) as conn:
+        conn.execute('''
+        CREATE TABLE location_stats (
+            location_id TEXT PRIMARY KEY, location_name TEXT NOT NULL, latitude REAL,
+            longitude REAL, data_count INTEGER NOT NULL DEFAULT 0, first_timestamp DATETIME,
+            last_timestamp DATETIME, last_collection_at DATETIME,
+            last_collection_success INTEGER, last_collection_error TEXT)
+        ''')
+    ensure_schema()
+    ingest('norte', hour(6), pm2_5=16)
+    assert get_location_stats()[0]['revision'] >= 1
+
+
+def test_data_version_changes_on_corrections(db):
+    ingest('norte', hour(0), pm2_5=10, pm10=30)
+    ingest('norte', hour(1), pm2_5=12, pm10=31)
+    before = get_data_version('norte')
+    others = get_data_version('sur')
+
+    # Misma cantidad de filas y mismo último timestamp, valores distintos
+    ingest('norte', hour(0), pm2_5=55)
+    assert get_data_version('norte') != before
+    assert get_data_version() != before
+    assert get_data_version('sur') == others
@@ -0,0 +1,81 @@
+# test_stream_server.py - Muchos clientes SSE en un solo hilo, todos reciben cada lectura
+import asyncio
+import json
+import threading
+
+from event_stream import ReadingBroadcaster
+from stream_server import StreamServer
+from conftest import hour
+
+CLIENTS = 200
+
+
+async def open_stream(port):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(b"GET /api/stream HTTP/1.1\r\nHost: localhost\r\nAccept: text/event-stream\r\n\r\n")
+    await writer.drain()
+    status = await reader.readline()
+    # Encabezados y 'retry'
+    while (await reader.readline()) != b'\r\n':
+        pass
+    await reader.readuntil(b'\n\n')
+    return status, reader, writer
+
+
+async def next_event(reader):
+    while True:
+        block = (await reader.readuntil(b'\n\n')).decode()
+        if block.startswith('event: reading'):
+            return json.loads(block.split('data: ', 1)[1])
+
+
+def test_many_clients_share_one_thread(db):
+    broadcaster = ReadingBroadcaster(poll_seconds=3600)
+
+    async def scenario():
+        server = StreamServer(broadcaster, heartbeat=60)
+        tcp = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp.sockets[0].getsockname()[1]
+        threads_before = threading.active_count()
+
+        clients = [await open_stream(port) for _ in range(CLIENTS)]
+        assert all(status.startswith(b'HTTP/1.1 200') for status, _, _ in clients)
+        assert broadcaster.subscriber_count() == CLIENTS
+        # Solo el hilo que consulta location_stats, no uno por cliente
+        assert threading.active_count() <= threads_before + 1
+
+        broadcaster.publish({'location_id': 'norte', 'timestamp': hour(1)})
+        events = await asyncio.wait_for(
+            asyncio.gather(*(next_event(reader) for _, reader, _ in clients)), 10)
+        assert {e['timestamp'] for e in events} == {hour(1)}
+
+        for _, _, writer in clients:
+            writer.close()
+        tcp.close()
+        await server.close_all()
+        await tcp.wait_closed()
+        assert broadcaster.subscriber_count() == 0
+
+    asyncio.run(scenario())
+
+
+def test_subscriber_limit_answers_503(db):
+    broadcaster = ReadingBroadcaster(poll_seconds=3600, max_subscribers=1)
+
+    async def scenario():
+        server = StreamServer(broadcaster, heartbeat=60)
+        tcp = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = tcp.sockets[0].getsockname()[1]
+
+        first = await open_stream(port)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(b"GET /api/stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        assert (await reader.readline()).startswith(b'HTTP/1.1 503')
+
+        for w in (first[2], writer):
+            w.close()
+        tcp.close()
+        await server.close_all()
+        await tcp.wait_closed()
+
+    asyncio.run(scenario())